@@ -1,27 +1,87 @@
 from flask import Flask
 from flask_cors import CORS
 from flask_socketio import SocketIO
-from .mongo import get_mongo_client, close_mongo_client
+import atexit
+from .mongo import init_mongo, shutdown_mongo
+from .indexes import bootstrap_indexes, indexes_cli
+from .user_search import init_user_search, users_cli
+from .message_ingest import init_message_ingest
+from .read_receipts import init_read_receipts, receipts_cli
+from .room_activity import init_room_activity
 from .redis import get_redis, close_redis_client, init_redis
+from .redis_pubsub import start_publisher, start_subscriber
 from .socket_events import register_socket_events
+from .fanout import init_fanout
+from .presence import init_presence
+from .membership import init_membership
+from .unread import init_unread, unread_cli
+from .message_search import messages_cli
+from .typing_state import init_typing
+from .socket_batcher import init_socket_batcher
+from .rate_limit import init_rate_limiter
+from .helpers.auth.config import settings
+from .helpers.auth.cache import init_auth_cache
+from .helpers.serialization import BsonJSONProvider
+from .metrics import init_http_metrics
 
-def init_services(app):
+def init_services(app, socketio):
     """Khởi tạo các services cần thiết"""
+    # Khởi tạo MongoClient dùng chung (connection pool sống suốt process)
+    init_mongo()
+    atexit.register(shutdown_mongo)
+    # Tạo index ở background để không chặn quá trình start server
+    socketio.start_background_task(bootstrap_indexes)
+
     # Khởi tạo Redis connection
     init_redis()
     redis_client = get_redis()
     if not redis_client:
         app.logger.error("Failed to initialize Redis")
+    # Publisher gửi theo batch ở background, tự reconnect khi Redis lỗi
+    start_publisher(socketio)
+
+    # Pipeline ghi tin nhắn theo batch, flush nốt buffer khi shutdown
+    ingestor = init_message_ingest(socketio)
+    atexit.register(ingestor.stop)
+    # Người gửi được tính là đã đọc tin nhắn của mình (cập nhật watermark theo batch)
+    init_read_receipts(ingestor)
+    # Tin nhắn cuối cùng được denormalize vào room để sắp xếp theo hoạt động
+    init_room_activity(ingestor)
+
+    # Index thành viên room, dùng để giới hạn fan-out presence cho các liên hệ
+    init_membership()
+
+    # Presence toàn cluster: heartbeat session của node và dọn session của node chết
+    presence = init_presence(socketio)
+    # Bộ đếm chưa đọc trong Redis, tăng theo ingest và đối chiếu định kỳ với MongoDB
+    init_unread(socketio, ingestor, presence)
+    # Trạng thái đang gõ trong bộ nhớ, gom thay đổi và phát theo tick
+    init_typing(socketio)
+
+    # Index tìm kiếm user trong bộ nhớ (tùy chọn)
+    init_user_search(socketio)
+
+    # Cache xác thực, nhận sự kiện thu hồi token/thay đổi user từ các node khác
+    init_auth_cache()
+
+    # Gom sự kiện gửi ra socket theo room trong một cửa sổ ngắn
+    init_socket_batcher(socketio)
+    # Giới hạn tốc độ sự kiện socket theo sid/user, dọn bucket không hoạt động định kỳ
+    init_rate_limiter(socketio)
+
+    # Subscriber Redis dùng chung, chạy sau khi các handler đã được đăng ký
+    start_subscriber(socketio)
 
 def create_app():
     app = Flask(__name__)
+    # Encode ObjectId/datetime trực tiếp khi jsonify (orjson nếu có), không cần mongo_to_json
+    app.json = BsonJSONProvider(app)
     secret_key = app.config.get('SECRET_KEY', None)
     app.config['SECRET_KEY'] = secret_key
 
     socketio = SocketIO(
         app,
         cors_allowed_origins=["http://localhost:5173"],
-        message_queue='redis://127.0.0.1:6379',
         async_mode='eventlet',
         logger=True,
     )
@@ -33,19 +93,34 @@ def create_app():
         allow_headers=["Content-Type", "Authorization"],
     )
 
+    # Fan-out sự kiện realtime với đúng một hop Redis
+    init_fanout(socketio)
+
     # Đăng ký các event handler cho socketio
     register_socket_events(socketio)
 
-    from app.api import room_bp, auth_bp, message_bp
+    from app.api import room_bp, auth_bp, message_bp, presence_bp, export_bp, metrics_bp
     app.register_blueprint(room_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(message_bp)
+    app.register_blueprint(presence_bp)
+    app.register_blueprint(export_bp)
+    # METRICS_ENABLED=0: không ghi nhận metric nào nên cũng không mở /metrics
+    if settings.METRICS_ENABLED:
+        app.register_blueprint(metrics_bp)
+
+    # Histogram thời gian xử lý cho mọi route, xem tại GET /metrics
+    init_http_metrics(app)
 
     # Khởi tạo services khi start app
-    init_services(app)
+    init_services(app, socketio)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(receipts_cli)
+    app.cli.add_command(unread_cli)
+    app.cli.add_command(messages_cli)
 
-    # Cleanup khi shutdown
-    app.teardown_appcontext(close_mongo_client)
-    app.teardown_appcontext(lambda x: close_redis_client())
+    # Cleanup khi shutdown (không đóng Redis sau mỗi request vì subscriber dùng chung pool)
+    atexit.register(close_redis_client)
 
     return socketio, app
@@ -2,3 +2,6 @@ from flask import Blueprint
 from .room import room_bp
 from .user import auth_bp
 from .message import message_bp
+from .presence import presence_bp
+from .export import export_bp
+from .metrics import metrics_bp
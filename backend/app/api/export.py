@@ -0,0 +1,91 @@
+import zlib
+from flask import Blueprint, Response, request, jsonify
+from bson import ObjectId
+
+from ..mongo import get_mongo_client
+from ..helpers.auth.config import settings
+from ..helpers.pagination import InvalidCursorError, keyset_filter, cursor_of
+from ..helpers.serialization import dumps_bytes
+
+export_bp = Blueprint("export_api", __name__, url_prefix="/api/room")
+
+# Gom nhiều dòng NDJSON trước khi gửi (và trước khi nén) để giảm số lần ghi socket
+FLUSH_BYTES = 64 * 1024
+
+
+def iter_export_lines(room_id: str, after_cursor: str = None):
+    """Đọc messages theo thứ tự (createdAt, _id) tăng dần, mỗi tin nhắn một dòng JSON.
+
+    Mỗi dòng kèm trường `cursor` để client tiếp tục (?after=<cursor>) nếu mất kết nối.
+    Cursor MongoDB đọc theo batch nên bộ nhớ không phụ thuộc số tin nhắn của room.
+    """
+    db = get_mongo_client().Chatapp
+    query = {"roomId": ObjectId(room_id)}
+    if after_cursor:
+        query.update(keyset_filter(after_cursor, 1))
+
+    cursor = (
+        db.messages.find(query, {"readBy": 0, "searchTerms": 0})
+        .sort([("createdAt", 1), ("_id", 1)])
+        .batch_size(settings.EXPORT_BATCH_SIZE)
+    )
+    try:
+        for message in cursor:
+            message["cursor"] = cursor_of(message)
+            yield dumps_bytes(message) + b"\n"
+    finally:
+        cursor.close()
+
+
+def buffered(lines):
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31: định dạng gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# GET /api/room/<room_id>/export - Stream toàn bộ lịch sử room dạng NDJSON
+@export_bp.route("/<room_id>/export", methods=["GET"])
+def export_room_history(room_id):
+    db = get_mongo_client().Chatapp
+    after_cursor = request.args.get("after")
+    use_gzip = request.args.get("gzip", "0").lower() in ("1", "true", "yes")
+
+    if not ObjectId.is_valid(room_id) or not db.rooms.find_one({"_id": ObjectId(room_id)}, {"_id": 1}):
+        return jsonify({"error": "Group không tồn tại", "errorCode": "GROUP_NOT_FOUND"}), 404
+    try:
+        if after_cursor:
+            keyset_filter(after_cursor, 1)
+    except InvalidCursorError:
+        return jsonify({"error": "Cursor không hợp lệ", "errorCode": "INVALID_CURSOR"}), 400
+
+    body = buffered(iter_export_lines(room_id, after_cursor))
+    filename = f"room-{room_id}.ndjson"
+    if use_gzip:
+        body = gzipped(body)
+        filename += ".gz"
+
+    return Response(
+        body,
+        mimetype="application/gzip" if use_gzip else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
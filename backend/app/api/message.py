@@ -1,14 +1,19 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from ..mongo import get_mongo_client
 from bson import ObjectId
-from ..helpers import convert_id, mongo_to_json
+from ..helpers import convert_id
+from ..message_ingest import ingest_message, public_message, IngestBackpressureError, IngestPendingError
+from .. import message_search
+from ..helpers.pagination import InvalidCursorError
+from .. import read_receipts
+from ..unread import refresh_room
+from ..fanout import broadcast
+from ..constants import REDIS_CHANNELS
 
 message_bp = Blueprint("message_api", __name__, url_prefix="/api/message")
 
 @message_bp.route("/", methods=["POST"])
 def send_message():
-    db = get_mongo_client().Chatapp
     data = request.json
     room_id = data.get("roomId")
     sender_id = data.get("senderId")
@@ -16,47 +21,82 @@ def send_message():
 
     if not room_id or not sender_id or not content:
         return jsonify({"error": "Thiếu groupId, senderId hoặc content", "errorCode": "MISSING_REQUIRED_FIELDS"}), 400
+    # Kiểm tra trước khi vào ingest pipeline, nếu không ObjectId() ném InvalidId và trả về 500
+    if not ObjectId.is_valid(room_id) or not ObjectId.is_valid(sender_id):
+        return jsonify({"error": "roomId hoặc senderId không hợp lệ", "errorCode": "INVALID_ID"}), 400
 
-    new_message = {
-        "roomId": ObjectId(room_id),
-        "senderId": ObjectId(sender_id),
-        "content": content,
-        "readBy": [sender_id],
-        "createdAt": datetime.now().timestamp()
-    }
+    try:
+        new_message = ingest_message(room_id, sender_id, content)
+    except IngestBackpressureError:
+        return jsonify({"error": "Server đang quá tải, vui lòng thử lại", "errorCode": "INGEST_BUSY"}), 503
+    except IngestPendingError as e:
+        # Chưa có ack nhưng tin nhắn có thể vẫn được lưu: trả _id để client không gửi lại
+        return jsonify({**convert_id(public_message(e.message)), "status": "pending"}), 202
+    except Exception as e:
+        print(f"ERROR: Failed to persist message: {e}")
+        return jsonify({"error": "Không thể lưu tin nhắn", "errorCode": "MESSAGE_PERSIST_FAILED"}), 500
 
-    result = db.messages.insert_one(new_message)
-    new_message["_id"] = str(result.inserted_id)
+    # new_message được publish lên Redis bởi ingest pipeline sau khi đã lưu
+    return jsonify(convert_id(public_message(new_message))), 201
 
-    # TODO: Publish event 'new_message' to Redis Pub/Sub for real-time push
-    # You will add this part when integrating with Websocket and Redis
-
-    return jsonify(mongo_to_json(convert_id(new_message))), 201
-
-# POST /api/message/<message_id>/read - Mark message as read
+# POST /api/message/<message_id>/read - Mark message (and everything before it) as read
 @message_bp.route("/<message_id>/read", methods=["POST"])
 def mark_message_read(message_id):
-    db = get_mongo_client().Chatapp
     user_id = request.json.get("userId") # Expect userId in request body
     if not user_id:
         return jsonify({"error": "Thiếu userId", "errorCode": "MISSING_USER_ID"}), 400
 
-    message = db.messages.find_one({"_id": ObjectId(message_id)})
+    # Một lần ghi watermark cho cả room, thay vì $addToSet vào readBy của từng tin nhắn
+    message, advanced = read_receipts.mark_message_read(None, user_id, message_id)
     if not message:
         return jsonify({"error": "Tin nhắn không tồn tại", "errorCode": "MESSAGE_NOT_FOUND"}), 404
 
-    if user_id in message.get("readBy", []): # Check if already marked as read by this user
-        return jsonify({"message": "Tin nhắn đã được đánh dấu là đã đọc bởi người dùng này", "errorCode": "ALREADY_MARKED_READ"}), 200 # Or 204 No Content if you prefer no body
+    if not advanced:
+        return jsonify({"message": "Tin nhắn đã được đánh dấu là đã đọc bởi người dùng này", "errorCode": "ALREADY_MARKED_READ"}), 200
+
+    room_id = str(message["roomId"])
+    refresh_room(room_id, user_id)
+    broadcast(REDIS_CHANNELS['MESSAGE_EVENTS'], 'message_read', {
+        'messageId': message_id,
+        'userId': user_id,
+        'roomId': room_id,
+        'timestamp': datetime.now().isoformat()
+    })
 
-    result = db.messages.update_one(
-        {"_id": ObjectId(message_id)},
-        {"$addToSet": {"readBy": ObjectId(user_id)}} # Use $addToSet to avoid duplicates
-    )
+    return jsonify({"message": "Đã đánh dấu tin nhắn là đã đọc"})
+
+# GET /api/message/search - Search message content in the caller's rooms
+# Chỉ MESSAGE_SEARCH_MAX_CANDIDATES tin khớp mới nhất được xếp hạng; `truncated: true`
+# nghĩa là còn tin cũ hơn khớp nhưng không được tìm tới (thu hẹp bằng roomId hoặc thêm từ khóa)
+@message_bp.route("/search", methods=["GET"])
+def search_messages():
+    user_id = request.args.get("userId")
+    query = request.args.get("q", "")
+    room_id = request.args.get("roomId")
+    if not user_id or not ObjectId.is_valid(user_id):
+        return jsonify({"error": "Thiếu userId", "errorCode": "MISSING_USER_ID"}), 400
+    if len(query.strip()) < 2:
+        return jsonify({"error": "Từ khóa phải có ít nhất 2 ký tự", "errorCode": "QUERY_TOO_SHORT"}), 400
 
-    if result.modified_count == 0: # Check if update actually happened (should happen unless already read - handled above)
-        return jsonify({"message": "Không thể đánh dấu tin nhắn là đã đọc", "errorCode": "MARK_READ_FAILED"}), 500 # Or different error code if you can pinpoint why
+    room_ids = message_search.user_room_ids(user_id)
+    if room_id:
+        if not ObjectId.is_valid(room_id) or ObjectId(room_id) not in room_ids:
+            return jsonify({"error": "Bạn không phải thành viên của room này", "errorCode": "NOT_A_MEMBER"}), 403
+        room_ids = [ObjectId(room_id)]
 
-    # **TODO: Publish event 'message_read' to Redis Pub/Sub for real-time update**
-    # You will add this part when integrating with Websocket and Redis
+    try:
+        messages, next_cursor, truncated = message_search.search_messages(
+            user_id,
+            query,
+            room_ids,
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", type=int),
+        )
+    except InvalidCursorError:
+        return jsonify({"error": "Cursor không hợp lệ", "errorCode": "INVALID_CURSOR"}), 400
 
-    return jsonify({"message": "Đã đánh dấu tin nhắn là đã đọc"}) # Or return updated message if you want more data
+    return jsonify({
+        "messages": messages,
+        "nextCursor": next_cursor,
+        "truncated": truncated,
+    })
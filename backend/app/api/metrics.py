@@ -0,0 +1,38 @@
+from flask import Blueprint, Response, request, jsonify
+
+from ..helpers.auth.cache import get_auth_cache_stats
+from ..helpers.auth.config import settings
+from ..helpers.auth.hashing import get_password_hasher_stats
+from ..membership import get_membership_stats
+from ..message_ingest import get_message_ingestor
+from ..metrics import register_stats, render_metrics
+from ..mongo import get_mongo_pool_stats
+from ..rate_limit import get_rate_limit_stats
+from ..redis_pubsub import get_publisher_stats, get_subscriber_stats
+from ..socket_batcher import get_socket_batcher
+from ..typing_state import get_typing_engine
+
+metrics_bp = Blueprint("metrics_api", __name__)
+
+# Các thống kê sẵn có của từng thành phần, xuất thành chatapp_<nguồn>_<khóa>: counter
+# (_total) cho bộ đếm, gauge cho các khóa là mức hiện tại được liệt kê ở đây
+register_stats("mongo_pool", get_mongo_pool_stats, gauges=("open_connections", "in_use", "max_in_use", "max_pool_size"))
+register_stats("publisher", get_publisher_stats, gauges=("queue_depth",))
+register_stats("subscriber", get_subscriber_stats, gauges=("last_lag_ms", "max_lag_ms", "avg_lag_ms", "queue_depth"))
+register_stats("auth_cache", get_auth_cache_stats, gauges=("size",))
+register_stats("password_hasher", get_password_hasher_stats, gauges=(
+    "waiting", "concurrency", "queued_seconds_max", "queued_seconds_avg", "hash_seconds_max", "hash_seconds_avg",
+))
+register_stats("membership", get_membership_stats, gauges=("size",))
+register_stats("rate_limit", get_rate_limit_stats, gauges=("buckets", "inflight"))
+register_stats("socket_batcher", lambda: get_socket_batcher().get_stats(), gauges=("events_per_frame",))
+register_stats("ingest", lambda: dict(get_message_ingestor().stats))
+register_stats("typing", lambda: dict(get_typing_engine().stats))
+
+
+# GET /metrics - Metrics của node theo định dạng text của Prometheus
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    if settings.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized", "errorCode": "UNAUTHORIZED"}), 401
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
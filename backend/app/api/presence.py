@@ -0,0 +1,19 @@
+from flask import Blueprint, request, jsonify
+
+from ..presence import get_presence
+
+presence_bp = Blueprint("presence_api", __name__, url_prefix="/api/presence")
+
+MAX_QUERY_USERS = 500
+
+# POST /api/presence/query - Trạng thái online của nhiều user trong một request
+@presence_bp.route("/query", methods=["POST"])
+def query_presence():
+    data = request.json or {}
+    user_ids = data.get("userIds")
+    if not isinstance(user_ids, list):
+        return jsonify({"error": "Thiếu userIds", "errorCode": "MISSING_USER_IDS"}), 400
+    if len(user_ids) > MAX_QUERY_USERS:
+        return jsonify({"error": f"Tối đa {MAX_QUERY_USERS} user mỗi lần", "errorCode": "TOO_MANY_USERS"}), 400
+
+    return jsonify({"online": get_presence().online_status(user_ids)})
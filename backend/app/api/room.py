@@ -1,15 +1,37 @@
-import re
 from flask import Blueprint, g, request, jsonify
 from datetime import datetime
+import time
 
 from ..helpers.auth.decorators import token_required
 from ..models.user import UserInDB, UserPublic
 from ..mongo import get_mongo_client
 from bson import ObjectId
-from ..helpers import convert_id, mongo_to_json
+from ..helpers import convert_id
+from ..helpers.pagination import InvalidCursorError, keyset_filter, cursor_of
+from .. import user_search
+from ..presence import get_presence
+from ..read_receipts import attach_read_state, mark_room_read
+from ..unread import get_unread_counts, refresh_room
+from ..fanout import broadcast
+from ..membership import publish_membership_change
+from ..constants import REDIS_CHANNELS
 
 room_bp = Blueprint("room_api", __name__, url_prefix="/api/room")
 
+MAX_PAGE_SIZE = 100
+
+# Các trường của user trả về cho client (không trả hashed_password, không trả các trường
+# phục vụ tìm kiếm như searchTokens/searchName)
+MEMBER_PROJECTION = {"hashed_password": 0, "searchTokens": 0, "searchName": 0}
+
+def fetch_members_by_id(db, member_ids):
+    """Lấy thông tin nhiều user bằng một query duy nhất, trả về dict {id: user}."""
+    unique_ids = list(set(member_ids))
+    if not unique_ids:
+        return {}
+    members = db.users.find({"_id": {"$in": unique_ids}}, MEMBER_PROJECTION)
+    return {str(member["_id"]): member for member in members}
+
 # GET /api/room - Get user's groups
 @room_bp.route("/", methods=["GET"])
 def get_user_room():
@@ -18,51 +40,105 @@ def get_user_room():
     if not user_id:
         return jsonify({"error": "Thiếu userId"}), 400
 
-    room_list = list(db.rooms.find({"members": {"$in": [ObjectId(user_id)]}}))
+    # Room có hoạt động gần nhất lên đầu (index rooms_members_activity)
+    room_list = list(
+        db.rooms.find({"members": ObjectId(user_id)})
+        .sort([("lastMessageAt", -1), ("_id", -1)])
+    )
 
+    # Gom member của tất cả các room rồi lấy trong 1 query (tránh N+1)
+    users = fetch_members_by_id(db, [member_id for room in room_list for member_id in room.get("members", [])])
+
+    # Bộ đếm chưa đọc lấy từ Redis (O(số room)), không quét messages
+    unread = get_unread_counts(user_id)
+
+    rooms = []
     for room in room_list:
-        members_ids = room.get("members")
-        members = list(db.users.find({"_id": {"$in": members_ids}}))
         room = convert_id(room)
-        room["members"] = mongo_to_json([convert_id(member) for member in members])
+        room["members"] = [str(member_id) for member_id in room.get("members", [])]
+        room["unreadCount"] = unread.get(room["_id"], 0)
+        rooms.append(room)
 
+    # Trạng thái online lấy từ presence toàn cluster (Redis), không đọc users.status
+    online = get_presence().online_status(list(users))
+    for member_id, member in users.items():
+        member["status"] = "online" if online.get(member_id) else "offline"
 
-    return jsonify(mongo_to_json([convert_id(room) for room in room_list]))
+    return jsonify({
+        "rooms": rooms,
+        "users": users,
+    })
 
 # GET /api/room/<room_id> - Get group details and messages
 @room_bp.route("/<room_id>", methods=["GET"])
 def get_room_detail(room_id):
     db = get_mongo_client().Chatapp
-    limit = int(request.args.get("limit", 20))
-    before_timestamp_str = request.args.get("before")
+    limit = min(max(request.args.get("limit", 20, type=int), 1), MAX_PAGE_SIZE)
+    before_cursor = request.args.get("before")
+    after_cursor = request.args.get("after")
 
     room = db.rooms.find_one({"_id": ObjectId(room_id)})
     if not room:
         return jsonify({"error": "Group không tồn tại", "errorCode": "GROUP_NOT_FOUND"}), 404
 
-    members_ids = room.get("members")
-    members = list(db.users.find({"_id": {"$in": members_ids}}))
+    members = fetch_members_by_id(db, room.get("members", []))
     room = convert_id(room)
-    room["members"] = mongo_to_json([convert_id(member) for member in members])
+    room["members"] = list(members.values())
 
+    # Keyset pagination trên (createdAt, _id): mỗi trang chỉ đọc đúng `limit` bản ghi từ index
     query = {"roomId": ObjectId(room_id)}
-    if before_timestamp_str:
-        before_timestamp = datetime.fromisoformat(before_timestamp_str.replace('Z', '+00:00'))
-        query["createdAt"] = {"$lt": before_timestamp}
+    direction = 1 if after_cursor else -1
+    try:
+        if after_cursor or before_cursor:
+            query.update(keyset_filter(after_cursor or before_cursor, direction))
+    except InvalidCursorError:
+        return jsonify({"error": "Cursor không hợp lệ", "errorCode": "INVALID_CURSOR"}), 400
 
     messages = list(
-        db.messages.find(query)
-        .sort("createdAt", -1)
-        .limit(limit)
+        db.messages.find(query, {"searchTerms": 0})
+        .sort([("createdAt", direction), ("_id", direction)])
+        .limit(limit + 1)
     )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if direction < 0:
+        messages.reverse()
 
+    # nextCursor: trang cũ hơn, prevCursor: trang mới hơn
+    has_older = has_more if direction < 0 else bool(messages)
+    has_newer = has_more if direction > 0 else bool(before_cursor and messages)
 
-    messages.reverse()
+    # readBy/readCount tính từ watermark của room thay vì mảng readBy lưu trong từng tin nhắn
+    attach_read_state(room_id, messages)
 
-    return jsonify(mongo_to_json({
+    return jsonify({
         "room": (room),
-        "messages": [(msg) for msg in messages]
-    }))
+        "messages": [(msg) for msg in messages],
+        "nextCursor": cursor_of(messages[0]) if has_older else None,
+        "prevCursor": cursor_of(messages[-1]) if has_newer else None,
+    })
+
+# POST /api/room/<room_id>/read - Mark every message in the room as read
+@room_bp.route("/<room_id>/read", methods=["POST"])
+def mark_room_as_read(room_id):
+    user_id = (request.json or {}).get("userId")
+    if not user_id:
+        return jsonify({"error": "Thiếu userId", "errorCode": "MISSING_USER_ID"}), 400
+
+    latest, advanced = mark_room_read(room_id, user_id)
+    if latest is None:
+        return jsonify({"message": "Room chưa có tin nhắn", "lastReadId": None})
+
+    if advanced:
+        refresh_room(room_id, user_id)
+        broadcast(REDIS_CHANNELS['MESSAGE_EVENTS'], 'message_read', {
+            'messageId': str(latest["_id"]),
+            'userId': user_id,
+            'roomId': room_id,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    return jsonify({"message": "Đã đánh dấu room là đã đọc", "lastReadId": str(latest["_id"])})
 
 # POST /api/room - Create new room
 @room_bp.route("/", methods=["POST"])
@@ -80,13 +156,16 @@ def create_group():
         "name": name,
         'type': type,
         "lastMessage": "",
+        # Room mới tạo được xếp theo thời điểm tạo cho tới khi có tin nhắn đầu tiên
+        "lastMessageAt": time.time(),
         "members": [ObjectId(member) for member in members],
         "createdAt": datetime.now()
     }
 
     result = db.rooms.insert_one(new_group)
     new_group["_id"] = str(result.inserted_id)
-    return jsonify(mongo_to_json(new_group)), 201
+    publish_membership_change(result.inserted_id, members)
+    return jsonify(new_group), 201
 
 # POST /api/room/<group_id>/join - Join group
 @room_bp.route("/<room_id>/join", methods=["POST"])
@@ -103,6 +182,8 @@ def join_group(room_id):
 
     if result.matched_count == 0:
         return jsonify({"error": "Group không tồn tại"}), 404
+    if result.modified_count:
+        publish_membership_change(room_id, [user_id])
     return jsonify({"message": "Đã tham gia group"})
 
 # POST /api/groups/<group_id>/leave - Leave group
@@ -120,13 +201,14 @@ def leave_group(room_id):
 
     if result.matched_count == 0:
         return jsonify({"error": "Group không tồn tại"}), 404
+    if result.modified_count:
+        publish_membership_change(room_id, [user_id], removed=True)
     return jsonify({"message": "Đã rời khỏi group"})
 
 @room_bp.route('/users/search', methods=['GET'])
 # @token_required # Chỉ user đã đăng nhập mới được tìm kiếm
 def search_users():
     """Endpoint tìm kiếm user theo username."""
-    db = get_mongo_client().Chatapp
     query = request.args.get('q', '')
 
     if not query or len(query) < 2:
@@ -138,36 +220,20 @@ def search_users():
     #      # Lỗi này không nên xảy ra nếu @token_required hoạt động đúng
     #     return jsonify({"message": "Could not identify current user"}), 401
 
-    # Gọi hàm service để tìm kiếm
+    # Tìm trên index searchTokens (hoặc index trong bộ nhớ), có xếp hạng và phân trang
     try:
-        regex_query = re.compile(f'.*{re.escape(query)}.*', re.IGNORECASE)
-
-        # Chỉ lấy các trường cần thiết từ DB để tạo UserPublic (tối ưu)
-        projection = {
-            "_id": 1,
-            "name": 1,
-            "email": 1, # Lấy cả email vì UserPublic có thể cần
-            "roles": 1,
-            "created_at": 1
-            # Không lấy hashed_password
-        }
-
-        cursor = db.users.find(
-            {
-                "name": regex_query,
-                # "_id": {"$ne": current_oid} # $ne: not equal - Loại trừ user hiện tại
-            },
-            projection # Chỉ lấy các trường đã định nghĩa
+        users_found, next_cursor = user_search.search_users(
+            query,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int),
         )
-
-        users_found = []
-        for user_data in cursor:
-            try:
-                users_found.append(user_data)
-            except Exception as e:
-                print(f"Error validating user data during search for user {user_data.get('_id')}: {e}")
+    except InvalidCursorError:
+        return jsonify({"message": "Invalid cursor"}), 400
     except Exception as e:
         print(f"Error during user search: {e}")
         return jsonify({"message": "An error occurred during search"}), 500
 
-    return jsonify(mongo_to_json(users_found)), 200
+    return jsonify({
+        "users": users_found,
+        "nextCursor": next_cursor,
+    }), 200
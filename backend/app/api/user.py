@@ -3,6 +3,7 @@ from pydantic import ValidationError # type: ignore
 from datetime import datetime, timezone, timedelta
 
 from ..helpers.auth import services
+from ..helpers.auth.hashing import PasswordHasherBusyError
 from ..helpers.auth.decorators import token_required, role_required, admin_required
 from ..models.user import UserCreate, UserLogin, UserPublic, Token
 
@@ -22,7 +23,10 @@ def register():
         return jsonify({"message": f"Email '{user_in.email}' already registered"}), 409
 
     # Tạo user trong DB
-    created_user = services.create_db_user(user_in)
+    try:
+        created_user = services.create_db_user(user_in)
+    except PasswordHasherBusyError:
+        return jsonify({"message": "Server is busy, please retry"}), 503, {"Retry-After": "1"}
     if not created_user:
         # create_db_user đã log lỗi chi tiết
         return jsonify({"message": "Failed to register user due to server error"}), 500
@@ -46,7 +50,11 @@ def login():
         return jsonify({"message": "Incorrect username or password"}), 401 # Luôn trả về lỗi chung chung
 
     # Kiểm tra password
-    if not services.verify_password(login_data.password, user.hashed_password):
+    try:
+        password_ok = services.verify_password(login_data.password, user.hashed_password)
+    except PasswordHasherBusyError:
+        return jsonify({"message": "Server is busy, please retry"}), 503, {"Retry-After": "1"}
+    if not password_ok:
         return jsonify({"message": "Incorrect username or password"}), 401
 
     # Chuẩn bị thông tin user public
@@ -2,5 +2,9 @@ REDIS_CHANNELS = {
     'USER_STATUS': 'user_status',
     'ROOM_EVENTS': 'room_events',
     'MESSAGE_EVENTS': 'message_events',
-    'TYPING_EVENTS': 'typing_events'
+    'TYPING_EVENTS': 'typing_events',
+    'USER_EVENTS': 'user_events',
+    'NOTIFY_EVENTS': 'notify_events',
+    'AUTH_EVENTS': 'auth_events',
+    'MEMBERSHIP_EVENTS': 'membership_events'
 }
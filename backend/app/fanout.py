@@ -0,0 +1,60 @@
+"""Fan-out sự kiện realtime tới các socket trong cluster với đúng một hop Redis.
+
+Sự kiện được publish lên kênh Redis của app, mỗi node nhận qua subscriber rồi
+chỉ emit cho các socket đang kết nối vào node đó (ignore_queue=True), không đi
+qua message queue của Flask-SocketIO nữa. Mọi sự kiện đều đi qua handler của
+kênh (socket_events) nên được gom batch và lọc người nhận (presence, room_updated).
+
+Vì vậy SocketIO được tạo không có message_queue: mọi emit đều là cục bộ. Emit
+thẳng qua message queue sẽ bỏ qua các handler đó và làm lộ danh sách recipients
+của presence cho mọi socket.
+
+Trước đây sự kiện đi qua kênh của app rồi lại được socketio.emit publish thêm
+một lần nữa, nên mỗi node nhận mỗi sự kiện N lần.
+"""
+from .constants import REDIS_CHANNELS
+from .redis_pubsub import publish_event
+
+_socketio = None
+
+
+def init_fanout(socketio):
+    global _socketio
+    _socketio = socketio
+
+
+def broadcast(channel: str, event: str, data: dict) -> bool:
+    """Gửi sự kiện tới toàn cluster qua đúng một hop Redis.
+
+    Handler của kênh quyết định room/người nhận ở mỗi node.
+    """
+    return publish_event(channel, {'event': event, 'data': data})
+
+
+def user_room(user_id) -> str:
+    """Room cá nhân của user, mọi socket của user join vào khi connect."""
+    return f"user:{user_id}"
+
+
+def notify_user(user_id, event: str, data: dict) -> bool:
+    """Gửi sự kiện tới mọi socket của một user trong cluster."""
+    return broadcast(REDIS_CHANNELS['NOTIFY_EVENTS'], event, {**data, 'userId': str(user_id)})
+
+
+def notify_users(event: str, data_by_user: dict) -> bool:
+    """Gửi sự kiện riêng cho nhiều user trong một message Redis (user_id -> data).
+
+    Mỗi node chỉ emit cho các user có socket kết nối vào nó, thay vì một publish
+    cho mỗi user.
+    """
+    if not data_by_user:
+        return True
+    return publish_event(REDIS_CHANNELS['NOTIFY_EVENTS'], {
+        'event': event,
+        'data': {'users': {str(user_id): data for user_id, data in data_by_user.items()}},
+    })
+
+
+def emit_local(event: str, data, room: str = None):
+    """Emit chỉ cho các socket kết nối vào node hiện tại (không publish lại lên Redis)."""
+    _socketio.emit(event, data, room=room, ignore_queue=True)
@@ -0,0 +1,129 @@
+"""Cache xác thực hai tầng cho token_required.
+
+- Principal: jti -> user_id của token đã kiểm tra blocklist (hoặc REVOKED nếu đã bị thu hồi).
+- User: user_id -> UserInDB đã validate.
+
+Cả hai là cache TTL/LRU trong bộ nhớ của process. Khi token bị blocklist, sự kiện
+được publish lên kênh Redis auth_events; khi user được cập nhật/xóa, code thay đổi
+user gọi user_search.publish_user_event('user_updated' | 'user_deleted') và mọi
+node xóa profile đã cache qua kênh user_events. Ở trạng thái ổn định, request đã xác thực không chạm tới
+Redis hay MongoDB.
+"""
+import collections
+import threading
+import time
+
+from ...constants import REDIS_CHANNELS
+from ...redis_pubsub import publish_event, register_channel_handler
+from .config import settings
+
+REVOKED = object()
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU có giới hạn kích thước, mỗi entry hết hạn sau ttl giây (hoặc expires_at riêng)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[1] <= time.monotonic():
+                if item is not _MISSING:
+                    del self._data[key]
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return item[0]
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def pop(self, key):
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+principal_cache = TTLCache(settings.AUTH_PRINCIPAL_CACHE_SIZE, settings.AUTH_PRINCIPAL_CACHE_TTL)
+user_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def get_principal(jti: str):
+    """user_id đã xác thực của token, REVOKED nếu token bị thu hồi, None nếu chưa có trong cache."""
+    return principal_cache.get(jti)
+
+
+def cache_principal(jti: str, user_id, expires_at: float):
+    """Lưu principal, không giữ lâu hơn thời hạn còn lại của token."""
+    principal_cache.set(jti, user_id, ttl=expires_at - time.time())
+
+
+def get_cached_user(user_id: str):
+    return user_cache.get(user_id)
+
+
+def cache_user(user_id: str, user):
+    user_cache.set(user_id, user)
+
+
+# --- Invalidation toàn cluster ---
+
+def revoke_principal(jti: str, expires_in_seconds: int):
+    """Token vừa bị blocklist: đánh dấu REVOKED ở local và báo các node khác."""
+    principal_cache.set(jti, REVOKED, ttl=expires_in_seconds)
+    publish_event(REDIS_CHANNELS['AUTH_EVENTS'], {
+        'event': 'token_revoked',
+        'data': {'jti': jti, 'expires_in': expires_in_seconds},
+    })
+
+
+def handle_auth_event(message):
+    try:
+        event_type = message.get('event')
+        data = message.get('data', {})
+        if event_type == 'token_revoked':
+            principal_cache.set(data['jti'], REVOKED, ttl=data.get('expires_in', settings.AUTH_PRINCIPAL_CACHE_TTL))
+    except Exception as e:
+        print(f"ERROR: Auth cache invalidation failed: {e}")
+
+
+def handle_user_event(message):
+    """Cập nhật/xóa user từ kênh user_events cũng làm mất hiệu lực profile đã cache."""
+    user_id = message.get('data', {}).get('user_id')
+    if user_id and message.get('event') in ('user_updated', 'user_deleted'):
+        user_cache.pop(user_id)
+
+
+def get_auth_cache_stats() -> dict:
+    return {
+        "principals": {"size": len(principal_cache), **principal_cache.stats},
+        "users": {"size": len(user_cache), **user_cache.stats},
+    }
+
+
+def init_auth_cache():
+    register_channel_handler(REDIS_CHANNELS['AUTH_EVENTS'], handle_auth_event)
+    register_channel_handler(REDIS_CHANNELS['USER_EVENTS'], handle_user_event)
@@ -1,4 +1,5 @@
 import os
+import socket
 
 class Settings:
     # --- JWT Config ---
@@ -6,13 +7,105 @@ class Settings:
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.environ.get("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 15))
 
+    # --- Password Hashing Config ---
+    PASSWORD_HASH_CONCURRENCY: int = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", 4))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 64))
+    PASSWORD_HASH_QUEUE_TIMEOUT_MS: int = int(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT_MS", 2000))
+
+    # --- Auth Cache Config ---
+    AUTH_PRINCIPAL_CACHE_SIZE: int = int(os.environ.get("AUTH_PRINCIPAL_CACHE_SIZE", 10000))
+    AUTH_PRINCIPAL_CACHE_TTL: int = int(os.environ.get("AUTH_PRINCIPAL_CACHE_TTL", 300))
+    AUTH_USER_CACHE_SIZE: int = int(os.environ.get("AUTH_USER_CACHE_SIZE", 10000))
+    AUTH_USER_CACHE_TTL: int = int(os.environ.get("AUTH_USER_CACHE_TTL", 60))
+
     # --- Redis Config ---
     REDIS_URL: str = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/")
     REDIS_PASSWORD: str | None = os.environ.get("REDIS_PASSWORD", None)
     REDIS_DB: int = int(os.environ.get("REDIS_DB", 0))
+    # --- Socket.IO Config ---
+    REDIS_PUBLISH_QUEUE_SIZE: int = int(os.environ.get("REDIS_PUBLISH_QUEUE_SIZE", 50000))
+    REDIS_PUBLISH_BATCH_SIZE: int = int(os.environ.get("REDIS_PUBLISH_BATCH_SIZE", 500))
+    REDIS_PUBLISH_LINGER_MS: int = int(os.environ.get("REDIS_PUBLISH_LINGER_MS", 0))
+    REDIS_SUBSCRIBER_QUEUE_SIZE: int = int(os.environ.get("REDIS_SUBSCRIBER_QUEUE_SIZE", 10000))
 
     # --- MongoDB Config ---
     MONGODB_URI: str = os.environ.get("MONGODB_URI", "mongodb://127.0.0.1:27017")
+    # Connection pool dùng chung cho cả process (các option trong URI được ưu tiên)
+    MONGODB_MAX_POOL_SIZE: int = int(os.environ.get("MONGODB_MAX_POOL_SIZE", 100))
+    MONGODB_MIN_POOL_SIZE: int = int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", 60000))
+    MONGODB_CONNECT_TIMEOUT_MS: int = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", 5000))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGODB_SOCKET_TIMEOUT_MS: int = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", 10000))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.environ.get("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 2000))
+
+    # --- Presence Config ---
+    NODE_ID: str = os.environ.get("NODE_ID", f"{socket.gethostname()}:{os.getpid()}")
+    PRESENCE_SESSION_TTL: int = int(os.environ.get("PRESENCE_SESSION_TTL", 60))
+    PRESENCE_HEARTBEAT_INTERVAL: int = int(os.environ.get("PRESENCE_HEARTBEAT_INTERVAL", 20))
+
+    # --- Membership Cache Config ---
+    MEMBERSHIP_CACHE_TTL: int = int(os.environ.get("MEMBERSHIP_CACHE_TTL", 3600))  # Redis
+    MEMBERSHIP_LOCAL_CACHE_SIZE: int = int(os.environ.get("MEMBERSHIP_LOCAL_CACHE_SIZE", 50000))
+    # Giới hạn thời gian dữ liệu cũ nếu node lỡ mất sự kiện membership_events
+    MEMBERSHIP_LOCAL_CACHE_TTL: int = int(os.environ.get("MEMBERSHIP_LOCAL_CACHE_TTL", 300))
+
+    # --- Metrics Config ---
+    # 0: tắt mọi histogram (socket, HTTP, MongoDB, Redis) và không đăng ký GET /metrics
+    METRICS_ENABLED: bool = os.environ.get("METRICS_ENABLED", "1") == "1"
+    # Nếu đặt, GET /metrics yêu cầu header Authorization: Bearer <token>
+    METRICS_TOKEN: str | None = os.environ.get("METRICS_TOKEN", None)
+
+    # --- Socket Rate Limit Config ---
+    RATE_LIMIT_ENABLED: bool = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+    # Token bucket theo sid: RATE sự kiện/giây, tối đa BURST sự kiện liên tiếp
+    RATE_LIMIT_MESSAGE_RATE: float = float(os.environ.get("RATE_LIMIT_MESSAGE_RATE", 5))
+    RATE_LIMIT_MESSAGE_BURST: int = int(os.environ.get("RATE_LIMIT_MESSAGE_BURST", 20))
+    RATE_LIMIT_TYPING_RATE: float = float(os.environ.get("RATE_LIMIT_TYPING_RATE", 2))
+    RATE_LIMIT_TYPING_BURST: int = int(os.environ.get("RATE_LIMIT_TYPING_BURST", 6))
+    RATE_LIMIT_READ_RATE: float = float(os.environ.get("RATE_LIMIT_READ_RATE", 10))
+    RATE_LIMIT_READ_BURST: int = int(os.environ.get("RATE_LIMIT_READ_BURST", 40))
+    RATE_LIMIT_SUBSCRIBE_RATE: float = float(os.environ.get("RATE_LIMIT_SUBSCRIBE_RATE", 5))
+    RATE_LIMIT_SUBSCRIBE_BURST: int = int(os.environ.get("RATE_LIMIT_SUBSCRIBE_BURST", 30))
+    # Bucket theo user lớn hơn bucket theo sid bấy nhiêu lần (nhiều tab/thiết bị)
+    RATE_LIMIT_USER_FACTOR: float = float(os.environ.get("RATE_LIMIT_USER_FACTOR", 3))
+    RATE_LIMIT_MAX_DELAY_MS: int = int(os.environ.get("RATE_LIMIT_MAX_DELAY_MS", 250))
+    RATE_LIMIT_MAX_INFLIGHT: int = int(os.environ.get("RATE_LIMIT_MAX_INFLIGHT", 8))
+    RATE_LIMIT_NOTIFY_INTERVAL_MS: int = int(os.environ.get("RATE_LIMIT_NOTIFY_INTERVAL_MS", 1000))
+
+    # --- Socket Batching Config ---
+    SOCKET_BATCH_WINDOW_MS: int = int(os.environ.get("SOCKET_BATCH_WINDOW_MS", 25))  # 0 = gửi ngay
+    SOCKET_BATCH_MAX_EVENTS: int = int(os.environ.get("SOCKET_BATCH_MAX_EVENTS", 200))
+
+    # --- Typing State Config ---
+    TYPING_TTL_MS: int = int(os.environ.get("TYPING_TTL_MS", 6000))
+    TYPING_TICK_MS: int = int(os.environ.get("TYPING_TICK_MS", 250))
+
+    # --- Unread Counter Config ---
+    UNREAD_COUNT_CAP: int = int(os.environ.get("UNREAD_COUNT_CAP", 999))
+    UNREAD_RECONCILE_INTERVAL: int = int(os.environ.get("UNREAD_RECONCILE_INTERVAL", 600))
+
+    # --- Message Search Config ---
+    MESSAGE_SEARCH_PAGE_SIZE: int = int(os.environ.get("MESSAGE_SEARCH_PAGE_SIZE", 20))
+    MESSAGE_SEARCH_MAX_CANDIDATES: int = int(os.environ.get("MESSAGE_SEARCH_MAX_CANDIDATES", 500))
+
+    # --- Export Config ---
+    EXPORT_BATCH_SIZE: int = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+    # --- User Search Config ---
+    USER_SEARCH_PAGE_SIZE: int = int(os.environ.get("USER_SEARCH_PAGE_SIZE", 20))
+    # Số ứng viên tối đa được xếp hạng khi tìm trên MongoDB, vượt quá thì ưu tiên user có tên bắt đầu bằng query
+    USER_SEARCH_MAX_CANDIDATES: int = int(os.environ.get("USER_SEARCH_MAX_CANDIDATES", 1000))
+    # Bật index tiền tố trong bộ nhớ để type-ahead không cần query MongoDB
+    USER_SEARCH_LOCAL_INDEX: bool = os.environ.get("USER_SEARCH_LOCAL_INDEX", "0") == "1"
+
+    # --- Message Ingest Config ---
+    INGEST_BATCH_SIZE: int = int(os.environ.get("INGEST_BATCH_SIZE", 500))
+    INGEST_FLUSH_INTERVAL_MS: int = int(os.environ.get("INGEST_FLUSH_INTERVAL_MS", 20))
+    INGEST_MAX_BUFFER: int = int(os.environ.get("INGEST_MAX_BUFFER", 20000))
+    INGEST_ENQUEUE_TIMEOUT_MS: int = int(os.environ.get("INGEST_ENQUEUE_TIMEOUT_MS", 200))
+    INGEST_ACK_TIMEOUT_MS: int = int(os.environ.get("INGEST_ACK_TIMEOUT_MS", 5000))
+    INGEST_MAX_RETRIES: int = int(os.environ.get("INGEST_MAX_RETRIES", 3))
 
 # Khởi tạo 1 instance duy nhất để import ở nơi khác
 settings = Settings()
@@ -1,8 +1,9 @@
 import functools
 from flask import request, jsonify, g # type: ignore
-from typing import List, Callable
+from typing import Any, List, Callable, Optional, Tuple
 
 from .services import decode_token, is_token_blocklisted, get_user_by_id
+from . import cache as auth_cache
 from ...models.user import UserPublic, TokenPayload # Import model để gõ type hint
 
 # Thêm UserPublic vào g để các route có thể sử dụng thông tin user an toàn
@@ -12,6 +13,47 @@ def set_current_user(user_in_db):
      else:
          g.current_user = None
 
+def authenticate_token(token: Optional[str]) -> Tuple[Any, Optional[dict], Optional[str]]:
+    """Xác thực JWT, trả về (user, payload, None) hoặc (None, None, lý do bị từ chối).
+
+    Dùng chung cho token_required (REST) và connect của Socket.IO.
+    """
+    if not token:
+        return None, None, "Authorization token is missing or invalid format"
+
+    payload = decode_token(token)
+    if not payload:
+        # decode_token đã log lỗi cụ thể (expired, invalid)
+        return None, None, "Invalid or expired token"
+
+    # Kiểm tra blocklist bằng JTI (kết quả được cache theo jti, xóa qua pub/sub khi logout)
+    jti = payload.get("jti")
+    if not jti:
+        return None, None, "Token has been revoked (logged out)"
+    principal = auth_cache.get_principal(jti)
+    if principal is auth_cache.REVOKED:
+        return None, None, "Token has been revoked (logged out)"
+
+    # Lấy user từ DB dựa vào user_id trong token
+    user_id = payload.get("user_id")
+    if not user_id:
+        return None, None, "Token payload missing user identifier"
+
+    if principal is None:
+        if is_token_blocklisted(jti):
+            auth_cache.cache_principal(jti, auth_cache.REVOKED, payload["exp"])
+            return None, None, "Token has been revoked (logged out)"
+        auth_cache.cache_principal(jti, user_id, payload["exp"])
+
+    user = auth_cache.get_cached_user(user_id)
+    if user is None:
+        user = get_user_by_id(user_id)
+        if not user:
+            # User đã bị xóa khỏi DB sau khi token được cấp?
+            return None, None, "User associated with token not found"
+        auth_cache.cache_user(user_id, user)
+    return user, payload, None
+
 def token_required(f: Callable) -> Callable:
     """Decorator để xác thực JWT và kiểm tra blocklist."""
     @functools.wraps(f)
@@ -22,28 +64,9 @@ def token_required(f: Callable) -> Callable:
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
 
-        if not token:
-            return jsonify({"message": "Authorization token is missing or invalid format"}), 401
-
-        payload = decode_token(token)
-        if not payload:
-            # decode_token đã log lỗi cụ thể (expired, invalid)
-            return jsonify({"message": "Invalid or expired token"}), 401
-
-        # Kiểm tra blocklist bằng JTI
-        jti = payload.get("jti")
-        if not jti or is_token_blocklisted(jti):
-            return jsonify({"message": "Token has been revoked (logged out)"}), 401
-
-        # Lấy user từ DB dựa vào user_id trong token
-        user_id = payload.get("user_id")
-        if not user_id:
-             return jsonify({"message": "Token payload missing user identifier"}), 401
-
-        user = get_user_by_id(user_id)
-        if not user:
-            # User đã bị xóa khỏi DB sau khi token được cấp?
-            return jsonify({"message": "User associated with token not found"}), 401
+        user, payload, error = authenticate_token(token)
+        if error:
+            return jsonify({"message": error}), 401
 
         # Lưu thông tin user và payload vào context g để route sử dụng
         set_current_user(user) # Lưu UserPublic
@@ -0,0 +1,110 @@
+"""Chạy bcrypt ngoài eventlet hub.
+
+bcrypt tốn hàng trăm ms CPU; gọi trực tiếp trong handler sẽ chặn cả hub (và mọi
+websocket) trong suốt thời gian đó. Ở đây bcrypt chạy trong native thread pool
+của eventlet (tpool), bcrypt nhả GIL nên các green thread khác vẫn chạy.
+Semaphore giới hạn số hash đồng thời, hàng chờ có giới hạn và timeout: khi quá
+tải thì báo PasswordHasherBusyError (API trả 503) thay vì để login dồn ứ.
+"""
+import threading
+import time
+
+import bcrypt # type: ignore
+
+from .config import settings
+
+try:
+    from eventlet import patcher, tpool
+except ImportError: # Chạy không có eventlet (script, test): gọi trực tiếp
+    patcher = tpool = None
+
+
+class PasswordHasherBusyError(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, concurrency: int, max_queue: int, queue_timeout: float):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.stats = {
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "queued_seconds_total": 0.0,
+            "queued_seconds_max": 0.0,
+            "hash_seconds_total": 0.0,
+            "hash_seconds_max": 0.0,
+        }
+
+    def _execute(self, func, *args):
+        if tpool is not None and patcher.is_monkey_patched("thread"):
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    def run(self, func, *args):
+        """Chạy func(*args) trong thread pool, có admission control."""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise PasswordHasherBusyError("Password hashing queue is full")
+            self._waiting += 1
+        queued_at = time.monotonic()
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise PasswordHasherBusyError("Timed out waiting for a password hashing slot")
+
+        started_at = time.monotonic()
+        outcome = "failed"
+        try:
+            result = self._execute(func, *args)
+            outcome = "completed"
+            return result
+        finally:
+            self._slots.release()
+            finished_at = time.monotonic()
+            queued, hashing = started_at - queued_at, finished_at - started_at
+            with self._lock:
+                # Lỗi từ bcrypt (vd. hash sai định dạng) được đếm riêng, thời gian vẫn được tính
+                self.stats[outcome] += 1
+                self.stats["queued_seconds_total"] += queued
+                self.stats["queued_seconds_max"] = max(self.stats["queued_seconds_max"], queued)
+                self.stats["hash_seconds_total"] += hashing
+                self.stats["hash_seconds_max"] = max(self.stats["hash_seconds_max"], hashing)
+
+    def hashpw(self, password: bytes, salt: bytes) -> bytes:
+        return self.run(bcrypt.hashpw, password, salt)
+
+    def checkpw(self, password: bytes, hashed_password: bytes) -> bool:
+        return self.run(bcrypt.checkpw, password, hashed_password)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["waiting"] = self._waiting
+        executed = (stats["completed"] + stats["failed"]) or 1
+        stats["queued_seconds_avg"] = stats["queued_seconds_total"] / executed
+        stats["hash_seconds_avg"] = stats["hash_seconds_total"] / executed
+        stats["concurrency"] = self.concurrency
+        return stats
+
+
+password_hasher = PasswordHasher(
+    concurrency=settings.PASSWORD_HASH_CONCURRENCY,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_MS / 1000,
+)
+
+
+def get_password_hasher_stats() -> dict:
+    return password_hasher.get_stats()
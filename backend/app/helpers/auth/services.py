@@ -9,20 +9,24 @@ from .config import settings
 from bson import ObjectId # type: ignore
 from ...mongo import get_mongo_client
 import pymongo
+from ...user_search import build_search_name, build_search_tokens, publish_user_event
+from .cache import revoke_principal
+from .hashing import password_hasher
 
 # --- Password Hashing ---
+# bcrypt chạy trong thread pool (không chặn eventlet hub), raise PasswordHasherBusyError khi quá tải
 def hash_password(password: str) -> str:
     """Hash password dùng bcrypt."""
     pwd_bytes = password.encode('utf-8')
     salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(pwd_bytes, salt)
+    hashed_password = password_hasher.hashpw(pwd_bytes, salt)
     return hashed_password.decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Kiểm tra password hash."""
     password_byte_enc = plain_password.encode('utf-8')
     hashed_password_byte = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_byte_enc, hashed_password_byte)
+    return password_hasher.checkpw(password_byte_enc, hashed_password_byte)
 
 # --- JWT Handling ---
 JWT_SECRET = settings.JWT_SECRET_KEY
@@ -76,6 +80,8 @@ def add_token_to_blocklist(jti: str, expires_in_seconds: int):
         # Set giá trị là 'blocked' và thời gian hết hạn (tính bằng giây)
         redis.setex(key, expires_in_seconds, "blocked")
         print(f"Token JTI {jti} added to blocklist for {expires_in_seconds} seconds.")
+        # Xóa principal đã cache trên mọi node
+        revoke_principal(jti, expires_in_seconds)
     except Exception as e:
         print(f"ERROR: Failed to add JTI {jti} to Redis blocklist: {e}")
 
@@ -114,7 +120,7 @@ def get_user_by_email(email: str) -> Optional[UserInDB]:
 def get_user_by_id(user_id: str) -> Optional[UserInDB]:
     """Lấy user từ DB theo ID (dạng string)."""
     db = get_mongo_client().Chatapp
-    if db != None or not ObjectId.is_valid(user_id):
+    if db is None or not ObjectId.is_valid(user_id):
         return None
     user_data = db.users.find_one({"_id": ObjectId(user_id)})
     if user_data:
@@ -135,19 +141,22 @@ def create_db_user(user_in: UserCreate) -> Optional[UserInDB]:
     user_doc["created_at"] = datetime.utcnow()
     user_doc["updated_at"] = datetime.utcnow()
     user_doc["roles"] = ["user"] # Gán role mặc định
+    user_doc["searchTokens"] = build_search_tokens(user_doc.get("name") or "", user_doc["email"])
+    user_doc["searchName"] = build_search_name(user_doc.get("name") or "")
 
     try:
         result = db.users.insert_one(user_doc)
         # Lấy lại user vừa tạo để có _id và các giá trị default
         created_user_data = db.users.find_one({"_id": result.inserted_id})
         if created_user_data:
+            publish_user_event('user_created', result.inserted_id)
             return UserInDB(**created_user_data)
         else:
             print("Failed to retrieve newly created user.")
             return None
-    # except pymongo.errors.DuplicateKeyError: # type: ignore
-    #     print(f"Cannot create user. Username or email already exists.") # Giả sử có unique index
-    #     return None
+    except pymongo.errors.DuplicateKeyError: # type: ignore
+        print(f"Cannot create user. Username or email already exists.") # Unique index users_email
+        return None
     except Exception as e:
         print(f"Error creating user in DB: {e}")
         return None
@@ -0,0 +1,61 @@
+import base64
+import json
+from bson import ObjectId
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(created_at, doc_id) -> str:
+    """Mã hóa vị trí (createdAt, _id) thành cursor dạng chuỗi opaque."""
+    is_oid = isinstance(doc_id, ObjectId)
+    raw = json.dumps([created_at, str(doc_id), is_oid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Giải mã cursor, trả về tuple (createdAt, _id)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id, is_oid = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(created_at, (int, float)):
+            raise ValueError("createdAt must be a number")
+        return created_at, ObjectId(doc_id) if is_oid else doc_id
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(cursor: str, direction: int) -> dict:
+    """Điều kiện lọc keyset trên (createdAt, _id).
+
+    direction = -1: lấy các bản ghi cũ hơn cursor, direction = 1: mới hơn cursor.
+    """
+    created_at, doc_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [
+        {"createdAt": {op: created_at}},
+        {"createdAt": created_at, "_id": {op: doc_id}},
+    ]}
+
+
+def cursor_of(doc: dict) -> str:
+    return encode_cursor(doc["createdAt"], doc["_id"])
+
+
+def encode_offset_cursor(offset: int, query: str) -> str:
+    """Cursor cho kết quả đã xếp hạng: vị trí trong danh sách + query đã chuẩn hóa."""
+    raw = json.dumps([offset, query], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_offset_cursor(cursor: str, query: str) -> int:
+    """Giải mã cursor dạng offset, cursor phải thuộc về đúng query hiện tại."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset, cursor_query = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(offset, int) or offset < 0 or cursor_query != query:
+            raise ValueError("cursor does not match query")
+        return offset
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
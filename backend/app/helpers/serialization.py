@@ -0,0 +1,77 @@
+"""JSON provider cho Flask encode trực tiếp các kiểu BSON trong một lần duyệt.
+
+Trước đây response phải đi qua mongo_to_json (duyệt đệ quy, dựng lại mọi
+dict/list để đổi ObjectId thành string) rồi jsonify lại duyệt thêm lần nữa.
+BsonJSONProvider encode ObjectId ngay trong encoder (orjson nếu có, không thì
+json của thư viện chuẩn), nên route có thể jsonify thẳng document MongoDB.
+datetime vẫn được xuất dạng HTTP date như DefaultJSONProvider của Flask.
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def bson_default(o):
+    """Encode các kiểu mà encoder không hỗ trợ sẵn."""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=bson_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=bson_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj, **kwargs) -> str:
+    if kwargs or orjson is None:
+        kwargs.setdefault("default", bson_default)
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(obj, **kwargs)
+    return orjson.dumps(obj, default=bson_default, option=ORJSON_OPTIONS).decode("utf-8")
+
+
+def loads(s, **kwargs):
+    if kwargs or orjson is None:
+        return json.loads(s, **kwargs)
+    return orjson.loads(s)
+
+
+class BsonJSONProvider(DefaultJSONProvider):
+    """Không sắp xếp key (giữ thứ tự của document) để encoder chỉ duyệt một lần."""
+
+    sort_keys = False
+    default = staticmethod(bson_default)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
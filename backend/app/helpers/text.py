@@ -0,0 +1,26 @@
+import re
+import unicodedata
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 20
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa text để tìm kiếm: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d)."""
+    if not text:
+        return ""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> list:
+    """Tách text đã chuẩn hóa thành các từ."""
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def edge_ngrams(word: str, min_length: int = MIN_PREFIX_LENGTH, max_length: int = MAX_PREFIX_LENGTH) -> list:
+    """Các tiền tố của một từ, dùng cho tìm kiếm type-ahead."""
+    return [word[:i] for i in range(min_length, min(len(word), max_length) + 1)]
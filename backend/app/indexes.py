@@ -0,0 +1,178 @@
+"""Khai báo index cho các collection MongoDB.
+
+Mọi index mà code cần đều được khai báo trong INDEXES, kèm danh sách query
+mà index đó phục vụ. Khi start app, index được tạo ở background; lệnh CLI
+`flask indexes ...` dùng để tạo, kiểm tra drift và xem báo cáo.
+"""
+import click
+from flask.cli import AppGroup
+from pymongo.errors import OperationFailure
+
+from .mongo import get_mongo_client
+
+
+class IndexSpec:
+    def __init__(self, collection: str, keys: list, name: str, serves: list, **options):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.serves = serves  # Các query ("file:function") dùng index này
+        self.options = options
+
+    def key_dict(self) -> dict:
+        return {field: direction for field, direction in self.keys}
+
+    def describe(self) -> str:
+        keys = ", ".join(f"{field}:{direction}" for field, direction in self.keys)
+        opts = "".join(f" {k}={v}" for k, v in self.options.items())
+        return f"{self.collection}.{self.name} ({keys}){opts}"
+
+
+INDEXES = [
+    IndexSpec(
+        "messages", [("roomId", 1), ("createdAt", -1), ("_id", -1)], "room_history",
+        serves=[
+            "app/api/room.py:get_room_detail",
+            "app/api/export.py:iter_export_lines",
+            "app/read_receipts.py:mark_room_read",
+            "app/unread.py:count_unread",
+            "app/unread.py:count_unread_rooms",
+        ],
+    ),
+    IndexSpec(
+        "messages", [("searchTerms", 1), ("roomId", 1), ("createdAt", -1)], "messages_search_terms",
+        serves=["app/message_search.py:search_messages"],
+    ),
+    IndexSpec(
+        "rooms", [("members", 1), ("lastMessageAt", -1), ("_id", -1)], "rooms_members_activity",
+        serves=[
+            "app/api/room.py:get_user_room",
+            "app/unread.py:reconcile_user",
+            "app/membership.py:MembershipCache._load_user",
+            "app/message_search.py:user_room_ids",
+        ],
+    ),
+    IndexSpec(
+        "users", [("email", 1)], "users_email", unique=True,
+        serves=["app/helpers/auth/services.py:get_user_by_email", "app/api/user.py:register", "app/api/user.py:login"],
+    ),
+    IndexSpec(
+        "users", [("searchTokens", 1)], "users_search_tokens",
+        serves=["app/api/room.py:search_users", "app/user_search.py:search_users"],
+    ),
+    IndexSpec(
+        "users", [("searchName", 1)], "users_search_name",
+        serves=["app/user_search.py:_search_db"],
+    ),
+    IndexSpec(
+        "read_receipts", [("roomId", 1), ("userId", 1)], "read_receipts_room_user", unique=True,
+        serves=[
+            "app/read_receipts.py:advance_watermark",
+            "app/read_receipts.py:get_room_watermarks",
+            "app/unread.py:count_unread",
+        ],
+    ),
+    IndexSpec(
+        "read_receipts", [("userId", 1)], "read_receipts_user",
+        serves=["app/unread.py:reconcile_user"],
+    ),
+]
+
+
+def _get_db(db=None):
+    return db if db is not None else get_mongo_client().Chatapp
+
+
+def ensure_indexes(db=None) -> dict:
+    """Tạo toàn bộ index đã khai báo. Trả về {tên index: "ok" | lỗi}."""
+    db = _get_db(db)
+    results = {}
+    for spec in INDEXES:
+        try:
+            db[spec.collection].create_index(spec.keys, name=spec.name, background=True, **spec.options)
+            results[spec.name] = "ok"
+        except OperationFailure as e:
+            # Ví dụ: index unique nhưng dữ liệu đang có bản ghi trùng
+            print(f"ERROR: Cannot create index {spec.describe()}: {e}")
+            results[spec.name] = str(e)
+        except Exception as e:
+            print(f"ERROR: Unexpected error while creating index {spec.describe()}: {e}")
+            results[spec.name] = str(e)
+    return results
+
+
+def check_index_drift(db=None) -> dict:
+    """So sánh index khai báo với index thực tế trong database."""
+    db = _get_db(db)
+    drift = {"missing": [], "changed": [], "extra": []}
+    declared = {}
+    for spec in INDEXES:
+        declared.setdefault(spec.collection, {})[spec.name] = spec
+
+    for collection, specs in declared.items():
+        live = db[collection].index_information()
+        for name, spec in specs.items():
+            info = live.get(name)
+            if info is None:
+                drift["missing"].append(spec.describe())
+                continue
+            same_keys = [tuple(k) for k in info["key"]] == [tuple(k) for k in spec.keys]
+            same_unique = bool(info.get("unique", False)) == bool(spec.options.get("unique", False))
+            if not same_keys or not same_unique:
+                drift["changed"].append(spec.describe())
+        for name in live:
+            if name != "_id_" and name not in specs:
+                drift["extra"].append(f"{collection}.{name}")
+    return drift
+
+
+def index_report() -> list:
+    """Danh sách index và các query mà mỗi index phục vụ."""
+    return [
+        {"index": spec.describe(), "serves": spec.serves}
+        for spec in INDEXES
+    ]
+
+
+def bootstrap_indexes():
+    """Tạo index và log drift, chạy trong background khi start app."""
+    try:
+        ensure_indexes()
+        drift = check_index_drift()
+        for kind, items in drift.items():
+            for item in items:
+                print(f"WARN: Index drift ({kind}): {item}")
+    except Exception as e:
+        print(f"ERROR: Index bootstrap failed: {e}")
+
+
+indexes_cli = AppGroup("indexes", help="Quản lý index MongoDB.")
+
+
+@indexes_cli.command("ensure")
+def ensure_command():
+    """Tạo các index đã khai báo."""
+    for name, result in ensure_indexes().items():
+        click.echo(f"{name}: {result}")
+
+
+@indexes_cli.command("check")
+def check_command():
+    """Kiểm tra drift giữa khai báo và database."""
+    drift = check_index_drift()
+    if not any(drift.values()):
+        click.echo("No drift.")
+        return
+    for kind, items in drift.items():
+        for item in items:
+            click.echo(f"{kind}: {item}")
+    raise SystemExit(1)
+
+
+@indexes_cli.command("report")
+def report_command():
+    """In ra index và các query mà mỗi index phục vụ."""
+    for row in index_report():
+        click.echo(row["index"])
+        for query in row["serves"]:
+            click.echo(f"    - {query}")
@@ -0,0 +1,272 @@
+"""Cache thành viên room cho cả cluster: room -> members và user -> rooms.
+
+Tra cứu dừng ở tầng đầu tiên có dữ liệu:
+
+- Bộ nhớ process: TTLCache chứa frozenset, is_member() là một phép tra set O(1).
+- Redis: membership:room:<room_id> và membership:user:<user_id> (SET có TTL), dùng
+  chung giữa các node nên mỗi room/user chỉ phải đọc MongoDB một lần cho cả cluster.
+- MongoDB: rooms.members là nguồn dữ liệu gốc.
+
+create/join/leave gọi publish_membership_change(): tăng generation của các key bị
+ảnh hưởng, xóa key Redis và báo mọi node xóa cache local qua kênh membership_events.
+Dữ liệu nạp từ tầng dưới chỉ được ghi nếu generation không đổi trong lúc đọc, nên
+một lần đọc chạy song song với thay đổi không ghi đè dữ liệu mới bằng dữ liệu cũ.
+"""
+import threading
+
+import redis
+from bson import ObjectId
+
+from .constants import REDIS_CHANNELS
+from .helpers.auth.cache import TTLCache
+from .helpers.auth.config import settings
+from .mongo import get_mongo_client
+from .redis import get_redis
+from .redis_pubsub import publish_event, register_channel_handler
+
+ROOM_KEY = "membership:room:{}"
+USER_KEY = "membership:user:{}"
+GEN_KEY = "membership:gen:{}"
+# Phần tử đánh dấu SET đã được nạp (Redis không lưu được SET rỗng)
+LOADED = "*"
+
+
+class NotRoomMemberError(PermissionError):
+    """User không phải thành viên của room."""
+
+
+class MembershipCache:
+    def __init__(self, local_size: int, local_ttl: int, redis_ttl: int):
+        self.redis_ttl = redis_ttl
+        self._rooms = TTLCache(local_size, local_ttl)  # room_id -> frozenset(user_id)
+        self._users = TTLCache(local_size, local_ttl)  # user_id -> frozenset(room_id)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.stats = {"redis_hits": 0, "db_loads": 0, "stale_loads": 0, "invalidations": 0}
+
+    # --- Tra cứu ---
+
+    def is_member(self, room_id, user_id) -> bool:
+        return str(user_id) in self.members_of(room_id)
+
+    def require_member(self, room_id, user_id):
+        if self.is_member(room_id, user_id):
+            return
+        # Kết quả âm từ cache local có thể là do sự kiện invalidation chưa tới (vừa join ở
+        # node khác): kiểm tra lại một lần ở Redis/MongoDB, nơi đã được xóa đồng bộ khi join
+        self._rooms.pop(str(room_id))
+        if not self.is_member(room_id, user_id):
+            raise NotRoomMemberError(f"User {user_id} is not a member of room {room_id}")
+
+    def members_of(self, room_id) -> frozenset:
+        room_id = str(room_id)
+        return self._members_many([room_id])[room_id]
+
+    def rooms_of(self, user_id) -> frozenset:
+        user_id = str(user_id)
+        rooms = self._users.get(user_id)
+        if rooms is not None:
+            return rooms
+
+        generation = self._generation
+        key = USER_KEY.format(user_id)
+        rooms = self._redis_get([key]).get(key)
+        if rooms is None:
+            rooms = self._load_user(user_id)
+        self._set_local(self._users, user_id, rooms, generation)
+        return rooms
+
+    def contacts_of(self, user_id) -> set:
+        """Mọi user có chung ít nhất một room với user_id (không gồm chính user)."""
+        user_id = str(user_id)
+        contacts = set()
+        for members in self._members_many(list(self.rooms_of(user_id))).values():
+            contacts.update(members)
+        contacts.discard(user_id)
+        return contacts
+
+    def _members_many(self, room_ids: list) -> dict:
+        result = {}
+        missing = []
+        for room_id in room_ids:
+            members = self._rooms.get(room_id)
+            if members is None:
+                missing.append(room_id)
+            else:
+                result[room_id] = members
+        if not missing:
+            return result
+
+        generation = self._generation
+        keys = {ROOM_KEY.format(room_id): room_id for room_id in missing}
+        for key, members in self._redis_get(list(keys)).items():
+            result[keys[key]] = members
+        not_cached = [room_id for room_id in missing if room_id not in result]
+        if not_cached:
+            result.update(self._load_rooms(not_cached))
+        for room_id in missing:
+            self._set_local(self._rooms, room_id, result[room_id], generation)
+        return result
+
+    # --- Tầng Redis ---
+
+    def _redis_get(self, keys: list) -> dict:
+        redis_client = get_redis()
+        if not redis_client or not keys:
+            return {}
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.smembers(key)
+            values = pipe.execute()
+        except Exception as e:
+            print(f"ERROR: Membership cache read failed: {e}")
+            return {}
+        found = {key: frozenset(value - {LOADED}) for key, value in zip(keys, values) if LOADED in value}
+        self.stats["redis_hits"] += len(found)
+        return found
+
+    def _read_generations(self, redis_client, keys: list):
+        if not redis_client:
+            return None
+        try:
+            return redis_client.mget([GEN_KEY.format(key) for key in keys])
+        except Exception as e:
+            print(f"ERROR: Membership generation read failed: {e}")
+            return None
+
+    def _redis_store(self, redis_client, entries: dict, generations):
+        """Ghi các SET vào Redis nếu generation chưa đổi kể từ lúc bắt đầu đọc MongoDB."""
+        if not redis_client or generations is None:
+            return
+        gen_keys = [GEN_KEY.format(key) for key in entries]
+        try:
+            with redis_client.pipeline(transaction=True) as pipe:
+                pipe.watch(*gen_keys)
+                if pipe.mget(gen_keys) != generations:
+                    self.stats["stale_loads"] += 1
+                    return
+                pipe.multi()
+                for key, values in entries.items():
+                    pipe.delete(key)
+                    pipe.sadd(key, LOADED, *values)
+                    pipe.expire(key, self.redis_ttl)
+                pipe.execute()
+        except redis.WatchError:
+            self.stats["stale_loads"] += 1
+        except Exception as e:
+            print(f"ERROR: Membership cache write failed: {e}")
+
+    # --- Tầng MongoDB ---
+
+    def _load_user(self, user_id: str) -> frozenset:
+        if not ObjectId.is_valid(user_id):
+            return frozenset()
+        redis_client = get_redis()
+        key = USER_KEY.format(user_id)
+        generations = self._read_generations(redis_client, [key])
+
+        db = get_mongo_client().Chatapp
+        rooms = frozenset(str(room["_id"]) for room in db.rooms.find({"members": ObjectId(user_id)}, {"_id": 1}))
+        self.stats["db_loads"] += 1
+        self._redis_store(redis_client, {key: rooms}, generations)
+        return rooms
+
+    def _load_rooms(self, room_ids: list) -> dict:
+        redis_client = get_redis()
+        keys = [ROOM_KEY.format(room_id) for room_id in room_ids]
+        generations = self._read_generations(redis_client, keys)
+
+        db = get_mongo_client().Chatapp
+        object_ids = [ObjectId(room_id) for room_id in room_ids if ObjectId.is_valid(room_id)]
+        found = {
+            str(room["_id"]): frozenset(str(member) for member in room.get("members", []))
+            for room in db.rooms.find({"_id": {"$in": object_ids}}, {"members": 1})
+        }
+        self.stats["db_loads"] += 1
+        # Room không tồn tại được cache là tập rỗng, id của room mới luôn là id chưa từng dùng
+        result = {room_id: found.get(room_id, frozenset()) for room_id in room_ids}
+        self._redis_store(redis_client, dict(zip(keys, result.values())), generations)
+        return result
+
+    # --- Bộ nhớ process ---
+
+    def _set_local(self, cache: TTLCache, key: str, value: frozenset, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                # Có invalidation trong lúc nạp: bỏ qua, lần tra cứu sau sẽ nạp lại
+                self.stats["stale_loads"] += 1
+                return
+            cache.set(key, value)
+
+    def invalidate(self, room_id, user_ids=()):
+        """Xóa room và các user bị ảnh hưởng khỏi cache local (chỉ trong process này)."""
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            self._rooms.pop(str(room_id))
+            for user_id in user_ids:
+                self._users.pop(str(user_id))
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "rooms": {"size": len(self._rooms), **self._rooms.stats},
+            "users": {"size": len(self._users), **self._users.stats},
+        }
+
+
+_cache = MembershipCache(
+    local_size=settings.MEMBERSHIP_LOCAL_CACHE_SIZE,
+    local_ttl=settings.MEMBERSHIP_LOCAL_CACHE_TTL,
+    redis_ttl=settings.MEMBERSHIP_CACHE_TTL,
+)
+
+
+def get_membership() -> MembershipCache:
+    return _cache
+
+
+def get_membership_stats() -> dict:
+    return _cache.get_stats()
+
+
+def publish_membership_change(room_id, user_ids=(), removed=False):
+    """Gọi sau khi rooms.members thay đổi: xóa cache Redis, cache ở node này và báo các node khác.
+
+    removed=True khi user_ids vừa rời room: mỗi node đưa socket của họ ra khỏi room
+    Socket.IO (handler trong socket_events) để không nhận tiếp sự kiện của room.
+    """
+    room_id = str(room_id)
+    user_ids = [str(user_id) for user_id in user_ids]
+    keys = [ROOM_KEY.format(room_id)] + [USER_KEY.format(user_id) for user_id in user_ids]
+
+    redis_client = get_redis()
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            for key in keys:
+                pipe.incr(GEN_KEY.format(key))
+                pipe.expire(GEN_KEY.format(key), settings.MEMBERSHIP_CACHE_TTL * 2)
+            pipe.delete(*keys)
+            pipe.execute()
+        except Exception as e:
+            print(f"ERROR: Membership cache invalidation failed for room {room_id}: {e}")
+
+    _cache.invalidate(room_id, user_ids)
+    publish_event(REDIS_CHANNELS['MEMBERSHIP_EVENTS'], {
+        'event': 'membership_changed',
+        'data': {'roomId': room_id, 'userIds': user_ids, 'removed': removed},
+    })
+
+
+def handle_membership_event(message):
+    try:
+        data = message.get('data', {})
+        _cache.invalidate(data['roomId'], data.get('userIds', []))
+    except Exception as e:
+        print(f"ERROR: Membership cache invalidation failed: {e}")
+
+
+def init_membership():
+    register_channel_handler(REDIS_CHANNELS['MEMBERSHIP_EVENTS'], handle_membership_event)
@@ -0,0 +1,272 @@
+"""Pipeline ghi tin nhắn (write-behind) dùng chung cho REST và socket.
+
+Tin nhắn được đưa vào buffer trong bộ nhớ, một green thread flush xuống MongoDB
+bằng insert_many khi đủ INGEST_BATCH_SIZE hoặc sau INGEST_FLUSH_INTERVAL_MS.
+Người gửi chỉ được xác nhận khi batch chứa tin nhắn đã được MongoDB ack.
+Khi buffer đầy, submit() chờ tối đa INGEST_ENQUEUE_TIMEOUT_MS rồi báo
+IngestBackpressureError.
+
+_id được sinh trước khi ghi nên retry là idempotent: lỗi duplicate key (11000)
+của tin nhắn đang retry nghĩa là lần ghi trước đã thành công một phần.
+"""
+import collections
+import threading
+import time
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, AutoReconnect
+
+from .constants import REDIS_CHANNELS
+from .helpers import mongo_to_json
+from .helpers.auth.config import settings
+from .mongo import get_mongo_client
+from .fanout import broadcast
+from .message_search import build_message_terms
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class IngestBackpressureError(Exception):
+    pass
+
+
+class IngestPendingError(Exception):
+    """Hết thời gian chờ ack nhưng tin nhắn đang được ghi (có thể vẫn được lưu và phát sau).
+
+    Client nhận lại message với _id đã sinh để loại trùng khi new_message tới,
+    thay vì gửi lại và tạo bản sao.
+    """
+
+    def __init__(self, message: dict):
+        super().__init__("Message is still being persisted")
+        self.message = message
+
+
+class PendingMessage:
+    """Tin nhắn đang chờ ghi, wait() trả về True khi đã ghi thành công."""
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.error = None
+        self.retries = 0
+        self.enqueued_at = time.monotonic()
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout) and self.error is None
+
+    def resolve(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+class MessageIngestor:
+    def __init__(self, batch_size: int, flush_interval: float, max_buffer: int,
+                 enqueue_timeout: float, max_retries: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._buffer = collections.deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._listeners = []
+        self._running = False
+        self.stats = {
+            "submitted": 0,
+            "persisted": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,
+            "retries": 0,
+        }
+
+    def add_listener(self, listener):
+        """Đăng ký hàm được gọi với danh sách tin nhắn sau mỗi lần ghi thành công."""
+        self._listeners.append(listener)
+
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def submit(self, message: dict) -> PendingMessage:
+        """Đưa tin nhắn vào buffer, áp dụng backpressure khi buffer đầy."""
+        pending = PendingMessage(message)
+        with self._not_full:
+            if len(self._buffer) >= self.max_buffer:
+                self._not_full.wait_for(lambda: len(self._buffer) < self.max_buffer, self.enqueue_timeout)
+                if len(self._buffer) >= self.max_buffer:
+                    self.stats["rejected"] += 1
+                    raise IngestBackpressureError("Message buffer is full")
+            self._buffer.append(pending)
+            self.stats["submitted"] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+        return pending
+
+    def cancel(self, pending: PendingMessage) -> bool:
+        """Bỏ tin nhắn còn nằm trong buffer. False nếu nó đang được ghi (đã nằm trong một batch)."""
+        with self._not_full:
+            try:
+                self._buffer.remove(pending)
+            except ValueError:
+                return False
+            self._not_full.notify_all()
+            return True
+
+    def _take_batch(self) -> list:
+        with self._not_full:
+            batch = []
+            while self._buffer and len(batch) < self.batch_size:
+                batch.append(self._buffer.popleft())
+            self._not_full.notify_all()
+            return batch
+
+    def _requeue(self, batch: list):
+        """Đưa lại batch lỗi tạm thời về đầu buffer, hủy những tin đã hết lượt retry."""
+        retry = []
+        for pending in batch:
+            pending.retries += 1
+            if pending.retries > self.max_retries:
+                self.stats["failed"] += 1
+                pending.resolve(RuntimeError("Failed to persist message"))
+            else:
+                retry.append(pending)
+        with self._lock:
+            self._buffer.extendleft(reversed(retry))
+            self.stats["retries"] += len(retry)
+
+    def flush(self) -> int:
+        """Ghi một batch xuống MongoDB. Trả về số tin nhắn đã ghi."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        db = get_mongo_client().Chatapp
+        failed = {}
+        try:
+            db.messages.insert_many([pending.message for pending in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                index = error["index"]
+                # Tin nhắn đang retry bị trùng _id: đã được lưu ở lần ghi trước (insert_many ghi được một phần)
+                if error.get("code") == DUPLICATE_KEY_ERROR and batch[index].retries > 0:
+                    continue
+                failed[index] = error.get("errmsg", "write error")
+        except AutoReconnect as e:
+            print(f"ERROR: MongoDB unavailable while flushing messages: {e}")
+            self._requeue(batch)
+            return 0
+        except Exception as e:
+            print(f"ERROR: Unexpected error while flushing messages: {e}")
+            self._requeue(batch)
+            return 0
+
+        persisted = []
+        for index, pending in enumerate(batch):
+            if index in failed:
+                self.stats["failed"] += 1
+                pending.resolve(RuntimeError(failed[index]))
+            else:
+                persisted.append(pending.message)
+                pending.resolve()
+        self.stats["persisted"] += len(persisted)
+        self.stats["batches"] += 1
+
+        for listener in self._listeners:
+            try:
+                listener(persisted)
+            except Exception as e:
+                print(f"ERROR: Ingest listener {getattr(listener, '__name__', listener)} failed: {e}")
+        return len(persisted)
+
+    def run(self):
+        """Vòng lặp flush, chạy như một background task của socketio."""
+        self._running = True
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                # Flush liên tục khi buffer còn đủ một batch đầy
+                while self.flush() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"ERROR: Message ingest loop error: {e}")
+                time.sleep(self.flush_interval)
+
+    def stop(self):
+        """Dừng vòng lặp và ghi nốt phần còn lại trong buffer."""
+        self._running = False
+        self._wakeup.set()
+        while self._buffer:
+            if not self.flush():
+                break
+
+
+_ingestor = None
+
+
+def get_message_ingestor() -> MessageIngestor:
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = MessageIngestor(
+            batch_size=settings.INGEST_BATCH_SIZE,
+            flush_interval=settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+            max_buffer=settings.INGEST_MAX_BUFFER,
+            enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT_MS / 1000,
+            max_retries=settings.INGEST_MAX_RETRIES,
+        )
+    return _ingestor
+
+
+def build_message(room_id: str, sender_id: str, content: str) -> dict:
+    """Tạo document tin nhắn, _id được sinh trước để trả về ngay cho người gửi."""
+    return {
+        "_id": ObjectId(),
+        "roomId": ObjectId(room_id),
+        "senderId": ObjectId(sender_id),
+        "content": content,
+        "searchTerms": build_message_terms(content),
+        "createdAt": time.time(),
+    }
+
+
+def public_message(message: dict) -> dict:
+    """Tin nhắn trả về cho client (bỏ các trường chỉ dùng cho index)."""
+    return {key: value for key, value in message.items() if key != "searchTerms"}
+
+
+def ingest_message(room_id: str, sender_id: str, content: str) -> dict:
+    """Gửi tin nhắn qua pipeline và chờ đến khi đã ghi xuống MongoDB.
+
+    Raise IngestBackpressureError nếu buffer đầy, RuntimeError nếu ghi lỗi. Hết
+    INGEST_ACK_TIMEOUT_MS: tin nhắn còn trong buffer bị hủy (TimeoutError, gửi lại
+    an toàn); tin nhắn đang được ghi thì raise IngestPendingError kèm _id.
+    """
+    ingestor = get_message_ingestor()
+    pending = ingestor.submit(build_message(room_id, sender_id, content))
+    if pending.wait(settings.INGEST_ACK_TIMEOUT_MS / 1000):
+        return pending.message
+    if pending.error:
+        raise pending.error
+    if ingestor.cancel(pending):
+        raise TimeoutError("Timed out waiting for message to be persisted")
+    raise IngestPendingError(pending.message)
+
+
+def publish_new_messages(messages: list):
+    """Listener: chỉ phát new_message sau khi tin nhắn đã được lưu."""
+    for message in messages:
+        data = mongo_to_json(public_message(message))
+        # Trạng thái đọc nằm ở read_receipts; tin nhắn mới chỉ có người gửi đã đọc
+        data['readBy'] = [data['senderId']]
+        data['readCount'] = 1
+        broadcast(REDIS_CHANNELS['MESSAGE_EVENTS'], 'new_message', data)
+
+
+def init_message_ingest(socketio):
+    ingestor = get_message_ingestor()
+    ingestor.add_listener(publish_new_messages)
+    socketio.start_background_task(ingestor.run)
+    return ingestor
@@ -0,0 +1,124 @@
+"""Tìm kiếm nội dung tin nhắn trong các room mà user là thành viên.
+
+Mỗi tin nhắn lưu `searchTerms` (các từ đã chuẩn hóa, bỏ dấu tiếng Việt) được
+tính ngay khi ingest. Index multikey (searchTerms, roomId, createdAt) đóng vai
+trò inverted index: query chỉ quét posting list của một từ trong đúng các room
+của user, nên độ trễ không tăng theo tổng số tin nhắn.
+
+Giới hạn theo thời gian: chỉ MESSAGE_SEARCH_MAX_CANDIDATES tin nhắn khớp MỚI NHẤT
+được xếp hạng rồi phân trang; tin cũ hơn không bao giờ xuất hiện trong kết quả
+(API trả `truncated: true` khi điều này xảy ra). Sắp xếp theo createdAt dùng được
+index khi số room nhỏ (MongoDB gộp các khoảng roomId), với rất nhiều room thì là
+sort trong bộ nhớ nhưng chỉ giữ top-k nhờ limit.
+"""
+import hashlib
+import heapq
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+
+from .helpers.auth.config import settings
+from .helpers.pagination import decode_offset_cursor, encode_offset_cursor
+from .helpers.text import tokenize, normalize_text, MIN_PREFIX_LENGTH
+from .mongo import get_mongo_client
+
+# Giới hạn số từ lưu cho mỗi tin nhắn để index không phình với tin nhắn rất dài
+MAX_TERMS_PER_MESSAGE = 200
+MAX_TERM_LENGTH = 40
+
+RESULT_PROJECTION = {"searchTerms": 0, "readBy": 0}
+
+
+def build_message_terms(content: str) -> list:
+    """Các từ khác nhau theo thứ tự xuất hiện, tin nhắn quá dài chỉ index MAX_TERMS_PER_MESSAGE từ đầu."""
+    terms = dict.fromkeys(word[:MAX_TERM_LENGTH] for word in tokenize(content))
+    return list(terms)[:MAX_TERMS_PER_MESSAGE]
+
+
+def query_terms(query: str) -> list:
+    terms = {word[:MAX_TERM_LENGTH] for word in tokenize(query) if len(word) >= MIN_PREFIX_LENGTH}
+    # Từ dài thường hiếm hơn: đặt lên đầu để index scan trên posting list ngắn nhất
+    return sorted(terms, key=lambda term: (-len(term), term))
+
+
+def _rank_key(message: dict, terms: list, normalized_query: str):
+    """Khóa xếp hạng: khớp nguyên cụm > số lần xuất hiện của các từ > mới hơn."""
+    content = normalize_text(message.get("content") or "")
+    words = tokenize(content)
+    phrase = 0 if normalized_query and normalized_query in content else 1
+    frequency = sum(words.count(term) for term in terms)
+    return phrase, -frequency, -message["createdAt"], str(message["_id"])
+
+
+def user_room_ids(user_id) -> list:
+    db = get_mongo_client().Chatapp
+    return [room["_id"] for room in db.rooms.find({"members": ObjectId(user_id)}, {"_id": 1})]
+
+
+def search_messages(user_id, query: str, room_ids: list, cursor: str = None, limit: int = None):
+    """Tìm tin nhắn trong room_ids, trả về (danh sách đã xếp hạng, cursor trang kế tiếp, truncated).
+
+    truncated=True khi có nhiều hơn MESSAGE_SEARCH_MAX_CANDIDATES tin khớp: chỉ các tin
+    mới nhất được xếp hạng.
+    """
+    normalized_query = " ".join(tokenize(query))
+    terms = query_terms(query)
+    if not terms or not room_ids:
+        return [], None, False
+
+    page_size = settings.MESSAGE_SEARCH_PAGE_SIZE
+    limit = min(limit or page_size, page_size)
+    # Cursor gắn với query và tập room đã tìm (dạng hash để cursor luôn ngắn)
+    scope = hashlib.sha1(",".join(sorted(str(room_id) for room_id in room_ids)).encode()).hexdigest()[:16]
+    offset = decode_offset_cursor(cursor, f"{normalized_query}|{scope}") if cursor else 0
+
+    db = get_mongo_client().Chatapp
+    max_candidates = settings.MESSAGE_SEARCH_MAX_CANDIDATES
+    candidates = list(
+        db.messages.find(
+            {"searchTerms": {"$all": terms}, "roomId": {"$in": room_ids}},
+            RESULT_PROJECTION,
+        )
+        .sort([("createdAt", -1)])
+        .limit(max_candidates + 1)
+    )
+    truncated = len(candidates) > max_candidates
+    del candidates[max_candidates:]
+
+    ranked = heapq.nsmallest(
+        offset + limit + 1,
+        candidates,
+        key=lambda message: _rank_key(message, terms, normalized_query),
+    )
+    page = ranked[offset:offset + limit]
+    has_more = len(ranked) > offset + limit
+    next_cursor = encode_offset_cursor(offset + limit, f"{normalized_query}|{scope}") if has_more else None
+    return page, next_cursor, truncated
+
+
+def backfill_message_terms(batch_size: int = 1000) -> int:
+    """Tính searchTerms cho các tin nhắn cũ chưa có (chạy sau khi deploy hoặc đổi tokenizer)."""
+    db = get_mongo_client().Chatapp
+    updated = 0
+    ops = []
+    for message in db.messages.find({"searchTerms": {"$exists": False}}, {"content": 1}).batch_size(batch_size):
+        ops.append(UpdateOne(
+            {"_id": message["_id"]},
+            {"$set": {"searchTerms": build_message_terms(message.get("content") or "")}},
+        ))
+        if len(ops) >= batch_size:
+            updated += db.messages.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.messages.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+messages_cli = AppGroup("messages", help="Quản lý dữ liệu tin nhắn.")
+
+
+@messages_cli.command("reindex-search")
+def reindex_search_command():
+    """Tính searchTerms cho các tin nhắn chưa được index."""
+    click.echo(f"Updated {backfill_message_terms()} messages.")
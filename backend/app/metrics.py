@@ -0,0 +1,248 @@
+"""Metrics trong process, xuất theo định dạng text của Prometheus (không cần thư viện ngoài).
+
+Counter/Gauge/Histogram được khai báo một lần ở module này và tự đăng ký vào
+REGISTRY; GET /metrics (app/api/metrics.py) gọi render(). Trên hot path, mỗi lần
+ghi nhận chỉ là một bisect và vài phép cộng dưới lock của metric đó.
+
+Các module khác chỉ import metric cần dùng, module này không import ngược lại
+(mongo.py, redis_pubsub.py dùng được mà không bị import vòng).
+"""
+import bisect
+import functools
+import threading
+import time
+
+from flask import g, request
+
+from .helpers.auth.config import settings
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        """collector() trả về danh sách dòng text đã định dạng, gọi mỗi lần render."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"ERROR: Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # tuple(label values) -> giá trị
+        REGISTRY.register(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        lines = self._header()
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def set_function(self, function):
+        """Giá trị được đọc từ function() lúc render (gauge không nhãn)."""
+        self._function = function
+
+    def render(self) -> list:
+        if self._function is None:
+            return super().render()
+        return self._header() + [f"{self.name} {self._function()}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues):
+        # bisect_left: giá trị bằng cận trên của bucket được tính vào bucket đó (le)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            values = [(labelvalues, list(counts), total) for labelvalues, (counts, total) in self._values.items()]
+        lines = self._header()
+        for labelvalues, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# --- Metric của app ---
+
+SOCKET_EVENT_DURATION = Histogram(
+    "socketio_event_duration_seconds", "Thời gian xử lý sự kiện Socket.IO.", ("event", "outcome"))
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request HTTP.", ("method", "endpoint", "status"))
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "Thời gian thực thi lệnh MongoDB.", ("command", "outcome"))
+REDIS_PUBLISH_DURATION = Histogram(
+    "redis_publish_duration_seconds", "Từ lúc publish được gọi tới khi Redis nhận message.", ("channel",))
+REDIS_PUBLISH_BATCH_DURATION = Histogram(
+    "redis_publish_batch_duration_seconds", "Thời gian gửi một pipeline publish.")
+REDIS_SUBSCRIBER_LAG = Histogram(
+    "redis_subscriber_lag_seconds", "Từ lúc publish tới khi subscriber nhận message.", ("channel",))
+REDIS_SUBSCRIBER_DISPATCH_DURATION = Histogram(
+    "redis_subscriber_dispatch_duration_seconds", "Thời gian chạy các handler của một message.", ("channel",))
+CONNECTED_SOCKETS = Gauge("socketio_connected_sockets", "Số socket đang kết nối vào node này.")
+CONNECTED_USERS = Gauge("socketio_connected_users", "Số user có ít nhất một socket trên node này.")
+
+
+def timed_socket_event(event: str):
+    """Decorator cho socket handler: ghi thời gian xử lý, outcome lấy từ errorCode của ack."""
+    def decorator(handler):
+        if not settings.METRICS_ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "exception"
+            try:
+                result = handler(*args, **kwargs)
+                outcome = "ok"
+                if isinstance(result, dict) and result.get("status") == "error":
+                    outcome = result.get("errorCode") or "error"
+                return result
+            finally:
+                SOCKET_EVENT_DURATION.observe(time.perf_counter() - started, event, outcome)
+        return wrapper
+    return decorator
+
+
+def _start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        # Dùng rule (vd. /api/room/<room_id>) thay vì path để số nhãn không tăng theo id
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, request.method, endpoint, response.status_code)
+    return response
+
+
+def init_http_metrics(app):
+    if settings.METRICS_ENABLED:
+        app.before_request(_start_request_timer)
+        app.after_request(_observe_request)
+
+
+def _metric_name(*parts) -> str:
+    name = "_".join(str(part) for part in parts)
+    return "".join(char if char.isalnum() or char == "_" else "_" for char in name)
+
+
+def _flatten(prefix: str, stats: dict, gauges, lines: list):
+    for key, value in stats.items():
+        name = _metric_name(prefix, key)
+        if isinstance(value, dict):
+            _flatten(name, value, gauges, lines)
+        elif isinstance(value, bool):
+            lines.extend([f"# TYPE {name} gauge", f"{name} {int(value)}"])
+        elif isinstance(value, (int, float)):
+            if key in gauges:
+                lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+            else:
+                # total_created -> created_total, queued_seconds_total giữ nguyên
+                if key.startswith("total_"):
+                    name = _metric_name(prefix, key[len("total_"):])
+                if not name.endswith("_total"):
+                    name += "_total"
+                lines.extend([f"# TYPE {name} counter", f"{name} {value}"])
+
+
+def register_stats(source: str, get_stats, gauges=()):
+    """Xuất dict thống kê sẵn có (get_*_stats) thành metric chatapp_<source>_<key>.
+
+    Các khóa trong gauges (tên khóa lá, vd. "queue_depth", "size") là mức hiện tại và
+    xuất thành gauge; các số còn lại là bộ đếm chỉ tăng, xuất thành counter có hậu tố
+    _total để rate()/increase() dùng được.
+    """
+    gauges = frozenset(gauges)
+
+    def collect() -> list:
+        lines = []
+        _flatten(_metric_name("chatapp", source), get_stats(), gauges, lines)
+        return lines
+    REGISTRY.register_collector(collect)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
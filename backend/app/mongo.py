@@ -1,12 +1,145 @@
-from pymongo import MongoClient
-from flask import current_app, g
+import threading
+from pymongo import MongoClient, monitoring, uri_parser
+from .helpers.auth.config import settings
+from .metrics import MONGO_COMMAND_DURATION
+
+_mongo_client = None
+_mongo_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Đếm số connection trong pool để theo dõi mức sử dụng."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failed = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.pool_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failed += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "total_created": self.created,
+                "total_closed": self.closed,
+                "total_checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failed,
+                "pool_cleared": self.pool_cleared,
+            }
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Ghi thời gian của từng lệnh MongoDB (pymongo đã đo sẵn duration_micros)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+_pool_stats = PoolStatsListener()
+
+
+def _pool_options(uri: str) -> dict:
+    """Các option mặc định của pool, bỏ qua những option đã khai báo trong URI."""
+    defaults = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGODB_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    }
+    uri_options = {k.lower() for k in uri_parser.parse_uri(uri)["options"]}
+    return {k: v for k, v in defaults.items() if k.lower() not in uri_options}
+
+
+def init_mongo() -> MongoClient:
+    """Khởi tạo MongoClient dùng chung cho toàn bộ process (thread/greenlet-safe)."""
+    global _mongo_client
+    with _mongo_lock:
+        if _mongo_client is None:
+            uri = settings.MONGODB_URI
+            print(f"Connecting to MongoDB at {uri}")
+            # MongoClient không mở kết nối ngay, pool được tạo lazily và tự reconnect
+            _mongo_client = MongoClient(
+                uri,
+                event_listeners=[_pool_stats, CommandMetricsListener()] if settings.METRICS_ENABLED else [_pool_stats],
+                **_pool_options(uri),
+            )
+    return _mongo_client
+
 
 def get_mongo_client() -> MongoClient:
-    if "mongo_client" not in g:
-        g.mongo_client = MongoClient('mongodb://127.0.0.1:27017/')
-    return g.mongo_client
-
-def close_mongo_client(e=None):
-    client = g.pop("mongo_client", None)
-    if client:
-        client.close()
+    """Lấy MongoClient dùng chung, tạo mới nếu chưa có."""
+    if _mongo_client is None:
+        return init_mongo()
+    return _mongo_client
+
+
+def shutdown_mongo():
+    """Đóng MongoClient khi shutdown server."""
+    global _mongo_client
+    with _mongo_lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+            _mongo_client = None
+
+
+def get_mongo_pool_stats() -> dict:
+    """Thống kê mức sử dụng connection pool."""
+    stats = _pool_stats.snapshot()
+    stats["max_pool_size"] = _mongo_client.options.pool_options.max_pool_size if _mongo_client else None
+    return stats
@@ -0,0 +1,243 @@
+"""Presence (online/offline) cho cả cluster, hỗ trợ nhiều thiết bị/tab cho một user.
+
+Trong mỗi process có hai index: user_id -> tập sid và sid -> user_id (tra cứu O(1)
+khi disconnect). Trạng thái toàn cluster nằm trong Redis:
+
+- presence:user:<user_id>        ZSET "<node>|<sid>" với score là thời điểm hết hạn
+- presence:node:<node>           key heartbeat của node (có TTL)
+- presence:node_sessions:<node>  SET "<user_id>|<sid>" của node, dùng để dọn khi node chết
+- presence:nodes                 SET các node đang biết
+
+Mỗi node gia hạn session của mình theo chu kỳ heartbeat. Session của node bị crash
+tự hết hạn theo TTL, và node còn sống sẽ dọn dẹp + phát user_offline. Node chỉ bị
+treo lâu hơn TTL (hoặc Redis mất dữ liệu) rồi chạy tiếp sẽ tự đăng ký lại các
+session của mình và phát lại user_online.
+"""
+import threading
+import time
+from datetime import datetime
+
+from .constants import REDIS_CHANNELS
+from .fanout import broadcast
+from .helpers.auth.config import settings
+from .membership import get_membership
+from .metrics import CONNECTED_SOCKETS, CONNECTED_USERS
+from .redis import get_redis
+
+USER_KEY = "presence:user:{}"
+NODE_KEY = "presence:node:{}"
+NODE_SESSIONS_KEY = "presence:node_sessions:{}"
+NODES_KEY = "presence:nodes"
+SWEEP_LOCK_KEY = "presence:sweep_lock"
+
+
+class PresenceService:
+    def __init__(self, node_id: str, session_ttl: int, heartbeat_interval: int):
+        self.node_id = node_id
+        self.session_ttl = session_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self._user_sids = {}
+        self._sid_user = {}
+        self._registered = False  # Đã có ít nhất một heartbeat thành công
+
+    # --- Index trong process ---
+
+    def user_of(self, sid: str):
+        return self._sid_user.get(sid)
+
+    def local_sids(self, user_id: str) -> set:
+        return set(self._user_sids.get(user_id, ()))
+
+    def local_users(self) -> list:
+        return list(self._user_sids)
+
+    def local_session_count(self) -> int:
+        return len(self._sid_user)
+
+    def local_user_count(self) -> int:
+        return len(self._user_sids)
+
+    def _member(self, sid: str) -> str:
+        return f"{self.node_id}|{sid}"
+
+    def add_session(self, user_id: str, sid: str) -> bool:
+        """Ghi nhận một socket mới. Trả về True nếu user vừa chuyển sang online."""
+        with self._lock:
+            self._sid_user[sid] = user_id
+            sids = self._user_sids.setdefault(user_id, set())
+            sids.add(sid)
+            first_local = len(sids) == 1
+
+        redis_client = get_redis()
+        if not redis_client:
+            return first_local
+        try:
+            now = time.time()
+            key = USER_KEY.format(user_id)
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {self._member(sid): now + self.session_ttl})
+            pipe.zcard(key)
+            pipe.expire(key, self.session_ttl * 2)
+            pipe.sadd(NODE_SESSIONS_KEY.format(self.node_id), f"{user_id}|{sid}")
+            results = pipe.execute()
+            return results[2] == 1
+        except Exception as e:
+            print(f"ERROR: Presence add_session failed for user {user_id}: {e}")
+            return first_local
+
+    def remove_session(self, sid: str):
+        """Xóa socket khi disconnect. Trả về (user_id, True nếu user vừa offline)."""
+        with self._lock:
+            user_id = self._sid_user.pop(sid, None)
+            if user_id is None:
+                return None, False
+            sids = self._user_sids.get(user_id, set())
+            sids.discard(sid)
+            last_local = not sids
+            if last_local:
+                self._user_sids.pop(user_id, None)
+
+        redis_client = get_redis()
+        if not redis_client:
+            return user_id, last_local
+        try:
+            now = time.time()
+            key = USER_KEY.format(user_id)
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.zrem(key, self._member(sid))
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            pipe.srem(NODE_SESSIONS_KEY.format(self.node_id), f"{user_id}|{sid}")
+            results = pipe.execute()
+            return user_id, results[2] == 0
+        except Exception as e:
+            print(f"ERROR: Presence remove_session failed for user {user_id}: {e}")
+            return user_id, last_local
+
+    # --- Truy vấn toàn cluster ---
+
+    def online_status(self, user_ids: list) -> dict:
+        """Trả về {user_id: True/False} cho nhiều user bằng một round trip Redis."""
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        if not user_ids:
+            return {}
+        redis_client = get_redis()
+        if not redis_client:
+            return {user_id: user_id in self._user_sids for user_id in user_ids}
+        try:
+            now = time.time()
+            pipe = redis_client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.zcount(USER_KEY.format(user_id), now, "+inf")
+            counts = pipe.execute()
+            return {user_id: count > 0 for user_id, count in zip(user_ids, counts)}
+        except Exception as e:
+            print(f"ERROR: Presence query failed: {e}")
+            return {user_id: user_id in self._user_sids for user_id in user_ids}
+
+    # --- Heartbeat và dọn dẹp node chết ---
+
+    def heartbeat(self):
+        """Gia hạn key của node và toàn bộ session đang kết nối vào node này."""
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        now = time.time()
+        with self._lock:
+            sessions = [(user_id, sid) for sid, user_id in self._sid_user.items()]
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(NODE_KEY.format(self.node_id))
+        pipe.set(NODE_KEY.format(self.node_id), now, ex=self.session_ttl)
+        pipe.sadd(NODES_KEY, self.node_id)
+        for user_id, sid in sessions:
+            key = USER_KEY.format(user_id)
+            pipe.zadd(key, {self._member(sid): now + self.session_ttl})
+            pipe.expire(key, self.session_ttl * 2)
+        node_alive, _, node_added = pipe.execute()[:3]
+
+        if not node_alive and sessions:
+            # Key heartbeat đã hết hạn: node khác có thể đã dọn node_sessions, ghi lại để
+            # lần dọn sau (nếu node này chết thật) vẫn tìm thấy các session
+            redis_client.sadd(NODE_SESSIONS_KEY.format(self.node_id), *[f"{user_id}|{sid}" for user_id, sid in sessions])
+        if node_added and self._registered:
+            # Node đã bị xóa khỏi presence:nodes, tức là sweeper đã phát user_offline cho các user ở đây
+            print(f"Presence: node {self.node_id} was swept, re-registered {len(sessions)} sessions")
+            for user_id in {user_id for user_id, _ in sessions}:
+                publish_user_status('user_online', user_id)
+        self._registered = True
+
+    def sweep_dead_nodes(self):
+        """Dọn session của các node không còn heartbeat và phát user_offline nếu cần."""
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        # Chỉ một node dọn dẹp trong mỗi chu kỳ
+        if not redis_client.set(SWEEP_LOCK_KEY, self.node_id, nx=True, ex=self.heartbeat_interval):
+            return
+        now = time.time()
+        for node_id in redis_client.smembers(NODES_KEY):
+            if node_id == self.node_id or redis_client.exists(NODE_KEY.format(node_id)):
+                continue
+            sessions_key = NODE_SESSIONS_KEY.format(node_id)
+            for session in redis_client.smembers(sessions_key):
+                user_id, sid = session.split("|", 1)
+                key = USER_KEY.format(user_id)
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.zrem(key, f"{node_id}|{sid}")
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.zcard(key)
+                _, _, remaining = pipe.execute()
+                if remaining == 0:
+                    publish_user_status('user_offline', user_id)
+            redis_client.delete(sessions_key)
+            redis_client.srem(NODES_KEY, node_id)
+            print(f"Presence: cleaned up sessions of dead node {node_id}")
+
+    def run(self):
+        while True:
+            try:
+                self.heartbeat()
+                self.sweep_dead_nodes()
+            except Exception as e:
+                print(f"ERROR: Presence heartbeat failed: {e}")
+            time.sleep(self.heartbeat_interval)
+
+
+def publish_user_status(event_type: str, user_id: str):
+    """Phát trạng thái online/offline, chỉ tới những user có chung room (recipients)."""
+    try:
+        recipients = sorted(get_membership().contacts_of(user_id))
+    except Exception as e:
+        print(f"ERROR: Cannot resolve contacts of user {user_id}: {e}")
+        return False
+    if not recipients:
+        return True
+    return broadcast(REDIS_CHANNELS['USER_STATUS'], event_type, {
+        'user_id': user_id,
+        'timestamp': datetime.now().isoformat(),
+        'recipients': recipients,
+    })
+
+
+_presence = None
+
+
+def get_presence() -> PresenceService:
+    global _presence
+    if _presence is None:
+        _presence = PresenceService(
+            node_id=settings.NODE_ID,
+            session_ttl=settings.PRESENCE_SESSION_TTL,
+            heartbeat_interval=settings.PRESENCE_HEARTBEAT_INTERVAL,
+        )
+    return _presence
+
+
+def init_presence(socketio):
+    presence = get_presence()
+    CONNECTED_SOCKETS.set_function(presence.local_session_count)
+    CONNECTED_USERS.set_function(presence.local_user_count)
+    socketio.start_background_task(presence.run)
+    return presence
@@ -0,0 +1,231 @@
+"""Giới hạn tốc độ sự kiện socket theo từng kết nối (sid) và từng user.
+
+Mỗi loại sự kiện có một token bucket (rate sự kiện/giây, burst) cho mỗi sid, và
+một bucket lớn hơn RATE_LIMIT_USER_FACTOR lần cho mỗi user (gộp mọi tab/thiết bị
+của user trên node này). Khi hết token:
+
+- thiếu ít (phải chờ <= RATE_LIMIT_MAX_DELAY_MS): sự kiện được hoãn lại cho tới khi đủ token;
+- thiếu nhiều: sự kiện bị bỏ, client nhận ack RATE_LIMITED và sự kiện `rate_limited`
+  (tối đa một lần mỗi RATE_LIMIT_NOTIFY_INTERVAL_MS cho mỗi sid).
+
+Ngoài ra mỗi sid chỉ có tối đa RATE_LIMIT_MAX_INFLIGHT sự kiện đang xử lý (kể cả
+đang bị hoãn), nên một client không thể giữ nhiều green thread chờ ingest/Redis.
+Bucket nằm trong bộ nhớ process, không thêm round-trip Redis cho mỗi sự kiện.
+"""
+import functools
+import threading
+import time
+
+from flask import request
+
+from .fanout import emit_local
+from .helpers.auth.config import settings
+from .presence import get_presence
+
+
+class RateLimitedError(Exception):
+    def __init__(self, event: str, scope: str, retry_after: float):
+        super().__init__(f"Rate limited: {event} ({scope})")
+        self.event = event
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Số giây cần chờ để có 1 token (token có thể âm khi đã có sự kiện đang chờ)."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict, user_factor: float, max_delay: float,
+                 max_inflight: int, notify_interval: float, enabled: bool = True):
+        self.limits = limits  # event -> (rate, burst)
+        self.user_factor = user_factor
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+        self.notify_interval = notify_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # scope ("sid" | "user") -> id -> {event: TokenBucket}, forget_sid chỉ là một lần pop
+        self._buckets = {"sid": {}, "user": {}}
+        self._inflight = {}  # sid -> số sự kiện đang xử lý
+        self._notified = {}  # sid -> thời điểm gửi rate_limited gần nhất
+        self.stats = {event: {"allowed": 0, "delayed": 0, "rejected": 0} for event in limits}
+        self.stats["inflight_rejected"] = 0
+
+    def acquire(self, event: str, sid: str, user_id: str = None) -> float:
+        """Lấy 1 token ở bucket của sid và của user. Trả về số giây phải hoãn, raise RateLimitedError nếu bị bỏ."""
+        limit = self.limits.get(event)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        scopes = [("sid", sid, rate, burst)]
+        if user_id:
+            scopes.append(("user", user_id, rate * self.user_factor, burst * self.user_factor))
+
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            wait = 0.0
+            for scope, key, scope_rate, scope_burst in scopes:
+                events = self._buckets[scope].setdefault(key, {})
+                bucket = events.get(event)
+                if bucket is None:
+                    bucket = events[event] = TokenBucket(scope_rate, scope_burst, now)
+                bucket.refill(now)
+                scope_wait = bucket.wait_time()
+                if scope_wait > self.max_delay:
+                    self.stats[event]["rejected"] += 1
+                    raise RateLimitedError(event, scope, scope_wait)
+                buckets.append(bucket)
+                wait = max(wait, scope_wait)
+            # Chỉ trừ token khi mọi bucket đều cho phép
+            for bucket in buckets:
+                bucket.tokens -= 1
+            self.stats[event]["delayed" if wait > 0 else "allowed"] += 1
+        return wait
+
+    def _enter(self, event: str, sid: str):
+        with self._lock:
+            count = self._inflight.get(sid, 0)
+            if count >= self.max_inflight:
+                self.stats["inflight_rejected"] += 1
+                raise RateLimitedError(event, "inflight", self.max_delay)
+            self._inflight[sid] = count + 1
+
+    def _leave(self, sid: str):
+        with self._lock:
+            count = self._inflight.get(sid, 0) - 1
+            if count > 0:
+                self._inflight[sid] = count
+            else:
+                self._inflight.pop(sid, None)
+
+    def _should_notify(self, sid: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._notified.get(sid, float("-inf")) < self.notify_interval:
+                return False
+            self._notified[sid] = now
+            return True
+
+    def limit(self, event: str):
+        """Decorator cho socket handler: áp dụng bucket của `event` và giới hạn in-flight."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return handler(*args, **kwargs)
+                sid = request.sid
+                try:
+                    self._enter(event, sid)
+                except RateLimitedError as e:
+                    return self._reject(sid, e)
+                try:
+                    try:
+                        wait = self.acquire(event, sid, get_presence().user_of(sid))
+                    except RateLimitedError as e:
+                        return self._reject(sid, e)
+                    if wait:
+                        time.sleep(wait)
+                    return handler(*args, **kwargs)
+                finally:
+                    self._leave(sid)
+            return wrapper
+        return decorator
+
+    def _reject(self, sid: str, error: RateLimitedError) -> dict:
+        retry_after_ms = int(error.retry_after * 1000) + 1
+        if self._should_notify(sid):
+            emit_local('rate_limited', {
+                'event': error.event,
+                'scope': error.scope,
+                'retryAfterMs': retry_after_ms,
+            }, room=sid)
+        return {'status': 'error', 'errorCode': 'RATE_LIMITED', 'retryAfterMs': retry_after_ms}
+
+    def forget_sid(self, sid: str):
+        """Socket đóng: xóa các bucket theo sid (bucket theo user được giữ tới khi đầy lại)."""
+        with self._lock:
+            self._notified.pop(sid, None)
+            self._buckets["sid"].pop(sid, None)
+
+    def sweep(self):
+        """Xóa bucket đã đầy lại (tương đương bucket mới), giữ bộ nhớ tỉ lệ với client đang hoạt động."""
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            for owners in self._buckets.values():
+                for key, events in list(owners.items()):
+                    for event, bucket in list(events.items()):
+                        if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                            del events[event]
+                            removed += 1
+                    if not events:
+                        del owners[key]
+            for sid in [sid for sid, at in self._notified.items() if now - at >= self.notify_interval]:
+                del self._notified[sid]
+        return removed
+
+    def run(self, interval: float = 60):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"ERROR: Rate limiter sweep failed: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "buckets": sum(len(events) for owners in self._buckets.values() for events in owners.values()),
+                "inflight": sum(self._inflight.values()),
+                **{key: dict(value) if isinstance(value, dict) else value for key, value in self.stats.items()},
+            }
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(
+            limits={
+                "message": (settings.RATE_LIMIT_MESSAGE_RATE, settings.RATE_LIMIT_MESSAGE_BURST),
+                "typing": (settings.RATE_LIMIT_TYPING_RATE, settings.RATE_LIMIT_TYPING_BURST),
+                "read_message": (settings.RATE_LIMIT_READ_RATE, settings.RATE_LIMIT_READ_BURST),
+                "subscribe_room": (settings.RATE_LIMIT_SUBSCRIBE_RATE, settings.RATE_LIMIT_SUBSCRIBE_BURST),
+            },
+            user_factor=settings.RATE_LIMIT_USER_FACTOR,
+            max_delay=settings.RATE_LIMIT_MAX_DELAY_MS / 1000,
+            max_inflight=settings.RATE_LIMIT_MAX_INFLIGHT,
+            notify_interval=settings.RATE_LIMIT_NOTIFY_INTERVAL_MS / 1000,
+            enabled=settings.RATE_LIMIT_ENABLED,
+        )
+    return _limiter
+
+
+def get_rate_limit_stats() -> dict:
+    return get_rate_limiter().get_stats()
+
+
+def init_rate_limiter(socketio):
+    limiter = get_rate_limiter()
+    if limiter.enabled:
+        socketio.start_background_task(limiter.run)
+    return limiter
@@ -0,0 +1,156 @@
+"""Đánh dấu đã đọc bằng watermark theo (room, user).
+
+Thay vì thêm user vào mảng `readBy` của từng tin nhắn, mỗi cặp (room, user) có
+một document trong `read_receipts` lưu tin nhắn mới nhất đã đọc
+(lastReadAt, lastReadId). Mọi tin nhắn có (createdAt, _id) <= watermark được
+coi là đã đọc, nên đọc hết 1.000 tin nhắn chỉ tốn một lần ghi. Watermark chỉ
+tiến lên, không bao giờ lùi.
+"""
+import bisect
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+
+from .mongo import get_mongo_client
+
+
+def _watermark_update(created_at: float, message_id: ObjectId) -> list:
+    """Pipeline update chỉ tiến watermark nếu (created_at, message_id) mới hơn."""
+    newer = {"$or": [
+        {"$lt": ["$lastReadAt", created_at]},
+        {"$and": [
+            {"$eq": ["$lastReadAt", created_at]},
+            {"$lt": ["$lastReadId", message_id]},
+        ]},
+    ]}
+    return [{"$set": {
+        "lastReadAt": {"$cond": [newer, created_at, "$lastReadAt"]},
+        "lastReadId": {"$cond": [newer, message_id, "$lastReadId"]},
+    }}]
+
+
+def advance_watermark(room_id, user_id, created_at: float, message_id) -> bool:
+    """Đánh dấu mọi tin nhắn tới message_id là đã đọc. Trả về True nếu watermark tiến lên."""
+    db = get_mongo_client().Chatapp
+    result = db.read_receipts.update_one(
+        {"roomId": ObjectId(room_id), "userId": ObjectId(user_id)},
+        _watermark_update(created_at, ObjectId(message_id)),
+        upsert=True,
+    )
+    return bool(result.modified_count or result.upserted_id)
+
+
+def mark_message_read(room_id, user_id, message_id):
+    """Đánh dấu đã đọc tới một tin nhắn. Trả về (message, advanced), message là None nếu không tồn tại."""
+    db = get_mongo_client().Chatapp
+    query = {"_id": ObjectId(message_id)}
+    if room_id:
+        query["roomId"] = ObjectId(room_id)
+    message = db.messages.find_one(query, {"roomId": 1, "createdAt": 1})
+    if not message:
+        return None, False
+    advanced = advance_watermark(message["roomId"], user_id, message["createdAt"], message["_id"])
+    return message, advanced
+
+
+def mark_room_read(room_id, user_id):
+    """Đánh dấu toàn bộ room là đã đọc. Trả về (tin nhắn mới nhất, advanced)."""
+    db = get_mongo_client().Chatapp
+    latest = db.messages.find_one(
+        {"roomId": ObjectId(room_id)},
+        {"roomId": 1, "createdAt": 1},
+        sort=[("createdAt", -1), ("_id", -1)],
+    )
+    if not latest:
+        return None, False
+    return latest, advance_watermark(room_id, user_id, latest["createdAt"], latest["_id"])
+
+
+def get_room_watermarks(room_id) -> list:
+    """Danh sách ((lastReadAt, lastReadId), user_id) của room, đã sắp xếp."""
+    db = get_mongo_client().Chatapp
+    receipts = db.read_receipts.find(
+        {"roomId": ObjectId(room_id)},
+        {"userId": 1, "lastReadAt": 1, "lastReadId": 1},
+    )
+    return sorted(
+        ((receipt["lastReadAt"], receipt["lastReadId"]), str(receipt["userId"]))
+        for receipt in receipts
+        if receipt.get("lastReadAt") is not None
+    )
+
+
+def attach_read_state(room_id, messages: list) -> list:
+    """Tính readBy/readCount cho một trang tin nhắn từ watermark (một query cho cả trang)."""
+    watermarks = get_room_watermarks(room_id)
+    keys = [key for key, _ in watermarks]
+    for message in messages:
+        start = bisect.bisect_left(keys, (message["createdAt"], message["_id"]))
+        message["readBy"] = [user_id for _, user_id in watermarks[start:]]
+        message["readCount"] = len(watermarks) - start
+    return messages
+
+
+def advance_sender_watermarks(messages: list):
+    """Listener của ingest pipeline: người gửi đã đọc tin nhắn của chính mình.
+
+    Gom theo (room, sender) và chỉ ghi tin nhắn mới nhất, một bulk_write cho cả batch.
+    """
+    latest = {}
+    for message in messages:
+        key = (message["roomId"], message["senderId"])
+        current = latest.get(key)
+        if current is None or (message["createdAt"], message["_id"]) > (current["createdAt"], current["_id"]):
+            latest[key] = message
+    if not latest:
+        return
+    db = get_mongo_client().Chatapp
+    db.read_receipts.bulk_write([
+        UpdateOne(
+            {"roomId": room_id, "userId": sender_id},
+            _watermark_update(message["createdAt"], message["_id"]),
+            upsert=True,
+        )
+        for (room_id, sender_id), message in latest.items()
+    ], ordered=False)
+
+
+def init_read_receipts(ingestor):
+    ingestor.add_listener(advance_sender_watermarks)
+
+
+def backfill_read_receipts() -> int:
+    """Chuyển dữ liệu readBy cũ sang watermark (tin nhắn mới nhất mỗi user đã đọc trong room)."""
+    db = get_mongo_client().Chatapp
+    pipeline = [
+        {"$match": {"readBy.0": {"$exists": True}}},
+        {"$unwind": "$readBy"},
+        {"$group": {
+            "_id": {"roomId": "$roomId", "userId": {"$toString": "$readBy"}},
+            "last": {"$max": {"at": "$createdAt", "id": "$_id"}},
+        }},
+    ]
+    ops = []
+    for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+        user_id = row["_id"]["userId"]
+        if not ObjectId.is_valid(user_id):
+            continue
+        ops.append(UpdateOne(
+            {"roomId": row["_id"]["roomId"], "userId": ObjectId(user_id)},
+            _watermark_update(row["last"]["at"], row["last"]["id"]),
+            upsert=True,
+        ))
+    if not ops:
+        return 0
+    result = db.read_receipts.bulk_write(ops, ordered=False)
+    return result.modified_count + result.upserted_count
+
+
+receipts_cli = AppGroup("receipts", help="Quản lý watermark đã đọc.")
+
+
+@receipts_cli.command("backfill")
+def backfill_command():
+    """Tạo watermark từ mảng readBy của các tin nhắn cũ."""
+    click.echo(f"Updated {backfill_read_receipts()} read receipts.")
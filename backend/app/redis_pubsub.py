@@ -1,154 +1,302 @@
 # redis_pubsub.py
+import collections
 import json
 import redis
+import queue
 import threading
 import time
-from flask import current_app
 from .redis import get_redis, init_redis
+from .helpers.auth.config import settings
+from .metrics import (
+    REDIS_PUBLISH_BATCH_DURATION,
+    REDIS_PUBLISH_DURATION,
+    REDIS_SUBSCRIBER_DISPATCH_DURATION,
+    REDIS_SUBSCRIBER_LAG,
+)
 
-def ensure_redis_connection():
-    """Đảm bảo Redis connection còn sống, nếu không thì reconnect"""
-    redis_client = get_redis()
-    try:
-        if redis_client:
-            redis_client.ping()
-            return redis_client
-    except:
-        print("Redis connection lost, attempting to reconnect...")
-        init_redis()
+class RedisPublisher:
+    """Gom các publish từ nhiều handler và gửi theo batch bằng pipeline.
+
+    Handler chỉ đẩy message vào queue trong bộ nhớ (không chờ Redis). Một green
+    thread gửi các batch bằng pipeline và tự reconnect khi mất kết nối, nên lỗi
+    Redis không làm nghẽn event loop của socket.
+    """
+
+    def __init__(self, max_queue: int, max_batch: int, linger: float):
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        self._started = False
+        self.stats = {
+            "enqueued": 0,
+            "published": 0,
+            "batches": 0,
+            "dropped": 0,
+            "errors": 0,
+        }
+
+    def publish(self, channel: str, data: dict) -> bool:
+        # ts dùng để subscriber đo độ trễ (lag) của message
+        message = json.dumps(dict(data, ts=time.time()))
+        if not self._started:
+            return self._publish_now(channel, message)
+        if len(self._queue) >= self.max_queue:
+            self.stats["dropped"] += 1
+            print(f"ERROR: Publish queue is full, dropping event for channel '{channel}'")
+            return False
+        self._queue.append((channel, message, time.perf_counter()))
+        self.stats["enqueued"] += 1
+        self._wakeup.set()
+        return True
+
+    def _publish_now(self, channel: str, message: str) -> bool:
+        """Publish đồng bộ, chỉ dùng khi publisher chưa chạy (vd: lệnh CLI)."""
         redis_client = get_redis()
-        if redis_client:
-            try:
-                redis_client.ping()
-                print("Redis reconnected successfully")
-                return redis_client
-            except:
-                pass
-    return None
-
-def get_redis_pubsub_client():
-    """Lấy Redis Pub/Sub client (khác với client Redis thông thường)."""
-    redis_client = get_redis() # Sử dụng hàm get_redis() đã có để lấy Redis client
-    if redis_client:
-        return redis_client.pubsub() # Tạo Pub/Sub instance từ Redis client thông thường
-    else:
-        return None
-
-def publish_event(channel: str, data: dict, max_retries=3):
-    """Publish một sự kiện lên kênh Redis Pub/Sub với retry mechanism."""
-    retries = 0
-    while retries < max_retries:
-        redis_client = ensure_redis_connection()
         if not redis_client:
-            print(f"ERROR: Redis client not available, retry {retries + 1}/{max_retries}")
-            retries += 1
-            time.sleep(1)  # Đợi 1 giây trước khi thử lại
-            continue
-
+            print(f"ERROR: Redis client not available, cannot publish to '{channel}'")
+            return False
         try:
-            message = json.dumps(data)
+            started = time.perf_counter()
             redis_client.publish(channel, message)
-            print(f"Published event to channel '{channel}': {data}")
+            if settings.METRICS_ENABLED:
+                REDIS_PUBLISH_DURATION.observe(time.perf_counter() - started, channel)
+            self.stats["published"] += 1
             return True
-        except redis.exceptions.ConnectionError as e:
-            print(f"ERROR: Redis connection error (retry {retries + 1}/{max_retries}): {e}")
-            retries += 1
-            time.sleep(1)
         except Exception as e:
-            print(f"ERROR: Unexpected error while publishing: {e}")
-            retries += 1
-            time.sleep(1)
+            self.stats["errors"] += 1
+            print(f"ERROR: Failed to publish to channel '{channel}': {e}")
+            return False
 
-    print(f"ERROR: Failed to publish after {max_retries} retries")
-    return False
+    def start(self, socketio):
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(self._run)
 
-def subscribe_channel(channel: str, handler_function):
-    """Subscribe vào kênh Redis Pub/Sub và xử lý sự kiện bằng handler_function."""
-    pubsub_client = get_redis_pubsub_client()
-    if not pubsub_client:
-        print(f"ERROR: Cannot subscribe to channel '{channel}'.")
-        return False
+    def _take_batch(self) -> list:
+        batch = []
+        while self._queue and len(batch) < self.max_batch:
+            batch.append(self._queue.popleft())
+        return batch
 
-    try:
-        pubsub_client.subscribe(channel)
-        print(f"Subscribed to channel '{channel}'.")
-
-        for message in pubsub_client.listen():
-            if message['type'] == 'message':
-                channel_name = message['channel'].decode('utf-8')
-                message_data = message['data'].decode('utf-8')
+    def _run(self):
+        backoff = 0.5
+        while True:
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            # Nhường CPU một chút để gom thêm publish từ các handler đang chạy song song
+            time.sleep(self.linger)
 
+            while self._queue:
+                batch = self._take_batch()
                 try:
-                    # Parse JSON message
-                    event_data = json.loads(message_data)
-                    handler_function(event_data)
-                except json.JSONDecodeError as e:
-                    print(f"ERROR: Invalid JSON data from channel '{channel_name}': {e}")
+                    redis_client = get_redis()
+                    if not redis_client:
+                        raise redis.exceptions.ConnectionError("Redis client not available")
+                    pipe = redis_client.pipeline(transaction=False)
+                    for channel, message, _ in batch:
+                        pipe.publish(channel, message)
+                    started = time.perf_counter()
+                    pipe.execute()
+                    if settings.METRICS_ENABLED:
+                        sent_at = time.perf_counter()
+                        REDIS_PUBLISH_BATCH_DURATION.observe(sent_at - started)
+                        for channel, _, enqueued_at in batch:
+                            REDIS_PUBLISH_DURATION.observe(sent_at - enqueued_at, channel)
+                    self.stats["published"] += len(batch)
+                    self.stats["batches"] += 1
+                    backoff = 0.5
+                except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
+                    # Giữ lại batch để gửi lại sau khi reconnect (timeout cũng thường là Redis
+                    # bị nghẽn/mất kết nối, lỗi khác như ResponseError thì gửi lại cũng không qua)
+                    self._queue.extendleft(reversed(batch))
+                    self.stats["errors"] += 1
+                    print(f"ERROR: Redis publish failed, retrying in {backoff}s: {e}")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 10)
+                    if get_redis() is None:
+                        init_redis()
+                    break
                 except Exception as e:
-                    print(f"ERROR: Error processing message from channel '{channel_name}': {e}")
-
-    except redis.exceptions.ConnectionError as e:
-        print(f"ERROR: Redis connection error for channel '{channel}': {e}")
-        return False
-    except Exception as e:
-        print(f"ERROR: Unexpected error for channel '{channel}': {e}")
-        return False
-    finally:
-        if pubsub_client:
-            pubsub_client.unsubscribe(channel)
-            print(f"Unsubscribed from channel '{channel}'.")
-
-def subscribe_in_background(channel: str, handler_function, socketio):
-    """Chạy Redis subscription trong một thread riêng với auto-reconnect"""
-    def run_subscription():
+                    self.stats["errors"] += 1
+                    print(f"ERROR: Unexpected error while publishing batch: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["queue_depth"] = len(self._queue)
+        return stats
+
+
+_publisher = RedisPublisher(
+    max_queue=settings.REDIS_PUBLISH_QUEUE_SIZE,
+    max_batch=settings.REDIS_PUBLISH_BATCH_SIZE,
+    linger=settings.REDIS_PUBLISH_LINGER_MS / 1000,
+)
+
+
+def publish_event(channel: str, data: dict) -> bool:
+    """Publish một sự kiện lên kênh Redis Pub/Sub (không chặn, gửi theo batch)."""
+    return _publisher.publish(channel, data)
+
+
+def start_publisher(socketio):
+    _publisher.start(socketio)
+
+
+def get_publisher_stats() -> dict:
+    return _publisher.get_stats()
+
+
+class RedisSubscriber:
+    """Một kết nối Pub/Sub duy nhất cho cả process, dispatch theo bảng routing channel -> handlers.
+
+    Reader green thread đọc message từ Redis và đẩy vào queue, dispatcher green
+    thread lấy ra và gọi handler. Channel mới chỉ cần đăng ký qua register().
+    """
+
+    def __init__(self, queue_size: int):
+        self._handlers = {}
+        self._pending_channels = set()
+        self._subscribed = set()
+        self._subscribed_changed = threading.Condition()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._started = False
+        self._lock = threading.Lock()
+        self.stats = {
+            "received": 0,
+            "dispatched": 0,
+            "errors": 0,
+            "reconnects": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "avg_lag_ms": 0.0,
+        }
+
+    def register(self, channel: str, handler_function):
+        """Đăng ký handler cho một channel (có thể gọi cả khi subscriber đang chạy)."""
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler_function)
+            self._pending_channels.add(channel)
+
+    def channels(self) -> list:
+        return list(self._handlers)
+
+    def start(self, socketio):
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(self._read_loop)
+        socketio.start_background_task(self._dispatch_loop)
+
+    def _subscribe_pending(self, pubsub_client, resubscribe_all=False):
+        with self._lock:
+            channels = list(self._handlers) if resubscribe_all else list(self._pending_channels)
+            self._pending_channels.clear()
+        if channels:
+            pubsub_client.subscribe(*channels)
+            print(f"Subscribed to channels {channels}")
+            with self._subscribed_changed:
+                self._subscribed.update(channels)
+                self._subscribed_changed.notify_all()
+
+    def wait_subscribed(self, channel: str, timeout: float) -> bool:
+        """Chờ tới khi channel đã được subscribe (ít nhất một lần), False nếu hết timeout."""
+        with self._subscribed_changed:
+            return self._subscribed_changed.wait_for(lambda: channel in self._subscribed, timeout)
+
+    def _read_loop(self):
+        backoff = 1
         while True:
             pubsub_client = None
             try:
-                redis_client = ensure_redis_connection()
+                redis_client = get_redis()
                 if not redis_client:
-                    print(f"ERROR: Cannot connect to Redis, retrying in 5 seconds...")
-                    time.sleep(5)
-                    continue
-
-                pubsub_client = redis_client.pubsub()
-                pubsub_client.subscribe(channel)
-                print(f"Successfully subscribed to channel '{channel}'")
-
-                for message in pubsub_client.listen():
-                    if message['type'] == 'message':
-                        try:
-                            channel_name = message['channel']
-                            message_data = message['data']
-
-                            event_data = json.loads(message_data) if isinstance(message_data, str) else message_data
-                            print(f"Received message on channel {channel}: {event_data}")
-
-                            # Không cần app context vì chúng ta sử dụng socketio trực tiếp
-                            handler_function(event_data)
-                            print(f"Successfully processed message")
-
-                        except json.JSONDecodeError as e:
-                            print(f"ERROR: Invalid JSON data: {e}")
-                            print(f"Raw message: {message}")
-                        except Exception as e:
-                            print(f"ERROR: Message processing error: {e}")
-                            print(f"Message type: {type(message_data)}")
-                            print(f"Raw message: {message}")
-
-            except redis.exceptions.ConnectionError as e:
-                print(f"ERROR: Redis connection lost: {e}")
+                    raise redis.exceptions.ConnectionError("Redis client not available")
+
+                pubsub_client = redis_client.pubsub(ignore_subscribe_messages=True)
+                self._subscribe_pending(pubsub_client, resubscribe_all=True)
+                backoff = 1
+
+                while True:
+                    if self._pending_channels:
+                        self._subscribe_pending(pubsub_client)
+                    message = pubsub_client.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self.stats["received"] += 1
+                        self._queue.put((message['channel'], message['data'], time.time()))
+
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as e:
+                print(f"ERROR: Redis subscriber connection lost: {e}")
             except Exception as e:
-                print(f"ERROR: Unexpected error: {e}")
+                print(f"ERROR: Redis subscriber unexpected error: {e}")
             finally:
                 if pubsub_client:
                     try:
-                        pubsub_client.unsubscribe(channel)
                         pubsub_client.close()
-                    except:
+                    except Exception:
                         pass
-                print(f"Connection lost. Reconnecting in 5 seconds...")
-                time.sleep(5)
 
-    thread = threading.Thread(target=run_subscription, daemon=True)
-    thread.start()
-    return thread
+            self.stats["reconnects"] += 1
+            print(f"Redis subscriber reconnecting in {backoff} seconds...")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            if get_redis() is None:
+                init_redis()
+
+    def _record_lag(self, channel, published_at, received_at):
+        lag_ms = max(0.0, (received_at - published_at) * 1000)
+        if settings.METRICS_ENABLED:
+            REDIS_SUBSCRIBER_LAG.observe(lag_ms / 1000, channel)
+        self.stats["last_lag_ms"] = lag_ms
+        self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], lag_ms)
+        # Trung bình trượt (EWMA) để không phải lưu toàn bộ lịch sử
+        self.stats["avg_lag_ms"] = self.stats["avg_lag_ms"] * 0.9 + lag_ms * 0.1
+
+    def _dispatch_loop(self):
+        while True:
+            channel, raw_data, received_at = self._queue.get()
+            try:
+                event_data = json.loads(raw_data) if isinstance(raw_data, (str, bytes)) else raw_data
+                if isinstance(event_data, dict) and 'ts' in event_data:
+                    self._record_lag(channel, event_data['ts'], received_at)
+                started = time.perf_counter()
+                for handler_function in self._handlers.get(channel, []):
+                    handler_function(event_data)
+                if settings.METRICS_ENABLED:
+                    REDIS_SUBSCRIBER_DISPATCH_DURATION.observe(time.perf_counter() - started, channel)
+                self.stats["dispatched"] += 1
+            except json.JSONDecodeError as e:
+                self.stats["errors"] += 1
+                print(f"ERROR: Invalid JSON data from channel '{channel}': {e}")
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"ERROR: Error processing message from channel '{channel}': {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["channels"] = self.channels()
+        return stats
+
+
+_subscriber = RedisSubscriber(queue_size=settings.REDIS_SUBSCRIBER_QUEUE_SIZE)
+
+
+def register_channel_handler(channel: str, handler_function):
+    """Đăng ký handler cho channel Redis, dùng chung kết nối subscriber của process."""
+    _subscriber.register(channel, handler_function)
+
+
+def wait_subscribed(channel: str, timeout: float) -> bool:
+    return _subscriber.wait_subscribed(channel, timeout)
+
+
+def start_subscriber(socketio):
+    """Chạy subscriber (reader + dispatcher) dưới dạng green thread."""
+    _subscriber.start(socketio)
+
+
+def get_subscriber_stats() -> dict:
+    return _subscriber.get_stats()
@@ -0,0 +1,68 @@
+"""Denormalize tin nhắn cuối cùng vào document room để sắp xếp theo hoạt động.
+
+Sau mỗi batch được ingest, mỗi room chỉ được cập nhật một lần với tin nhắn mới
+nhất của batch (lastMessage, lastMessageAt, lastMessageSenderId, lastMessageId).
+Điều kiện lastMessageAt < createdAt giữ cho giá trị chỉ tiến lên khi nhiều node
+cùng ghi. Thành viên nhận delta `room_updated` thay vì tải lại danh sách room:
+mỗi room chỉ publish một sự kiện, mỗi node tự tra thành viên (cache membership)
+và gửi tới room cá nhân của các thành viên đang kết nối vào node đó.
+"""
+from pymongo import UpdateOne
+
+from .constants import REDIS_CHANNELS
+from .fanout import broadcast
+from .mongo import get_mongo_client
+
+# Độ dài tối đa của lastMessage lưu trong room (chỉ dùng để hiển thị preview)
+PREVIEW_LENGTH = 200
+
+
+def latest_per_room(messages: list) -> dict:
+    latest = {}
+    for message in messages:
+        current = latest.get(message["roomId"])
+        if current is None or (message["createdAt"], message["_id"]) > (current["createdAt"], current["_id"]):
+            latest[message["roomId"]] = message
+    return latest
+
+
+def activity_fields(message: dict) -> dict:
+    return {
+        "lastMessage": message["content"][:PREVIEW_LENGTH],
+        "lastMessageAt": message["createdAt"],
+        "lastMessageSenderId": message["senderId"],
+        "lastMessageId": message["_id"],
+    }
+
+
+def update_room_activity(messages: list):
+    """Listener của ingest pipeline: một bulk_write cho cả batch, rồi một room_updated cho mỗi room."""
+    latest = latest_per_room(messages)
+    if not latest:
+        return
+    db = get_mongo_client().Chatapp
+    db.rooms.bulk_write([
+        UpdateOne(
+            {"_id": room_id, "$or": [
+                {"lastMessageAt": {"$lt": message["createdAt"]}},
+                {"lastMessageAt": None},
+            ]},
+            {"$set": activity_fields(message)},
+        )
+        for room_id, message in latest.items()
+    ], ordered=False)
+
+    for room_id, message in latest.items():
+        fields = activity_fields(message)
+        delta = {
+            "roomId": str(room_id),
+            "lastMessage": fields["lastMessage"],
+            "lastMessageAt": fields["lastMessageAt"],
+            "lastMessageSenderId": str(fields["lastMessageSenderId"]),
+            "lastMessageId": str(fields["lastMessageId"]),
+        }
+        broadcast(REDIS_CHANNELS['ROOM_EVENTS'], 'room_updated', delta)
+
+
+def init_room_activity(ingestor):
+    ingestor.add_listener(update_room_activity)
@@ -0,0 +1,151 @@
+"""Gom và hợp nhất sự kiện gửi ra socket theo từng room.
+
+Các sự kiện nhận từ Redis không được emit ngay mà được gom theo room trong
+SOCKET_BATCH_WINDOW_MS. Sự kiện bị thay thế được hợp nhất (trạng thái gõ cuối
+cùng, watermark đọc cao nhất, trạng thái online cuối cùng, ...); hết cửa sổ,
+mỗi room nhận một frame `batch` chứa danh sách [event, data] (hoặc sự kiện gốc
+nếu chỉ có một). Client tách frame `batch` và gọi lại các listener như cũ.
+"""
+import collections
+import threading
+import time
+
+from .fanout import emit_local
+from .helpers.auth.config import settings
+
+
+def _merge_typing(old: dict, new: dict) -> dict:
+    states = {item["userId"]: item["isTyping"] for item in old.get("typing", [])}
+    states.update({item["userId"]: item["isTyping"] for item in new.get("typing", [])})
+    merged = dict(new)
+    merged["typing"] = [{"userId": user_id, "isTyping": is_typing} for user_id, is_typing in states.items()]
+    return merged
+
+
+def _merge_read(old: dict, new: dict) -> dict:
+    # ObjectId tăng theo thời gian tạo nên so sánh chuỗi hex cho biết tin nhắn nào mới hơn
+    return new if str(new.get("messageId", "")) >= str(old.get("messageId", "")) else old
+
+
+def _merge_unread(old: dict, new: dict) -> dict:
+    merged = dict(new)
+    merged["counts"] = {**old.get("counts", {}), **new.get("counts", {})}
+    return merged
+
+
+def _merge_room_updated(old: dict, new: dict) -> dict:
+    return new if new.get("lastMessageAt", 0) >= old.get("lastMessageAt", 0) else old
+
+
+def _replace(old: dict, new: dict) -> dict:
+    return new
+
+
+# event -> (nhóm, hàm tạo khóa hợp nhất từ data, hàm hợp nhất). Sự kiện cùng nhóm và
+# cùng khóa được hợp nhất; sự kiện không có ở đây (vd. new_message) được giữ nguyên.
+COALESCE_RULES = {
+    "typing_status": ("typing", lambda data: data.get("roomId"), _merge_typing),
+    "message_read": ("read", lambda data: data.get("userId"), _merge_read),
+    "user_online": ("presence", lambda data: data.get("user_id"), _replace),
+    "user_offline": ("presence", lambda data: data.get("user_id"), _replace),
+    "unread_updated": ("unread", lambda data: data.get("userId"), _merge_unread),
+    "room_updated": ("room", lambda data: data.get("roomId"), _merge_room_updated),
+}
+
+
+class SocketBatcher:
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = {}  # room -> OrderedDict(khóa -> [event, data])
+        self._seq = 0
+        self.stats = {"events": 0, "coalesced": 0, "frames": 0, "batches": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def emit(self, event: str, data, room: str = None):
+        if not self.enabled:
+            self.stats["events"] += 1
+            self.stats["frames"] += 1
+            emit_local(event, data, room=room)
+            return
+        rule = COALESCE_RULES.get(event)
+        with self._lock:
+            self.stats["events"] += 1
+            queue = self._pending.setdefault(room, collections.OrderedDict())
+            if rule is not None:
+                group, key_of, merge = rule
+                key = (group, key_of(data))
+                current = queue.pop(key, None)
+                if current is not None:
+                    self.stats["coalesced"] += 1
+                    data = merge(current[1], data)
+                # Đưa về cuối để giữ thứ tự so với các sự kiện khác (vd. new_message trước message_read)
+                queue[key] = [event, data]
+            else:
+                self._seq += 1
+                queue[(None, self._seq)] = [event, data]
+            full = len(queue) >= self.max_batch
+        if full:
+            self._flush_room(room)
+
+    def _take(self, room):
+        with self._lock:
+            queue = self._pending.pop(room, None)
+        return list(queue.values()) if queue else []
+
+    def _send(self, room, events: list):
+        if not events:
+            return
+        self.stats["frames"] += 1
+        if len(events) == 1:
+            event, data = events[0]
+            emit_local(event, data, room=room)
+        else:
+            self.stats["batches"] += 1
+            emit_local("batch", events, room=room)
+
+    def _flush_room(self, room):
+        self._send(room, self._take(room))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for room, queue in pending.items():
+            try:
+                self._send(room, list(queue.values()))
+            except Exception as e:
+                print(f"ERROR: Socket batch emit failed for room {room}: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(self.window)
+            self.flush()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["events_per_frame"] = stats["events"] / stats["frames"] if stats["frames"] else 0.0
+        return stats
+
+
+_batcher = None
+
+
+def get_socket_batcher() -> SocketBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = SocketBatcher(
+            window=settings.SOCKET_BATCH_WINDOW_MS / 1000,
+            max_batch=settings.SOCKET_BATCH_MAX_EVENTS,
+        )
+    return _batcher
+
+
+def init_socket_batcher(socketio):
+    batcher = get_socket_batcher()
+    if batcher.enabled:
+        socketio.start_background_task(batcher.run)
+    return batcher
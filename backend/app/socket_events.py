@@ -1,36 +1,68 @@
-from bson import ObjectId
 from flask_socketio import emit, join_room, leave_room
 from flask import request, current_app
 from datetime import datetime
+from bson import ObjectId
 import logging
-import uuid
 import json
 
-from .mongo import get_mongo_client
-from .redis_pubsub import publish_event, subscribe_channel, subscribe_in_background
+from .redis_pubsub import register_channel_handler
+from .fanout import broadcast, emit_local, user_room
 from .constants import REDIS_CHANNELS
+from .helpers import mongo_to_json
+from .message_ingest import ingest_message, public_message, IngestBackpressureError, IngestPendingError
+from .presence import get_presence, publish_user_status
+from .membership import get_membership, NotRoomMemberError
+from .typing_state import get_typing_engine
+from .socket_batcher import get_socket_batcher
+from .rate_limit import get_rate_limiter
+from .helpers.auth.decorators import authenticate_token
+from .metrics import timed_socket_event
+from .read_receipts import mark_message_read
+from .unread import refresh_room
 
 logger = logging.getLogger(__name__)
 
-class SocketStore:
-    def __init__(self):
-        self.online_users = {}
-        self.typing_users = {}
-
 def register_socket_events(socketio):
-    store = SocketStore()
-    subscription_threads = []
-
-    # Handler cho user status events
+    presence = get_presence()
+    typing = get_typing_engine()
+    # Sự kiện từ Redis được gom theo room và gửi theo frame `batch`
+    batcher = get_socket_batcher()
+    # Kiểm tra quyền theo cache thành viên room (không query MongoDB cho mỗi sự kiện)
+    membership = get_membership()
+    # Token bucket theo sid/user cho các sự kiện client gửi lên
+    limiter = get_rate_limiter()
+
+    def session_user(claimed_user_id=None) -> str:
+        """user_id gắn với socket lúc connect, payload không được dùng user_id khác."""
+        user_id = presence.user_of(request.sid)
+        if not user_id or (claimed_user_id and str(claimed_user_id) != user_id):
+            raise NotRoomMemberError(f"Socket {request.sid} is not authorized as user {claimed_user_id}")
+        return user_id
+
+    def reject(e):
+        logger.warning(f"Forbidden socket event: {str(e)}")
+        emit_local('error', {'message': 'Forbidden', 'errorCode': 'FORBIDDEN'}, room=request.sid)
+        return {'status': 'error', 'errorCode': 'FORBIDDEN'}
+
+    def local_recipients(user_ids) -> list:
+        """Các user trong user_ids có socket kết nối vào node này (duyệt tập nhỏ hơn)."""
+        local_users = presence.local_users()
+        if len(user_ids) > len(local_users):
+            return list(set(local_users).intersection(user_ids))
+        return [user_id for user_id in user_ids if presence.local_sids(user_id)]
+
+    # Handler cho user status events: chỉ gửi tới room cá nhân của các liên hệ đang kết nối vào node này
     def handle_redis_user_status(message):
         try:
             event_type = message.get('event')
             event_data = message.get('data')
+            if event_type not in ('user_online', 'user_offline'):
+                return
 
-            if event_type == 'user_online':
-                socketio.emit('user_online', event_data)
-            elif event_type == 'user_offline':
-                socketio.emit('user_offline', event_data)
+            event_data = dict(event_data)
+            recipients = event_data.pop('recipients', [])
+            for user_id in local_recipients(recipients):
+                batcher.emit(event_type, event_data, room=user_room(user_id))
         except Exception as e:
             logger.error(f"Redis user status handling error: {str(e)}")
 
@@ -42,9 +74,13 @@ def register_socket_events(socketio):
             room_id = event_data.get('roomId')
 
             if event_type == 'room_subscribed':
-                socketio.emit('room_subscribed', event_data, room=room_id)
+                batcher.emit('room_subscribed', event_data, room=room_id)
             elif event_type == 'room_unsubscribed':
-                socketio.emit('room_unsubscribed', event_data, room=room_id)
+                batcher.emit('room_unsubscribed', event_data, room=room_id)
+            elif event_type == 'room_updated':
+                # Một sự kiện cho cả room, gửi tới room cá nhân của các thành viên ở node này
+                for user_id in local_recipients(membership.members_of(room_id)):
+                    batcher.emit('room_updated', event_data, room=user_room(user_id))
         except Exception as e:
             logger.error(f"Redis room events handling error: {str(e)}")
 
@@ -56,9 +92,9 @@ def register_socket_events(socketio):
             room_id = event_data.get('roomId')
 
             if event_type == 'new_message':
-                socketio.emit('new_message', event_data, room=room_id)
+                batcher.emit('new_message', event_data, room=room_id)
             elif event_type == 'message_read':
-                socketio.emit('message_read', event_data, room=room_id)
+                batcher.emit('message_read', event_data, room=room_id)
         except Exception as e:
             logger.error(f"Redis message events handling error: {str(e)}")
 
@@ -67,90 +103,82 @@ def register_socket_events(socketio):
         try:
             event_data = message.get('data')
             room_id = event_data.get('roomId')
-            socketio.emit('typing_status', event_data, room=room_id)
+            batcher.emit('typing_status', event_data, room=room_id)
         except Exception as e:
             logger.error(f"Redis typing events handling error: {str(e)}")
 
-    # Subscribe to all channels
-    subscription_threads.extend([
-        subscribe_in_background(REDIS_CHANNELS['USER_STATUS'], handle_redis_user_status, socketio),
-        subscribe_in_background(REDIS_CHANNELS['ROOM_EVENTS'], handle_redis_room_events, socketio),
-        subscribe_in_background(REDIS_CHANNELS['MESSAGE_EVENTS'], handle_redis_message_events, socketio),
-        subscribe_in_background(REDIS_CHANNELS['TYPING_EVENTS'], handle_redis_typing_events, socketio)
-    ])
+    # Handler cho sự kiện gửi riêng tới một user (room cá nhân), hoặc nhiều user (notify_users)
+    def handle_redis_notify_events(message):
+        try:
+            event_type = message.get('event')
+            event_data = message.get('data')
+            users = event_data.get('users')
+            if users is None:
+                batcher.emit(event_type, event_data, room=user_room(event_data.get('userId')))
+                return
+            for user_id, data in users.items():
+                if presence.local_sids(user_id):
+                    batcher.emit(event_type, {**data, 'userId': user_id}, room=user_room(user_id))
+        except Exception as e:
+            logger.error(f"Redis notify events handling error: {str(e)}")
+
+    # Handler cho membership events: socket của user vừa rời room ở node này không nhận tiếp sự kiện của room
+    def handle_redis_membership_events(message):
+        try:
+            event_data = message.get('data')
+            if not event_data.get('removed'):
+                return
+            room_id = event_data['roomId']
+            for user_id in event_data.get('userIds', []):
+                for sid in presence.local_sids(user_id):
+                    socketio.server.leave_room(sid, room_id, namespace='/')
+        except Exception as e:
+            logger.error(f"Redis membership events handling error: {str(e)}")
+
+    # Đăng ký handler vào subscriber dùng chung (một kết nối Pub/Sub cho cả process)
+    register_channel_handler(REDIS_CHANNELS['USER_STATUS'], handle_redis_user_status)
+    register_channel_handler(REDIS_CHANNELS['ROOM_EVENTS'], handle_redis_room_events)
+    register_channel_handler(REDIS_CHANNELS['MESSAGE_EVENTS'], handle_redis_message_events)
+    register_channel_handler(REDIS_CHANNELS['TYPING_EVENTS'], handle_redis_typing_events)
+    register_channel_handler(REDIS_CHANNELS['NOTIFY_EVENTS'], handle_redis_notify_events)
+    register_channel_handler(REDIS_CHANNELS['MEMBERSHIP_EVENTS'], handle_redis_membership_events)
 
     @socketio.on('connect')
-    def handle_connect():
-        db = get_mongo_client().Chatapp
+    @timed_socket_event('connect')
+    def handle_connect(auth=None):
+        # user_id lấy từ JWT (auth.token, hoặc ?token= cho client cũ), không tin user_id client tự khai
+        token = (auth or {}).get('token') if isinstance(auth, dict) else None
+        user, _, error = authenticate_token(token or request.args.get('token'))
+        if error:
+            logger.warning(f"Socket connection rejected: {error}")
+            return False
+
         try:
-            user_id = request.args.get('user_id')
-            print(f"Socket connection attempt from user_id: {user_id}, sid: {request.sid}")
-
-            if not user_id:
-                raise ValueError("user_id is required")
-
-            store.online_users[user_id] = request.sid
-            print(f"User {user_id} connected with socket id {request.sid}")
-            print(f"Current online users: {store.online_users}")
-
-            # Update MongoDB status
-            db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"status": 'online'}}
-            )
-
-            # Publish to Redis
-            success = publish_event(REDIS_CHANNELS['USER_STATUS'], {
-                'event': 'user_online',
-                'data': {
-                    'user_id': user_id,
-                    'timestamp': datetime.now().isoformat()
-                }
-            })
+            user_id = str(user.id)
+
+            # Room cá nhân nhận các sự kiện riêng (unread_updated, ...)
+            join_room(user_room(user_id))
 
-            if success:
-                print(f"Successfully published user_online event for user {user_id}")
-            else:
-                print(f"Failed to publish user_online event for user {user_id}")
+            # Một user có thể có nhiều socket (nhiều tab/thiết bị), chỉ phát online khi là session đầu tiên
+            if presence.add_session(user_id, request.sid):
+                publish_user_status('user_online', user_id)
 
-            logger.info(f'Client connected. User ID: {user_id}')
+            logger.info(f'Client connected. User ID: {user_id}, sid: {request.sid}')
 
         except Exception as e:
             logger.error(f"Connection error: {str(e)}")
             print(f"Connection error: {e}")
 
     @socketio.on('disconnect')
-    def handle_disconnect():
-        db = get_mongo_client().Chatapp
+    @timed_socket_event('disconnect')
+    def handle_disconnect(reason=None):
         try:
-            user_id = None
-            for uid, sid in store.online_users.items():
-                if sid == request.sid:
-                    user_id = uid
-                    break
-
-            if user_id:
-                del store.online_users[user_id]
-
-                # Update MongoDB status
-                db.users.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$set": {"status": 'offline'}}
-                )
-
-                # Publish to Redis
-                success = publish_event(REDIS_CHANNELS['USER_STATUS'], {
-                    'event': 'user_offline',
-                    'data': {
-                        'user_id': user_id,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                })
-
-                if success:
-                    print(f"Successfully published user_offline event for user {user_id}")
-                else:
-                    print(f"Failed to publish user_offline event for user {user_id}")
+            # Tra cứu sid -> user O(1), chỉ phát offline khi session cuối cùng của user đóng
+            user_id, went_offline = presence.remove_session(request.sid)
+            typing.clear_sid(request.sid)
+            limiter.forget_sid(request.sid)
+            if went_offline:
+                publish_user_status('user_offline', user_id)
 
             logger.info(f'Client disconnected. User ID: {user_id}')
 
@@ -159,6 +187,8 @@ def register_socket_events(socketio):
             print(f"Disconnection error: {e}")
 
     @socketio.on('subscribe_room')
+    @timed_socket_event('subscribe_room')
+    @limiter.limit('subscribe_room')
     def handle_subscribe_room(data):
         try:
             room_id = data.get('roomId')
@@ -167,24 +197,24 @@ def register_socket_events(socketio):
             if not room_id or not user_id:
                 raise ValueError("roomId and userId are required")
 
+            user_id = session_user(user_id)
+            membership.require_member(room_id, user_id)
             join_room(room_id)
-            if room_id not in store.typing_users:
-                store.typing_users[room_id] = set()
-
-            success = publish_event(REDIS_CHANNELS['ROOM_EVENTS'], {
-                'event': 'room_subscribed',
-                'data': {
-                    'roomId': room_id,
-                    'userId': user_id,
-                    'timestamp': datetime.now().isoformat()
-                }
+
+            success = broadcast(REDIS_CHANNELS['ROOM_EVENTS'], 'room_subscribed', {
+                'roomId': room_id,
+                'userId': user_id,
+                'timestamp': datetime.now().isoformat()
             })
             logger.info(f"User {user_id} subscribed to room {room_id}")
+        except NotRoomMemberError as e:
+            return reject(e)
         except Exception as e:
             logger.error(f"Room subscription error: {str(e)}")
-            socketio.emit('error', {'message': str(e)}, room=request.sid)
+            emit_local('error', {'message': str(e)}, room=request.sid)
 
     @socketio.on('unsubscribe_room')
+    @timed_socket_event('unsubscribe_room')
     def handle_unsubscribe_room(data):
         try:
             room_id = data.get('roomId')
@@ -193,26 +223,27 @@ def register_socket_events(socketio):
             if not room_id or not user_id:
                 raise ValueError("roomId and userId are required")
 
+            user_id = session_user(user_id)
             leave_room(room_id)
 
-            # Remove user from room's typing users if present
-            if room_id in store.typing_users:
-                store.typing_users[room_id].discard(user_id)
-
-            success = publish_event(REDIS_CHANNELS['ROOM_EVENTS'], {
-                'event': 'room_unsubscribed',
-                'data': {
-                    'roomId': room_id,
-                    'userId': user_id,
-                    'timestamp': datetime.now().isoformat()
-                }
+            # Rời room thì không còn "đang gõ" trong room đó
+            typing.set_typing(room_id, user_id, False)
+
+            success = broadcast(REDIS_CHANNELS['ROOM_EVENTS'], 'room_unsubscribed', {
+                'roomId': room_id,
+                'userId': user_id,
+                'timestamp': datetime.now().isoformat()
             })
             logger.info(f"User {user_id} unsubscribed from room {room_id}")
+        except NotRoomMemberError as e:
+            return reject(e)
         except Exception as e:
             logger.error(f"Room unsubscription error: {str(e)}")
-            socketio.emit('error', {'message': str(e)}, room=request.sid)
+            emit_local('error', {'message': str(e)}, room=request.sid)
 
     @socketio.on('message')
+    @timed_socket_event('message')
+    @limiter.limit('message')
     def handle_message(data):
         try:
             room_id = data.get('roomId')
@@ -221,29 +252,36 @@ def register_socket_events(socketio):
 
             if not all([room_id, sender_id, content]):
                 raise ValueError("roomId, senderId, and content are required")
+            if not ObjectId.is_valid(room_id):
+                raise ValueError("roomId is not a valid id")
 
-            message = {
-                '_id': str(uuid.uuid4()),
-                'roomId': room_id,
-                'senderId': sender_id,
-                'content': content,
-                'createdAt': datetime.now().timestamp(),
-                'readBy': [sender_id],
-            }
-
-            success = publish_event(REDIS_CHANNELS['MESSAGE_EVENTS'], {
-                'event': 'new_message',
-                'data': message
-            })
+            sender_id = session_user(sender_id)
+            membership.require_member(room_id, sender_id)
+
+            # Ghi qua ingest pipeline, new_message được publish sau khi đã lưu xuống MongoDB
+            message = ingest_message(room_id, sender_id, content)
             logger.info(f"Message sent in room {room_id} by user {sender_id}")
+            return {'status': 'ok', 'message': mongo_to_json(public_message(message))}
+        except NotRoomMemberError as e:
+            return reject(e)
+        except IngestBackpressureError as e:
+            logger.warning(f"Message rejected, ingest buffer is full: {str(e)}")
+            emit_local('error', {'message': 'Server is busy, please retry', 'errorCode': 'INGEST_BUSY'}, room=request.sid)
+            return {'status': 'error', 'errorCode': 'INGEST_BUSY'}
+        except IngestPendingError as e:
+            # Client dùng _id để loại trùng khi new_message tới, không gửi lại
+            logger.warning(f"Message ack timed out while persisting: {str(e)}")
+            return {'status': 'pending', 'message': mongo_to_json(public_message(e.message))}
         except Exception as e:
             logger.error(f"Message handling error: {str(e)}")
-            socketio.emit('error', {'message': str(e)}, room=request.sid)
+            emit_local('error', {'message': str(e)}, room=request.sid)
+            return {'status': 'error', 'message': str(e)}
 
     @socketio.on('typing')
+    @timed_socket_event('typing')
+    @limiter.limit('typing')
     def handle_typing(data):
         try:
-            db = get_mongo_client().Chatapp
             room_id = data.get('roomId')
             user_id = data.get('userId')
             is_typing = data.get('isTyping', False)
@@ -251,34 +289,21 @@ def register_socket_events(socketio):
             if not room_id or not user_id:
                 raise ValueError("roomId and userId are required")
 
-            if is_typing:
-                if room_id not in store.typing_users:
-                    store.typing_users[room_id] = set()
-                store.typing_users[room_id].add(user_id)
-            else:
-                if room_id in store.typing_users:
-                    store.typing_users[room_id].discard(user_id)
-
-            db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"typing": is_typing}})
-
-            success = publish_event(REDIS_CHANNELS['TYPING_EVENTS'], {
-                'event': 'typing_status',
-                'data': {
-                    'roomId': room_id,
-                    'userId': user_id,
-                    'isTyping': is_typing,
-                    'timestamp': datetime.now().isoformat()
-                }
-            })
-            logger.info(f"Typing status updated for user {user_id} in room {room_id}")
+            user_id = session_user(user_id)
+            membership.require_member(room_id, user_id)
+            # Chỉ cập nhật trạng thái trong bộ nhớ, typing_status được gom và phát theo tick
+            typing.set_typing(room_id, user_id, bool(is_typing), sid=request.sid)
+        except NotRoomMemberError as e:
+            return reject(e)
         except Exception as e:
             logger.error(f"Typing handling error: {str(e)}")
-            socketio.emit('error', {'message': str(e)}, room=request.sid)
+            emit_local('error', {'message': str(e)}, room=request.sid)
 
     @socketio.on('read_message')
+    @timed_socket_event('read_message')
+    @limiter.limit('read_message')
     def handle_read_message(data):
         try:
-            db = get_mongo_client().Chatapp
             message_id = data.get('messageId')
             user_id = data.get('userId')
             room_id = data.get('roomId')
@@ -286,21 +311,26 @@ def register_socket_events(socketio):
             if not all([message_id, user_id, room_id]):
                 raise ValueError("messageId, userId, and roomId are required")
 
-            db.messages.update_one(
-                {"_id": ObjectId(message_id)},
-                {"$addToSet": {"readBy": user_id}}
-            )
-
-            success = publish_event(REDIS_CHANNELS['MESSAGE_EVENTS'], {
-                'event': 'message_read',
-                'data': {
-                    'messageId': message_id,
-                    'userId': user_id,
-                    'roomId': room_id,
-                    'timestamp': datetime.now().isoformat()
-                }
+            user_id = session_user(user_id)
+            membership.require_member(room_id, user_id)
+
+            # Tiến watermark (room, user) tới tin nhắn này, chỉ phát khi có thay đổi
+            message, advanced = mark_message_read(room_id, user_id, message_id)
+            if not message:
+                raise ValueError("Message not found")
+            if not advanced:
+                return
+
+            refresh_room(room_id, user_id)
+            broadcast(REDIS_CHANNELS['MESSAGE_EVENTS'], 'message_read', {
+                'messageId': message_id,
+                'userId': user_id,
+                'roomId': room_id,
+                'timestamp': datetime.now().isoformat()
             })
             logger.info(f"Message {message_id} read by user {user_id} in room {room_id}")
+        except NotRoomMemberError as e:
+            return reject(e)
         except Exception as e:
             logger.error(f"Read message handling error: {str(e)}")
-            socketio.emit('error', {'message': str(e)}, room=request.sid)
+            emit_local('error', {'message': str(e)}, room=request.sid)
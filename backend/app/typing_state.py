@@ -0,0 +1,142 @@
+"""Trạng thái "đang gõ" tạm thời, chỉ nằm trong bộ nhớ (không ghi MongoDB).
+
+Mỗi cặp (room, user) có thời hạn TYPING_TTL_MS; client gửi lại isTyping=True
+định kỳ để gia hạn, nên client bị crash sẽ tự hết "đang gõ" sau TTL. Các thay
+đổi được gom lại và mỗi tick (TYPING_TICK_MS) chỉ phát một sự kiện
+`typing_status` cho mỗi room có thay đổi:
+
+    {"roomId": ..., "typing": [{"userId": ..., "isTyping": bool}], "ttl": giây}
+
+Bật rồi tắt trong cùng một tick không phát gì cả. Gia hạn khi đang gõ chỉ được phát
+lại (isTyping=True) khi lần phát trước đã cũ hơn TTL/3, để client khác kéo dài thời
+hạn hiển thị trước khi nó hết hạn. Ngưỡng này phải nhỏ hơn hẳn chu kỳ gửi lại của
+client (TTL/2), vì thời điểm phát được ghi ở tick chứ không phải lúc nhận: nếu hai
+giá trị bằng nhau thì lần gia hạn nào cũng có thể bị bỏ qua và client khác thấy
+trạng thái nhấp nháy.
+"""
+import threading
+import time
+
+from .constants import REDIS_CHANNELS
+from .fanout import broadcast
+from .helpers.auth.config import settings
+
+
+class TypingEngine:
+    def __init__(self, ttl: float, tick_interval: float):
+        self.ttl = ttl
+        self.tick_interval = tick_interval
+        self._lock = threading.Lock()
+        self._typing = {}      # room_id -> {user_id: (expires_at, sid)}
+        self._published = {}   # room_id -> set user_id đã phát là đang gõ
+        self._published_at = {}  # (room_id, user_id) -> thời điểm phát isTyping=True gần nhất
+        self._keepalive = {}   # room_id -> set user_id cần phát lại trong tick tới
+        self._dirty = set()
+        self.stats = {"updates": 0, "suppressed": 0, "expired": 0, "published": 0}
+
+    def set_typing(self, room_id: str, user_id: str, is_typing: bool, sid: str = None):
+        with self._lock:
+            self.stats["updates"] += 1
+            users = self._typing.setdefault(room_id, {})
+            if is_typing:
+                now = time.monotonic()
+                was_typing = user_id in users
+                users[user_id] = (now + self.ttl, sid)
+                if was_typing:
+                    published_at = self._published_at.get((room_id, user_id))
+                    if published_at is None or now - published_at < self.ttl / 3:
+                        # Chỉ gia hạn TTL, client khác vẫn còn đủ thời hạn hiển thị
+                        self.stats["suppressed"] += 1
+                        return
+                    self._keepalive.setdefault(room_id, set()).add(user_id)
+            elif users.pop(user_id, None) is None:
+                self.stats["suppressed"] += 1
+                return
+            if not users:
+                self._typing.pop(room_id, None)
+            self._dirty.add(room_id)
+
+    def clear_sid(self, sid: str):
+        """Xóa trạng thái đang gõ được tạo từ socket vừa disconnect."""
+        with self._lock:
+            for room_id, users in list(self._typing.items()):
+                for user_id, (_, owner) in list(users.items()):
+                    if owner == sid:
+                        del users[user_id]
+                        self._dirty.add(room_id)
+                if not users:
+                    del self._typing[room_id]
+
+    def typing_users(self, room_id: str) -> list:
+        with self._lock:
+            return list(self._typing.get(room_id, ()))
+
+    def _expire_locked(self, now: float):
+        for room_id, users in list(self._typing.items()):
+            for user_id, (expires_at, _) in list(users.items()):
+                if expires_at <= now:
+                    del users[user_id]
+                    self.stats["expired"] += 1
+                    self._dirty.add(room_id)
+            if not users:
+                del self._typing[room_id]
+
+    def collect(self) -> list:
+        """Tính các thay đổi từ tick trước, trả về danh sách payload theo room."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire_locked(now)
+            dirty, self._dirty = self._dirty, set()
+            keepalive, self._keepalive = self._keepalive, {}
+            updates = []
+            for room_id in dirty:
+                current = set(self._typing.get(room_id, ()))
+                previous = self._published.get(room_id, set())
+                started = (current - previous) | (keepalive.get(room_id, set()) & current)
+                changes = [{"userId": user_id, "isTyping": True} for user_id in started]
+                changes += [{"userId": user_id, "isTyping": False} for user_id in previous - current]
+                for user_id in started:
+                    self._published_at[(room_id, user_id)] = now
+                for user_id in previous - current:
+                    self._published_at.pop((room_id, user_id), None)
+                if current:
+                    self._published[room_id] = current
+                else:
+                    self._published.pop(room_id, None)
+                if changes:
+                    updates.append({"roomId": room_id, "typing": changes, "ttl": self.ttl})
+            return updates
+
+    def tick(self) -> int:
+        updates = self.collect()
+        for update in updates:
+            broadcast(REDIS_CHANNELS['TYPING_EVENTS'], 'typing_status', update)
+        self.stats["published"] += len(updates)
+        return len(updates)
+
+    def run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"ERROR: Typing state tick failed: {e}")
+            time.sleep(self.tick_interval)
+
+
+_engine = None
+
+
+def get_typing_engine() -> TypingEngine:
+    global _engine
+    if _engine is None:
+        _engine = TypingEngine(
+            ttl=settings.TYPING_TTL_MS / 1000,
+            tick_interval=settings.TYPING_TICK_MS / 1000,
+        )
+    return _engine
+
+
+def init_typing(socketio):
+    engine = get_typing_engine()
+    socketio.start_background_task(engine.run)
+    return engine
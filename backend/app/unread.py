@@ -0,0 +1,177 @@
+"""Bộ đếm tin nhắn chưa đọc theo (room, user), cập nhật tăng dần trong Redis.
+
+- unread:<user_id>  HASH room_id -> số tin chưa đọc (+ trường READY_FIELD khi đã đồng bộ đủ)
+
+Ingest pipeline tăng bộ đếm cho các thành viên khác người gửi, đọc tin nhắn thì
+tính lại bộ đếm của room đó từ watermark. Định kỳ (và bằng lệnh
+`flask unread reconcile`) bộ đếm được đối chiếu lại với MongoDB. Thay đổi được
+đẩy tới room cá nhân của user qua sự kiện `unread_updated`.
+"""
+import time
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+
+from .fanout import notify_user, notify_users
+from .helpers.auth.config import settings
+from .mongo import get_mongo_client
+from .redis import get_redis
+
+UNREAD_KEY = "unread:{}"
+READY_FIELD = "__ready"
+
+
+def _after_watermark(room_id: ObjectId, receipt: dict) -> list:
+    """Điều kiện "sau watermark" của một room (dùng được index roomId, createdAt, _id)."""
+    if not receipt or receipt.get("lastReadAt") is None:
+        return [{"roomId": room_id}]
+    return [
+        {"roomId": room_id, "createdAt": {"$gt": receipt["lastReadAt"]}},
+        {"roomId": room_id, "createdAt": receipt["lastReadAt"], "_id": {"$gt": receipt["lastReadId"]}},
+    ]
+
+
+def count_unread(room_id, user_id, receipt: dict = None) -> int:
+    """Đếm tin nhắn của người khác sau watermark của user (tối đa UNREAD_COUNT_CAP)."""
+    db = get_mongo_client().Chatapp
+    if receipt is None:
+        receipt = db.read_receipts.find_one({"roomId": ObjectId(room_id), "userId": ObjectId(user_id)})
+    query = {"senderId": {"$ne": ObjectId(user_id)}, "$or": _after_watermark(ObjectId(room_id), receipt)}
+    return db.messages.count_documents(query, limit=settings.UNREAD_COUNT_CAP)
+
+
+def count_unread_rooms(user_id, room_ids: list, receipts: dict) -> dict:
+    """Đếm chưa đọc của nhiều room, receipts (room_id ObjectId -> read receipt) đã được đọc sẵn.
+
+    Mỗi room là một count_documents(limit=UNREAD_COUNT_CAP) trên index room_history, nên
+    mỗi room quét tối đa UNREAD_COUNT_CAP tin dù lịch sử dài bao nhiêu. Không gộp thành
+    một $group vì khi đó phải đếm hết mọi tin chưa đọc rồi mới chặn được.
+    """
+    return {
+        str(room_id): count_unread(room_id, user_id, receipts.get(room_id) or {})
+        for room_id in room_ids
+    }
+
+
+def reconcile_user(user_id) -> dict:
+    """Tính lại toàn bộ bộ đếm của user từ MongoDB và ghi đè vào Redis.
+
+    Receipts và danh sách room được đọc một lần; mỗi room thêm một count có chặn trên.
+    """
+    db = get_mongo_client().Chatapp
+    user_oid = ObjectId(user_id)
+    receipts = {receipt["roomId"]: receipt for receipt in db.read_receipts.find({"userId": user_oid})}
+    room_ids = [room["_id"] for room in db.rooms.find({"members": user_oid}, {"_id": 1})]
+    counts = count_unread_rooms(user_id, room_ids, receipts)
+    redis_client = get_redis()
+    if redis_client:
+        key = UNREAD_KEY.format(user_id)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={**counts, READY_FIELD: 1})
+        pipe.execute()
+    return counts
+
+
+def get_unread_counts(user_id) -> dict:
+    """Bộ đếm của mọi room của user. Nếu Redis chưa có dữ liệu thì đồng bộ từ MongoDB."""
+    redis_client = get_redis()
+    if redis_client:
+        try:
+            counts = redis_client.hgetall(UNREAD_KEY.format(user_id))
+            if counts.pop(READY_FIELD, None) is not None:
+                return {room_id: max(int(count), 0) for room_id, count in counts.items()}
+        except Exception as e:
+            print(f"ERROR: Cannot read unread counters for user {user_id}: {e}")
+    return reconcile_user(user_id)
+
+
+def refresh_room(room_id, user_id):
+    """Sau khi user đọc tin nhắn: tính lại bộ đếm của room và đẩy delta."""
+    room_id, user_id = str(room_id), str(user_id)
+    count = count_unread(room_id, user_id)
+    redis_client = get_redis()
+    if redis_client:
+        redis_client.hset(UNREAD_KEY.format(user_id), room_id, count)
+    notify_user(user_id, 'unread_updated', {'counts': {room_id: count}})
+
+
+def increment_unread(messages: list):
+    """Listener của ingest pipeline: tăng bộ đếm cho thành viên (trừ người gửi), một pipeline cho cả batch."""
+    if not messages:
+        return
+    db = get_mongo_client().Chatapp
+    room_ids = list({message["roomId"] for message in messages})
+    members = {
+        room["_id"]: [str(member_id) for member_id in room.get("members", [])]
+        for room in db.rooms.find({"_id": {"$in": room_ids}}, {"members": 1})
+    }
+
+    # (user_id, room_id) -> [reset, số tin mới]; người gửi đã đọc tới tin nhắn của mình nên reset về 0
+    changes = {}
+    for message in messages:
+        room_id, sender_id = str(message["roomId"]), str(message["senderId"])
+        changes[(sender_id, room_id)] = [True, 0]
+        for member_id in members.get(message["roomId"], []):
+            if member_id != sender_id:
+                changes.setdefault((member_id, room_id), [False, 0])[1] += 1
+
+    redis_client = get_redis()
+    if not redis_client:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for (user_id, room_id), (reset, delta) in changes.items():
+        if reset:
+            pipe.hset(UNREAD_KEY.format(user_id), room_id, delta)
+        else:
+            pipe.hincrby(UNREAD_KEY.format(user_id), room_id, delta)
+    results = pipe.execute()
+
+    pushed = {}
+    for ((user_id, room_id), (reset, delta)), result in zip(changes.items(), results):
+        pushed.setdefault(user_id, {}).setdefault('counts', {})[room_id] = delta if reset else result
+    # Một message cho cả batch, mỗi node chỉ emit cho user đang kết nối vào nó
+    notify_users('unread_updated', pushed)
+
+
+def reconcile_loop(presence):
+    """Định kỳ đối chiếu bộ đếm của các user đang kết nối vào node này.
+
+    Mỗi user tốn 2 query + một count có chặn cho mỗi room (xem reconcile_user); các
+    user được rải đều trong khoảng UNREAD_RECONCILE_INTERVAL thay vì dồn thành một đợt
+    query ngay sau khi thức dậy.
+    """
+    while True:
+        users = presence.local_users()
+        if not users:
+            time.sleep(settings.UNREAD_RECONCILE_INTERVAL)
+            continue
+        pause = settings.UNREAD_RECONCILE_INTERVAL / len(users)
+        for user_id in users:
+            time.sleep(pause)
+            try:
+                reconcile_user(user_id)
+            except Exception as e:
+                print(f"ERROR: Unread reconcile failed for user {user_id}: {e}")
+
+
+def init_unread(socketio, ingestor, presence):
+    ingestor.add_listener(increment_unread)
+    if settings.UNREAD_RECONCILE_INTERVAL > 0:
+        socketio.start_background_task(reconcile_loop, presence)
+
+
+unread_cli = AppGroup("unread", help="Quản lý bộ đếm tin nhắn chưa đọc.")
+
+
+@unread_cli.command("reconcile")
+@click.option("--user", "user_id", default=None, help="Chỉ đồng bộ một user.")
+def reconcile_command(user_id):
+    """Tính lại bộ đếm chưa đọc từ MongoDB."""
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = [str(user["_id"]) for user in get_mongo_client().Chatapp.users.find({}, {"_id": 1})]
+    for uid in user_ids:
+        reconcile_user(uid)
+    click.echo(f"Reconciled {len(user_ids)} users.")
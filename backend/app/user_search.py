@@ -0,0 +1,273 @@
+"""Tìm kiếm user theo tên/email.
+
+Mỗi user lưu trường `searchTokens` (các tiền tố đã bỏ dấu của từng từ trong
+name và email) có multikey index, nên mỗi lần gõ phím chỉ là một lookup
+equality trên index. Trường `searchName` (tên đã chuẩn hóa, có index) cho phép
+lấy các user có tên bắt đầu bằng query theo thứ tự của index khi query quá rộng
+(nhiều hơn USER_SEARCH_MAX_CANDIDATES user khớp). Khi bật USER_SEARCH_LOCAL_INDEX, mỗi process giữ thêm
+một index tiền tố trong bộ nhớ, được cập nhật qua kênh Redis user_events.
+"""
+import bisect
+import heapq
+import re
+import threading
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+
+from .constants import REDIS_CHANNELS
+from .helpers import convert_id, mongo_to_json
+from .helpers.auth.config import settings
+from .helpers.pagination import decode_offset_cursor, encode_offset_cursor
+from .helpers.text import edge_ngrams, tokenize, normalize_text, MIN_PREFIX_LENGTH, MAX_PREFIX_LENGTH
+from .mongo import get_mongo_client
+from .redis_pubsub import publish_event, register_channel_handler, wait_subscribed
+
+# Chỉ lấy các trường cần thiết để hiển thị kết quả (không lấy hashed_password)
+SEARCH_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "email": 1,
+    "roles": 1,
+    "created_at": 1,
+}
+
+
+def build_search_tokens(name: str, email: str) -> list:
+    """Tạo danh sách tiền tố dùng cho index searchTokens."""
+    tokens = set()
+    for word in tokenize(name) + tokenize(email):
+        tokens.update(edge_ngrams(word))
+    return sorted(tokens)
+
+
+def build_search_name(name: str) -> str:
+    """Tên đã chuẩn hóa (cùng dạng với query đã chuẩn hóa), dùng cho truy vấn tiền tố theo index."""
+    return " ".join(tokenize(name))
+
+
+def query_terms(query: str) -> list:
+    return [word[:MAX_PREFIX_LENGTH] for word in tokenize(query) if len(word) >= MIN_PREFIX_LENGTH]
+
+
+def _rank_key(user: dict, terms: list, normalized_query: str):
+    """Khóa xếp hạng: khớp nguyên tên > tiền tố của tên > tiền tố các từ > email."""
+    name = normalize_text(user.get("name") or "")
+    email = normalize_text(user.get("email") or "")
+    name_words = tokenize(name)
+    if name == normalized_query:
+        score = 0
+    elif name.startswith(normalized_query):
+        score = 1
+    elif all(any(word.startswith(term) for word in name_words) for term in terms):
+        score = 2
+    elif email.startswith(normalized_query):
+        score = 3
+    else:
+        score = 4
+    return score, len(name), name, str(user["_id"])
+
+
+class UserPrefixIndex:
+    """Index tiền tố trong bộ nhớ: danh sách (word, user_id) đã sắp xếp, tra cứu bằng bisect."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._words = {}
+        self._docs = {}
+        self.ready = False
+
+    def load(self, users):
+        entries, words, docs = [], {}, {}
+        for user in users:
+            user_id = str(user["_id"])
+            user_words = set(tokenize(user.get("name") or "") + tokenize(user.get("email") or ""))
+            entries.extend((word, user_id) for word in user_words)
+            words[user_id] = user_words
+            docs[user_id] = mongo_to_json(convert_id(user))
+        entries.sort()
+        with self._lock:
+            self._entries, self._words, self._docs = entries, words, docs
+            self.ready = True
+
+    def add(self, user: dict):
+        user_id = str(user["_id"])
+        user_words = set(tokenize(user.get("name") or "") + tokenize(user.get("email") or ""))
+        with self._lock:
+            self._remove_locked(user_id)
+            for word in user_words:
+                bisect.insort(self._entries, (word, user_id))
+            self._words[user_id] = user_words
+            self._docs[user_id] = mongo_to_json(convert_id(dict(user)))
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def _remove_locked(self, user_id: str):
+        for word in self._words.pop(user_id, ()):
+            i = bisect.bisect_left(self._entries, (word, user_id))
+            if i < len(self._entries) and self._entries[i] == (word, user_id):
+                del self._entries[i]
+        self._docs.pop(user_id, None)
+
+    def _ids_with_prefix(self, prefix: str) -> set:
+        ids = set()
+        for i in range(bisect.bisect_left(self._entries, (prefix,)), len(self._entries)):
+            word, user_id = self._entries[i]
+            if not word.startswith(prefix):
+                break
+            ids.add(user_id)
+        return ids
+
+    def search(self, terms: list) -> list:
+        with self._lock:
+            matched = None
+            for term in terms:
+                ids = self._ids_with_prefix(term)
+                matched = ids if matched is None else matched & ids
+                if not matched:
+                    return []
+            return [self._docs[user_id] for user_id in matched]
+
+
+_local_index = UserPrefixIndex()
+
+
+def search_users(query: str, cursor: str = None, limit: int = None):
+    """Tìm user, trả về (danh sách user đã xếp hạng, cursor trang kế tiếp)."""
+    normalized_query = " ".join(tokenize(query))
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+
+    page_size = settings.USER_SEARCH_PAGE_SIZE
+    limit = min(limit or page_size, page_size)
+    offset = decode_offset_cursor(cursor, normalized_query) if cursor else 0
+
+    wanted = offset + limit + 1
+
+    def rank_key(user):
+        return _rank_key(user, terms, normalized_query)
+
+    if _local_index.ready:
+        ranked = heapq.nsmallest(wanted, _local_index.search(terms), key=rank_key)
+    else:
+        ranked = _search_db(terms, normalized_query, wanted, rank_key)
+    page = ranked[offset:offset + limit]
+    next_cursor = encode_offset_cursor(offset + limit, normalized_query) if len(ranked) > offset + limit else None
+    return page, next_cursor
+
+
+def _search_db(terms: list, normalized_query: str, wanted: int, rank_key) -> list:
+    """wanted kết quả tốt nhất từ MongoDB, số document đọc luôn có chặn trên.
+
+    Nếu số user khớp không quá USER_SEARCH_MAX_CANDIDATES thì xếp hạng toàn bộ (chính
+    xác). Nếu nhiều hơn (tiền tố ngắn như "ng"), không thể xếp hạng đủ một cursor chưa
+    sắp xếp: lấy trước các user có tên bắt đầu bằng query (tầng tốt nhất của _rank_key)
+    theo thứ tự index searchName, rồi mới lấy thêm từ tập khớp rộng cho đủ trang. Không
+    bao giờ báo lỗi chỉ vì query quá ngắn.
+    """
+    db = get_mongo_client().Chatapp
+    max_candidates = settings.USER_SEARCH_MAX_CANDIDATES
+    candidates = [
+        mongo_to_json(convert_id(user))
+        for user in db.users.find({"searchTokens": {"$all": terms}}, SEARCH_PROJECTION).limit(max_candidates + 1)
+    ]
+    if len(candidates) <= max_candidates:
+        return heapq.nsmallest(wanted, candidates, key=rank_key)
+
+    name_prefix = [
+        mongo_to_json(convert_id(user))
+        for user in db.users.find(
+            {"searchName": {"$regex": f"^{re.escape(normalized_query)}"}},
+            SEARCH_PROJECTION,
+        ).sort("searchName", 1).limit(wanted)
+    ]
+    # Giữ thứ tự của index (không xếp hạng lại) để các trang sau không trùng/bỏ sót kết quả
+    ranked = name_prefix
+    if len(ranked) < wanted:
+        seen = {user["_id"] for user in ranked}
+        rest = [user for user in candidates if user["_id"] not in seen]
+        ranked += heapq.nsmallest(wanted - len(ranked), rest, key=rank_key)
+    return ranked
+
+
+# --- Đồng bộ index trong bộ nhớ giữa các node ---
+
+def publish_user_event(event_type: str, user_id: str):
+    """Thông báo user được tạo/cập nhật để các node cập nhật index tìm kiếm."""
+    return publish_event(REDIS_CHANNELS['USER_EVENTS'], {
+        'event': event_type,
+        'data': {'user_id': str(user_id)},
+    })
+
+
+def handle_user_event(message):
+    try:
+        event_type = message.get('event')
+        user_id = message.get('data', {}).get('user_id')
+        if not user_id:
+            return
+        if event_type == 'user_deleted':
+            _local_index.remove(user_id)
+        elif event_type in ('user_created', 'user_updated'):
+            db = get_mongo_client().Chatapp
+            user = db.users.find_one({"_id": ObjectId(user_id)}, SEARCH_PROJECTION)
+            if user:
+                _local_index.add(user)
+            else:
+                _local_index.remove(user_id)
+    except Exception as e:
+        print(f"ERROR: User search index update failed: {e}")
+
+
+def warm_local_index():
+    if not wait_subscribed(REDIS_CHANNELS['USER_EVENTS'], timeout=30):
+        print("WARN: Warming user search index before subscribing to user events, updates may be missed.")
+    try:
+        db = get_mongo_client().Chatapp
+        _local_index.load(db.users.find({}, SEARCH_PROJECTION))
+        print("User search local index is ready.")
+    except Exception as e:
+        print(f"ERROR: Cannot warm user search index: {e}")
+
+
+def init_user_search(socketio):
+    """Bật index tìm kiếm trong bộ nhớ nếu được cấu hình."""
+    if not settings.USER_SEARCH_LOCAL_INDEX:
+        return
+    # Handler được đăng ký ở đây nhưng chỉ subscribe khi start_subscriber() chạy (cuối
+    # init_services), nên warm-up chờ subscriber sẵn sàng để không bỏ lỡ sự kiện trong lúc load
+    register_channel_handler(REDIS_CHANNELS['USER_EVENTS'], handle_user_event)
+    socketio.start_background_task(warm_local_index)
+
+
+def backfill_search_tokens(batch_size: int = 500) -> int:
+    """Tính lại searchTokens/searchName cho toàn bộ user (dùng sau khi deploy hoặc đổi tokenizer)."""
+    db = get_mongo_client().Chatapp
+    updated = 0
+    ops = []
+    for user in db.users.find({}, {"name": 1, "email": 1}):
+        tokens = build_search_tokens(user.get("name") or "", user.get("email") or "")
+        ops.append(UpdateOne({"_id": user["_id"]}, {"$set": {
+            "searchTokens": tokens,
+            "searchName": build_search_name(user.get("name") or ""),
+        }}))
+        if len(ops) >= batch_size:
+            updated += db.users.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.users.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+users_cli = AppGroup("users", help="Quản lý dữ liệu user.")
+
+
+@users_cli.command("reindex-search")
+def reindex_search_command():
+    """Tính lại searchTokens/searchName cho toàn bộ user."""
+    click.echo(f"Updated {backfill_search_tokens()} users.")
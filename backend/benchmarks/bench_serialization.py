@@ -0,0 +1,161 @@
+"""Benchmark serialize response: mongo_to_json + jsonify (cũ) so với BsonJSONProvider (mới).
+
+Payload giả lập dữ liệu thật:
+
+- room_list:   GET /api/room với nhiều room và dict users dùng chung
+- room_detail: GET /api/room/<id> với một trang tin nhắn (readBy từ watermark)
+- history:     trang tin nhắn lớn (giới hạn tối đa của API)
+
+Không cần MongoDB/Redis:
+
+    python benchmarks/bench_serialization.py --repeat 200 --output results.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.helpers import mongo_to_json  # noqa: E402
+from app.helpers.serialization import BsonJSONProvider, orjson  # noqa: E402
+
+WORDS = "xin chào mọi người hôm nay họp lúc mấy giờ nhé ok mình gửi file rồi".split()
+
+
+def make_user(user_id):
+    return {
+        "_id": user_id,
+        "email": f"user{str(user_id)[-6:]}@example.com",
+        "name": f"Người dùng {str(user_id)[-4:]}",
+        "roles": ["user"],
+        "avartar": "https://api.dicebear.com/9.x/adventurer/svg?seed=Brian",
+        "created_at": datetime(2025, 1, 1) + timedelta(minutes=random.randint(0, 10 ** 5)),
+        "updated_at": datetime(2025, 1, 1),
+        "status": random.choice(["online", "offline"]),
+    }
+
+
+def make_message(room_id, sender_id, readers, created_at):
+    return {
+        "_id": ObjectId(),
+        "roomId": room_id,
+        "senderId": sender_id,
+        "content": " ".join(random.choices(WORDS, k=random.randint(3, 30))),
+        "createdAt": created_at,
+        "readBy": [str(reader) for reader in readers],
+        "readCount": len(readers),
+    }
+
+
+def room_list_payload(rooms=200, users=400, members_per_room=8):
+    user_ids = [ObjectId() for _ in range(users)]
+    room_docs = []
+    for i in range(rooms):
+        members = random.sample(user_ids, members_per_room)
+        room_docs.append({
+            "_id": str(ObjectId()),
+            "name": f"Nhóm {i}",
+            "type": "group",
+            "members": [str(member) for member in members],
+            "lastMessage": " ".join(random.choices(WORDS, k=8)),
+            "lastMessageAt": time.time() - i,
+            "lastMessageSenderId": members[0],
+            "createdAt": datetime(2025, 1, 1),
+            "unreadCount": random.randint(0, 20),
+        })
+    return {"rooms": room_docs, "users": {str(uid): make_user(uid) for uid in user_ids}}
+
+
+def room_detail_payload(messages=50, members=30):
+    room_id = ObjectId()
+    member_ids = [ObjectId() for _ in range(members)]
+    now = time.time()
+    msgs = [
+        make_message(room_id, random.choice(member_ids), random.sample(member_ids, random.randint(1, members)), now - i)
+        for i in range(messages)
+    ]
+    return {
+        "room": {
+            "_id": str(room_id),
+            "name": "Phòng họp",
+            "type": "group",
+            "members": [make_user(member_id) for member_id in member_ids],
+            "createdAt": datetime(2025, 1, 1),
+        },
+        "messages": msgs,
+        "nextCursor": "eyJ0IjoxNzAwMDAwMDAwfQ",
+        "prevCursor": None,
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": sorted(samples)[int(len(samples) * 0.99) - 1] * 1000,
+    }
+
+
+def run(repeat):
+    app = Flask(__name__)
+    legacy = DefaultJSONProvider(app)
+    fast = BsonJSONProvider(app)
+    payloads = {
+        "room_list": room_list_payload(),
+        "room_detail": room_detail_payload(),
+        "history": room_detail_payload(messages=100, members=200),
+    }
+
+    results = {"encoder": "orjson" if orjson is not None else "json", "repeat": repeat, "payloads": {}}
+    with app.app_context():
+        for name, payload in payloads.items():
+            # Kiểm tra hai đường cho cùng nội dung (thứ tự key có thể khác)
+            assert json.loads(legacy.dumps(mongo_to_json(payload))) == json.loads(fast.dumps(payload))
+            old = measure(lambda: legacy.response(mongo_to_json(payload)), repeat)
+            new = measure(lambda: fast.response(payload), repeat)
+            results["payloads"][name] = {
+                "bytes": len(fast.dumps(payload)),
+                "legacy": old,
+                "fast": new,
+                "speedup": old["mean_ms"] / new["mean_ms"],
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = run(args.repeat)
+
+    print(f"encoder: {results['encoder']}, repeat: {results['repeat']}")
+    print(f"{'payload':<12} {'bytes':>9} {'legacy ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for name, row in results["payloads"].items():
+        print(f"{name:<12} {row['bytes']:>9} {row['legacy']['mean_ms']:>10.3f} "
+              f"{row['fast']['mean_ms']:>10.3f} {row['speedup']:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""So sánh hai file kết quả của load_bench.py (vd. commit gốc và commit mới).
+
+    python benchmarks/compare.py results/base.json results/head.json --threshold 10
+
+In thay đổi (%) của throughput, CPU/sự kiện và p50/p99 của ack và độ trễ giao cho
+từng pha. Trả về exit code 1 nếu có chỉ số tệ đi quá --threshold phần trăm.
+"""
+import argparse
+import json
+import sys
+
+# (đường dẫn trong kết quả của một pha, True nếu giá trị càng cao càng tốt)
+METRICS = [
+    (("throughput_per_s",), True),
+    (("cpu_ms_per_event",), False),
+    (("ack", "p50_ms"), False),
+    (("ack", "p99_ms"), False),
+    (("delivery", "p50_ms"), False),
+    (("delivery", "p99_ms"), False),
+]
+
+
+def lookup(row: dict, path: tuple):
+    for key in path:
+        if not isinstance(row, dict):
+            return None
+        row = row.get(key)
+    return row
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """Danh sách (pha, chỉ số, base, head, % thay đổi, có phải regression không)."""
+    rows = []
+    for phase, head_row in head["phases"].items():
+        base_row = base["phases"].get(phase)
+        if base_row is None:
+            continue
+        for path, higher_is_better in METRICS:
+            old, new = lookup(base_row, path), lookup(head_row, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            rows.append((phase, ".".join(path), old, new, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Phần trăm tệ đi được chấp nhận")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    if base["meta"]["params"] != head["meta"]["params"]:
+        print("WARNING: two runs used different parameters, results may not be comparable")
+    print(f"base: {base['meta']['commit']}  head: {head['meta']['commit']}")
+    print(f"{'phase':<15} {'metric':<18} {'base':>10} {'head':>10} {'change':>8}")
+
+    rows = compare(base, head, args.threshold)
+    for phase, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{phase:<15} {metric:<18} {old:>10.2f} {new:>10.2f} {change:>+7.1f}%{flag}")
+
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark fan-out: so sánh đường đi cũ (2 hop Redis) với single-hop.
+
+Chạy đúng code của app: sự kiện được gửi bằng fanout.broadcast (qua RedisPublisher
+gom batch) và mỗi node là một RedisSubscriber riêng (một kết nối Pub/Sub), tất cả
+trong một process:
+
+- legacy: handler của node nhận sự kiện từ kênh của app rồi publish lại lên kênh
+  message queue của Flask-SocketIO (như socketio.emit trước đây); mỗi node lại
+  nhận bản publish đó từ tất cả các node và emit cho client.
+- single-hop: handler emit cục bộ (ignore_queue=True), không publish lại.
+
+Emit tới client được thay bằng việc ghi nhận độ trễ. Kênh dùng tiền tố `bench:`
+nên không ảnh hưởng app đang chạy, nhưng vẫn nên dùng Redis riêng.
+
+    python benchmarks/fanout_benchmark.py --redis-url redis://127.0.0.1:6380/ --nodes 4 --events 2000
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Tasks:
+    """Thay cho socketio.start_background_task khi chạy ngoài app (thread thường)."""
+
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+
+class Node:
+    def __init__(self, mode, app_channel, socketio_channel):
+        from app.redis_pubsub import RedisSubscriber, publish_event
+        from app.helpers.auth.config import settings
+
+        self.mode = mode
+        self.socketio_channel = socketio_channel
+        self.publish_event = publish_event
+        self.subscriber = RedisSubscriber(queue_size=settings.REDIS_SUBSCRIBER_QUEUE_SIZE)
+        self.subscriber.register(app_channel, self._handle_app_event)
+        if mode == "legacy":
+            self.subscriber.register(socketio_channel, self._deliver)
+        self.app_channel = app_channel
+        self.latencies = []
+        self.deliveries = 0
+        self._lock = threading.Lock()
+
+    def start(self, tasks):
+        self.subscriber.start(tasks)
+        return self.subscriber.wait_subscribed(self.app_channel, timeout=5)
+
+    def _handle_app_event(self, message):
+        if self.mode == "legacy":
+            # socketio.emit(...) với message_queue: publish thêm một lần nữa
+            self.publish_event(self.socketio_channel, {"event": message["event"], "data": message["data"], "origin": message["ts"]})
+        else:
+            self._deliver(message)
+
+    def _deliver(self, message):
+        with self._lock:
+            self.deliveries += 1
+            self.latencies.append((time.time() - message.get("origin", message["ts"])) * 1000)
+
+
+def run_mode(mode, nodes, events, rate, tasks):
+    from app.fanout import broadcast
+    from app.redis_pubsub import get_publisher_stats
+
+    app_channel = f"bench:{mode}:message_events"
+    socketio_channel = f"bench:{mode}:flask-socketio"
+    cluster = [Node(mode, app_channel, socketio_channel) for _ in range(nodes)]
+    for node in cluster:
+        if not node.start(tasks):
+            raise SystemExit("Subscriber could not subscribe, is Redis running?")
+
+    published_before = get_publisher_stats()["published"]
+    interval = 1.0 / rate if rate else 0
+    started = time.time()
+    for i in range(events):
+        broadcast(app_channel, "new_message", {"roomId": "bench", "id": i})
+        if interval:
+            time.sleep(interval)
+
+    # Mỗi node có client của riêng nó nên mỗi sự kiện cần đúng `nodes` lần emit tới client
+    expected = events * nodes
+    target = expected * (nodes if mode == "legacy" else 1)
+    deadline = time.time() + 30
+    while sum(node.deliveries for node in cluster) < target and time.time() < deadline:
+        time.sleep(0.05)
+    elapsed = time.time() - started
+    # Số publish được cộng sau khi pipeline trả về, có thể sau khi subscriber đã nhận
+    while get_publisher_stats()["queue_depth"] and time.time() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.1)
+
+    latencies = [lat for node in cluster for lat in node.latencies]
+    deliveries = sum(node.deliveries for node in cluster)
+    publishes = get_publisher_stats()["published"] - published_before
+    received = sum(node.subscriber.stats["received"] for node in cluster)
+    return {
+        "mode": mode,
+        "nodes": nodes,
+        "events": events,
+        "elapsed_s": round(elapsed, 3),
+        "redis_publishes_per_event": round(publishes / events, 3),
+        "redis_messages_out_per_event": round(received / events, 3),
+        "client_emits_per_event": round(deliveries / events, 3),
+        "duplicate_emits_per_event": round((deliveries - expected) / events, 3),
+        "latency_ms_p50": round(percentile(latencies, 50), 3),
+        "latency_ms_p99": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/"))
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=2000, help="Sự kiện/giây (0 = không giới hạn)")
+    parser.add_argument("--output", help="Ghi kết quả dạng JSON ra file")
+    args = parser.parse_args()
+
+    # Settings đọc biến môi trường lúc import nên phải đặt trước khi import app
+    os.environ["REDIS_URL"] = args.redis_url
+    os.environ["METRICS_ENABLED"] = "0"
+    sys.path.insert(0, BACKEND_DIR)
+    from app.redis_pubsub import start_publisher
+
+    tasks = Tasks()
+    start_publisher(tasks)
+    results = [
+        run_mode(mode, args.nodes, args.events, args.rate, tasks)
+        for mode in ("legacy", "single-hop")
+    ]
+    legacy, single = results
+    summary = {
+        "results": results,
+        "redis_publish_reduction": round(1 - single["redis_publishes_per_event"] / legacy["redis_publishes_per_event"], 3),
+        "p50_latency_reduction_ms": round(legacy["latency_ms_p50"] - single["latency_ms_p50"], 3),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+"""Load test end-to-end cho backend chat: socket + REST chạy trong cùng một process.
+
+Khởi động create_app() với MongoDB/Redis local (nên dùng instance riêng cho
+benchmark), tạo user và group giả lập, rồi cho mỗi user một client Socket.IO
+(socketio.test_client) chạy lần lượt các pha:
+
+    connect -> subscribe_room -> message -> typing -> read_message -> rest
+
+Mỗi pha báo cáo số sự kiện, throughput, CPU của process cho mỗi sự kiện
+(process_time của cả pha chia cho số sự kiện), độ trễ ack (emit trả về) và độ
+trễ giao tới các thành viên khác trong room (p50/p99). Kết quả JSON kèm commit
+hiện tại để so sánh giữa các commit bằng compare.py:
+
+    docker run -d -p 27018:27017 mongo:7 && docker run -d -p 6380:6379 redis:7
+    python benchmarks/load_bench.py --mongodb-uri mongodb://127.0.0.1:27018 \\
+        --redis-url redis://127.0.0.1:6380/ --clients 2000 --output results/head.json
+    python benchmarks/compare.py results/base.json results/head.json
+
+Fan-out đi qua kênh Redis của app như khi chạy thật. CPU của mongod/redis không
+được tính. Dữ liệu benchmark (user, room, tin nhắn, key Redis) được xóa sau khi chạy.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+
+from bson import ObjectId  # noqa: E402
+from flask_socketio.test_client import SocketIOTestClient  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+
+class TimedQueue(list):
+    """Hàng đợi của test client, ghi lại thời điểm server gửi từng packet."""
+
+    def append(self, packet):
+        packet["receivedAt"] = time.perf_counter()
+        super().append(packet)
+
+
+class LoadClient(SocketIOTestClient):
+    @property
+    def queue(self):
+        return self._queue
+
+    @queue.setter
+    def queue(self, value):
+        self._queue = TimedQueue(value)
+
+    def drain(self) -> list:
+        """Các sự kiện đã nhận dạng (event, data, receivedAt), tách frame `batch`."""
+        events = []
+        for packet in self.get_received():
+            args = packet["args"]
+            if packet["name"] == "batch":
+                events.extend((event, data, packet["receivedAt"]) for event, data in args[0])
+            else:
+                events.append((packet["name"], args[0] if args else None, packet["receivedAt"]))
+        return events
+
+
+def summarize(samples: list):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": ordered[int(len(ordered) * 0.50)] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+class Phase:
+    """Đo một pha: thời gian, CPU, ack và độ trễ giao sự kiện."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.events = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.acks = []
+        self.deliveries = []
+        self.expected_deliveries = 0
+        self.endpoints = {}
+        self.send_duration = None
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+
+    def sent(self):
+        """Client đã gửi xong: throughput tính tới đây, CPU vẫn tính cả thời gian giao sự kiện."""
+        self.send_duration = time.perf_counter() - self._wall
+
+    def ack(self, started: float, response=None):
+        self.events += 1
+        self.acks.append(time.perf_counter() - started)
+        if isinstance(response, dict) and response.get("status") == "error":
+            if response.get("errorCode") == "RATE_LIMITED":
+                self.rate_limited += 1
+            else:
+                self.errors += 1
+
+    def result(self) -> dict:
+        send_duration = self.send_duration or self.duration
+        result = {
+            "events": self.events,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "duration_s": self.duration,
+            "throughput_per_s": self.events / send_duration if send_duration else 0.0,
+            "cpu_ms_per_event": self.cpu * 1000 / self.events if self.events else None,
+            "ack": summarize(self.acks),
+            "delivery": summarize(self.deliveries),
+        }
+        if self.expected_deliveries:
+            result["delivery_ratio"] = len(self.deliveries) / self.expected_deliveries
+        if self.endpoints:
+            result["endpoints"] = {name: summarize(samples) for name, samples in self.endpoints.items()}
+        return result
+
+
+def run_pool(jobs, concurrency: int):
+    pool = eventlet.GreenPool(concurrency)
+    for job in jobs:
+        pool.spawn_n(job)
+    pool.waitall()
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.check_output(["git", *args], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL).decode().strip()
+        except Exception:
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+class LoadTest:
+    def __init__(self, args):
+        from app import create_app
+        from app.mongo import get_mongo_client
+        from app.redis import get_redis
+
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+        self.socketio, self.app = create_app()
+        # logger=True của app log mọi emit, làm sai lệch số đo CPU
+        self.socketio.server.logger.setLevel(logging.WARNING)
+        self.socketio.server.eio.logger.setLevel(logging.WARNING)
+        self.db = get_mongo_client().Chatapp
+        self.redis = get_redis()
+        self.clients = {}
+        self.tokens = {}  # user_id -> JWT
+        self.user_rooms = {}   # user_id -> [room_id]
+        self.room_members = {}  # room_id -> [user_id]
+        self.last_message = {}  # room_id -> message_id
+
+    # --- Dữ liệu ---
+
+    def seed(self):
+        args = self.args
+        now = datetime.now(timezone.utc)
+        users = [{
+            "_id": ObjectId(),
+            "email": f"bench-{self.run_id}-{i}@bench.local",
+            "name": f"Bench {i}",
+            "hashed_password": "",
+            "roles": ["user"],
+            "created_at": now,
+            "updated_at": now,
+        } for i in range(args.clients)]
+        self.db.users.insert_many(users)
+        user_ids = [user["_id"] for user in users]
+        # Socket xác thực bằng JWT như client thật
+        from app.helpers.auth.services import create_access_token
+        from app.models.user import UserInDB
+        self.tokens = {str(user["_id"]): create_access_token(UserInDB(**user)) for user in users}
+
+        # Mỗi user thuộc rooms_per_user group, mỗi group tối đa room_size thành viên
+        rooms = []
+        for _ in range(args.rooms_per_user):
+            order = user_ids[:]
+            random.shuffle(order)
+            for start in range(0, len(order), args.room_size):
+                rooms.append({
+                    "_id": ObjectId(),
+                    "name": f"bench-{self.run_id}-{len(rooms)}",
+                    "type": "group",
+                    "members": order[start:start + args.room_size],
+                    "createdAt": now,
+                    "lastMessageAt": time.time(),
+                })
+        self.db.rooms.insert_many(rooms)
+
+        for room in rooms:
+            members = [str(member) for member in room["members"]]
+            self.room_members[str(room["_id"])] = members
+            for member in members:
+                self.user_rooms.setdefault(member, []).append(str(room["_id"]))
+
+    def cleanup(self):
+        from app.membership import ROOM_KEY, USER_KEY, GEN_KEY
+        from app.unread import UNREAD_KEY
+
+        room_ids = [ObjectId(room_id) for room_id in self.room_members]
+        user_ids = [ObjectId(user_id) for user_id in self.user_rooms]
+        self.db.messages.delete_many({"roomId": {"$in": room_ids}})
+        self.db.read_receipts.delete_many({"roomId": {"$in": room_ids}})
+        self.db.rooms.delete_many({"_id": {"$in": room_ids}})
+        self.db.users.delete_many({"_id": {"$in": user_ids}})
+        if self.redis:
+            keys = [UNREAD_KEY.format(user_id) for user_id in self.user_rooms]
+            keys += [USER_KEY.format(user_id) for user_id in self.user_rooms]
+            keys += [ROOM_KEY.format(room_id) for room_id in self.room_members]
+            keys += [GEN_KEY.format(key) for key in list(keys)]
+            for start in range(0, len(keys), 1000):
+                self.redis.delete(*keys[start:start + 1000])
+
+    # --- Các pha ---
+
+    def settle(self) -> dict:
+        """Chờ sự kiện bất đồng bộ được giao rồi lấy hết sự kiện của từng client."""
+        time.sleep(self.args.settle)
+        return {user_id: client.drain() for user_id, client in self.clients.items()}
+
+    def phase_connect(self) -> Phase:
+        with Phase("connect") as phase:
+            for user_id in self.user_rooms:
+                started = time.perf_counter()
+                self.clients[user_id] = LoadClient(self.app, self.socketio, auth={"token": self.tokens[user_id]})
+                phase.ack(started)
+            phase.sent()
+            self.settle()
+        return phase
+
+    def phase_subscribe(self) -> Phase:
+        def job(user_id):
+            def run():
+                client = self.clients[user_id]
+                for room_id in self.user_rooms[user_id]:
+                    started = time.perf_counter()
+                    response = client.emit("subscribe_room", {"roomId": room_id, "userId": user_id}, callback=True)
+                    phase.ack(started, response)
+            return run
+
+        with Phase("subscribe_room") as phase:
+            run_pool([job(user_id) for user_id in self.clients], self.args.concurrency)
+            phase.sent()
+            self.settle()
+        return phase
+
+    def phase_message(self) -> Phase:
+        sent = {}  # content -> (thời điểm gửi, sender)
+
+        def job(user_id):
+            def run():
+                client = self.clients[user_id]
+                for seq in range(self.args.messages):
+                    room_id = random.choice(self.user_rooms[user_id])
+                    content = f"bench {self.run_id} {user_id} {seq}"
+                    started = time.perf_counter()
+                    sent[content] = (started, user_id)
+                    response = client.emit("message", {
+                        "roomId": room_id,
+                        "senderId": user_id,
+                        "content": content,
+                    }, callback=True)
+                    phase.ack(started, response)
+                    if isinstance(response, dict) and response.get("status") == "ok":
+                        self.last_message[room_id] = response["message"]["_id"]
+                        phase.expected_deliveries += len(self.room_members[room_id]) - 1
+                    time.sleep(self.args.interval)
+            return run
+
+        with Phase("message") as phase:
+            run_pool([job(user_id) for user_id in self.clients], self.args.concurrency)
+            phase.sent()
+            received = self.settle()
+        for user_id, events in received.items():
+            for event, data, received_at in events:
+                if event != "new_message" or data.get("content") not in sent:
+                    continue
+                started, sender = sent[data["content"]]
+                if sender != user_id:
+                    phase.deliveries.append(received_at - started)
+        return phase
+
+    def phase_typing(self) -> Phase:
+        sent = {}  # (room_id, user_id) -> thời điểm gửi
+
+        def job(user_id):
+            def run():
+                client = self.clients[user_id]
+                room_id = random.choice(self.user_rooms[user_id])
+                started = time.perf_counter()
+                sent[(room_id, user_id)] = started
+                response = client.emit("typing", {"roomId": room_id, "userId": user_id, "isTyping": True}, callback=True)
+                phase.ack(started, response)
+                phase.expected_deliveries += len(self.room_members[room_id]) - 1
+            return run
+
+        with Phase("typing") as phase:
+            run_pool([job(user_id) for user_id in self.clients], self.args.concurrency)
+            phase.sent()
+            received = self.settle()
+        for user_id, events in received.items():
+            first_seen = {}
+            for event, data, received_at in events:
+                if event != "typing_status":
+                    continue
+                for item in data.get("typing", []):
+                    key = (data.get("roomId"), item["userId"])
+                    if item["isTyping"] and key in sent and item["userId"] != user_id:
+                        first_seen.setdefault(key, received_at)
+            phase.deliveries.extend(received_at - sent[key] for key, received_at in first_seen.items())
+        return phase
+
+    def phase_read(self) -> Phase:
+        sent = {}  # (room_id, user_id) -> thời điểm gửi
+
+        def job(user_id):
+            def run():
+                client = self.clients[user_id]
+                for room_id in self.user_rooms[user_id]:
+                    message_id = self.last_message.get(room_id)
+                    if not message_id:
+                        continue
+                    started = time.perf_counter()
+                    sent[(room_id, user_id)] = started
+                    response = client.emit("read_message", {
+                        "messageId": message_id,
+                        "userId": user_id,
+                        "roomId": room_id,
+                    }, callback=True)
+                    phase.ack(started, response)
+            return run
+
+        with Phase("read_message") as phase:
+            run_pool([job(user_id) for user_id in self.clients], self.args.concurrency)
+            phase.sent()
+            received = self.settle()
+        for user_id, events in received.items():
+            for event, data, received_at in events:
+                key = (data.get("roomId"), data.get("userId")) if isinstance(data, dict) else None
+                if event == "message_read" and key in sent and key[1] != user_id:
+                    phase.deliveries.append(received_at - sent[key])
+        return phase
+
+    def phase_rest(self) -> Phase:
+        def timed(phase, name, call):
+            started = time.perf_counter()
+            response = call()
+            phase.events += 1
+            phase.acks.append(time.perf_counter() - started)
+            phase.endpoints.setdefault(name, []).append(phase.acks[-1])
+            if response.status_code >= 400:
+                phase.errors += 1
+
+        def job(user_id):
+            def run():
+                http = self.app.test_client()
+                room_id = random.choice(self.user_rooms[user_id])
+                timed(phase, "GET /api/room", lambda: http.get("/api/room/", query_string={"userId": user_id}))
+                timed(phase, "GET /api/room/<id>", lambda: http.get(f"/api/room/{room_id}", query_string={"limit": 20}))
+                timed(phase, "GET /api/message/search", lambda: http.get(
+                    "/api/message/search", query_string={"userId": user_id, "q": "bench"}))
+                timed(phase, "POST /api/room/<id>/read", lambda: http.post(
+                    f"/api/room/{room_id}/read", json={"userId": user_id}))
+            return run
+
+        users = list(self.clients)[:self.args.rest_users or None]
+        with Phase("rest") as phase:
+            run_pool([job(user_id) for user_id in users], self.args.concurrency)
+        return phase
+
+    def collect_server_stats(self) -> dict:
+        from app.membership import get_membership_stats
+        from app.message_ingest import get_message_ingestor
+        from app.mongo import get_mongo_pool_stats
+        from app.rate_limit import get_rate_limit_stats
+        from app.redis_pubsub import get_publisher_stats, get_subscriber_stats
+        from app.socket_batcher import get_socket_batcher
+        from app.typing_state import get_typing_engine
+
+        return {
+            "mongo_pool": get_mongo_pool_stats(),
+            "publisher": get_publisher_stats(),
+            "subscriber": get_subscriber_stats(),
+            "ingest": dict(get_message_ingestor().stats),
+            "socket_batcher": get_socket_batcher().get_stats(),
+            "typing": dict(get_typing_engine().stats),
+            "membership": get_membership_stats(),
+            "rate_limit": get_rate_limit_stats(),
+        }
+
+    def run(self) -> dict:
+        self.seed()
+        phases = []
+        try:
+            phases.append(self.phase_connect())
+            phases.append(self.phase_subscribe())
+            phases.append(self.phase_message())
+            phases.append(self.phase_typing())
+            phases.append(self.phase_read())
+            phases.append(self.phase_rest())
+            server_stats = self.collect_server_stats()
+        finally:
+            for client in self.clients.values():
+                if client.is_connected():
+                    client.disconnect()
+            self.cleanup()
+
+        return {
+            "meta": {
+                **git_revision(),
+                "run_id": self.run_id,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "params": {key: value for key, value in vars(self.args).items() if key != "output"},
+            },
+            "phases": {phase.name: phase.result() for phase in phases},
+            "server": server_stats,
+        }
+
+
+def print_report(results: dict):
+    meta = results["meta"]
+    print(f"commit: {meta['commit']}{' (dirty)' if meta['dirty'] else ''}, clients: {meta['params']['clients']}")
+    print(f"{'phase':<15} {'events':>8} {'ev/s':>9} {'cpu ms/ev':>10} {'ack p50':>9} {'ack p99':>9} "
+          f"{'dlv p50':>9} {'dlv p99':>9} {'errors':>7} {'limited':>8}")
+    for name, row in results["phases"].items():
+        ack = row["ack"] or {}
+        delivery = row["delivery"] or {}
+
+        def ms(value):
+            return f"{value:.2f}" if value is not None else "-"
+
+        print(f"{name:<15} {row['events']:>8} {row['throughput_per_s']:>9.1f} {ms(row['cpu_ms_per_event']):>10} "
+              f"{ms(ack.get('p50_ms')):>9} {ms(ack.get('p99_ms')):>9} {ms(delivery.get('p50_ms')):>9} "
+              f"{ms(delivery.get('p99_ms')):>9} {row['errors']:>7} {row['rate_limited']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/")
+    parser.add_argument("--clients", type=int, default=1000, help="Số client socket (mỗi client một user)")
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--rooms-per-user", type=int, default=2)
+    parser.add_argument("--messages", type=int, default=5, help="Số tin nhắn mỗi client gửi")
+    parser.add_argument("--interval", type=float, default=0.25, help="Giây giữa hai tin nhắn của một client")
+    parser.add_argument("--concurrency", type=int, default=500, help="Số client chạy đồng thời")
+    parser.add_argument("--rest-users", type=int, default=0, help="Số user gọi REST (0 = tất cả)")
+    parser.add_argument("--settle", type=float, default=1.0, help="Giây chờ sự kiện được giao sau mỗi pha")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Tắt giới hạn tốc độ sự kiện socket")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    # Settings đọc biến môi trường lúc import nên phải đặt trước khi import app
+    os.environ["MONGODB_URI"] = args.mongodb_uri
+    os.environ["REDIS_URL"] = args.redis_url
+    if args.no_rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+    random.seed(args.seed)
+    results = LoadTest(args).run()
+    print_report(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
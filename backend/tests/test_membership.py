@@ -0,0 +1,114 @@
+"""Test cache thành viên room (app/membership.py) với Redis giả lập và collection rooms giả.
+
+Chạy từ thư mục backend: python -m pytest tests
+"""
+import pytest
+from bson import ObjectId
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app import membership  # noqa: E402
+
+
+class FakeRooms:
+    """Đủ cho các truy vấn find() mà MembershipCache dùng, đếm số lần đọc MongoDB."""
+
+    def __init__(self, rooms):
+        self.rooms = rooms
+        self.finds = 0
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        if "members" in query:
+            return [room for room in self.rooms if query["members"] in room["members"]]
+        return [room for room in self.rooms if room["_id"] in query["_id"]["$in"]]
+
+
+class FakeClient:
+    def __init__(self, rooms):
+        self.Chatapp = type("Chatapp", (), {"rooms": rooms})()
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(membership, "get_redis", lambda: client)
+    monkeypatch.setattr(membership, "publish_event", lambda *args, **kwargs: True)
+    return client
+
+
+@pytest.fixture
+def room(monkeypatch):
+    room = {"_id": ObjectId(), "members": [ObjectId(), ObjectId()]}
+    rooms = FakeRooms([room])
+    monkeypatch.setattr(membership, "get_mongo_client", lambda: FakeClient(rooms))
+    room["collection"] = rooms
+    return room
+
+
+def new_cache():
+    return membership.MembershipCache(local_size=100, local_ttl=60, redis_ttl=60)
+
+
+def test_members_loaded_once_then_served_from_redis(redis_client, room):
+    member = room["members"][0]
+    assert new_cache().is_member(room["_id"], member)
+    # Node khác (cache local rỗng) đọc từ Redis, không query MongoDB lần nữa
+    other = new_cache()
+    assert other.is_member(room["_id"], member)
+    assert room["collection"].finds == 1
+    assert other.stats["redis_hits"] == 1
+
+
+def test_require_member_rechecks_shared_tiers_after_local_miss(redis_client, room):
+    cache = new_cache()
+    joined = ObjectId()
+    assert not cache.is_member(room["_id"], joined)
+
+    # Join xử lý ở node khác: Redis đã được xóa nhưng sự kiện invalidation chưa tới node này
+    room["members"].append(joined)
+    redis_client.delete(membership.ROOM_KEY.format(room["_id"]))
+
+    cache.require_member(room["_id"], joined)
+    assert room["collection"].finds == 2
+
+
+def test_require_member_rejects_non_member(redis_client, room):
+    with pytest.raises(membership.NotRoomMemberError):
+        new_cache().require_member(room["_id"], ObjectId())
+
+
+def test_publish_membership_change_invalidates_all_tiers(redis_client, room):
+    cache = membership.get_membership()
+    joined = ObjectId()
+    assert not cache.is_member(room["_id"], joined)
+
+    room["members"].append(joined)
+    membership.publish_membership_change(room["_id"], [joined])
+    assert cache.is_member(room["_id"], joined)
+    assert redis_client.get(membership.GEN_KEY.format(membership.ROOM_KEY.format(room["_id"]))) == "1"
+
+
+def test_redis_store_skips_write_when_generation_changed(redis_client):
+    cache = new_cache()
+    key = membership.ROOM_KEY.format(ObjectId())
+    generations = cache._read_generations(redis_client, [key])
+
+    # Thay đổi membership xảy ra trong lúc đang đọc MongoDB
+    redis_client.incr(membership.GEN_KEY.format(key))
+    cache._redis_store(redis_client, {key: frozenset({"old"})}, generations)
+
+    assert not redis_client.exists(key)
+    assert cache.stats["stale_loads"] == 1
+
+
+def test_redis_store_writes_when_generation_unchanged(redis_client):
+    cache = new_cache()
+    key = membership.ROOM_KEY.format(ObjectId())
+    generations = cache._read_generations(redis_client, [key])
+
+    cache._redis_store(redis_client, {key: frozenset({"a", "b"})}, generations)
+
+    assert redis_client.smembers(key) == {membership.LOADED, "a", "b"}
+    assert 0 < redis_client.ttl(key) <= 60
+    assert cache.stats["stale_loads"] == 0
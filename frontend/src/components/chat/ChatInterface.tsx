@@ -6,11 +6,13 @@ import { ScrollArea } from '@/components/ui/scroll-area'
 import { Send } from 'lucide-react'
 import { useDispatch, useSelector } from 'react-redux'
 import { AppDispatch, RootState } from '@/store/store'
-import { sendMessage } from '@/store/messageSlice'
 import { IUser } from '@/types/User.type'
 import { setFriendList } from '@/store/userSlice'
 import { useDebounce } from '@/hooks/useDebounce'
 
+// TTL/2 của server (TYPING_TTL_MS = 6000); server phát lại khi lần phát trước cũ hơn TTL/3
+const TYPING_REFRESH_MS = 3000
+
 const uniqueById = (arr: IUser[]) => {
 	const map = new Map()
 	arr.forEach((item) => map.set(item._id, item))
@@ -39,9 +41,12 @@ export default function ChatInterface({
 	// Debounce the typing status with 500ms delay
 	const debouncedIsTyping = useDebounce(isLocalTyping, 500)
 
+	const lastTypingPingRef = useRef(0)
+
 	// Watch for changes in debounced typing status
 	useEffect(() => {
 		handleTyping(debouncedIsTyping)
+		lastTypingPingRef.current = Date.now()
 	}, [debouncedIsTyping, handleTyping])
 
 	const messagesEndRef = useRef<HTMLDivElement>(null)
@@ -89,6 +94,15 @@ export default function ChatInterface({
 	const handleInputChange = (e: React.ChangeEvent<HTMLInputElement>) => {
 		setInputValue(e.target.value)
 		setIsLocalTyping(e.target.value.length > 0)
+		// Trạng thái đang gõ có TTL trên server, gửi lại định kỳ khi vẫn đang gõ
+		if (
+			debouncedIsTyping &&
+			e.target.value.length > 0 &&
+			Date.now() - lastTypingPingRef.current > TYPING_REFRESH_MS
+		) {
+			handleTyping(true)
+			lastTypingPingRef.current = Date.now()
+		}
 	}
 
 	// Reset typing status when message is sent
@@ -100,10 +114,9 @@ export default function ChatInterface({
 			senderId: currentUser?._id as string,
 			content: inputValue,
 		}
+		// Tin nhắn được lưu và phát lại qua socket (new_message), không cần gọi thêm REST
 		handleSendMessageToWebsocket(newMessageData)
 
-		dispatch(sendMessage(newMessageData))
-
 		setInputValue('')
 		setIsLocalTyping(false) // Reset typing status
 	}
@@ -26,6 +26,13 @@ import { fetchSelectedRoomData, setSelectedRoomIdOnly } from '@/store/roomSlice'
 import { logout } from '@/store/userSlice'
 import { IUser } from '@/types/User.type'
 
+const UnreadBadge = ({ count }: { count?: number }) =>
+	count ? (
+		<span className="ml-2 min-w-5 h-5 px-1.5 flex items-center justify-center rounded-full bg-primary text-[10px] font-bold text-primary-foreground">
+			{count > 99 ? '99+' : count}
+		</span>
+	) : null
+
 export default function UserSidebar({
 	handleSubcribeToRoom,
 }: {
@@ -199,6 +206,11 @@ export default function UserSidebar({
 																			)[0]
 																	}
 																</span>
+																<UnreadBadge
+																	count={
+																		contact.unreadCount
+																	}
+																/>
 															</div>
 															<p className="text-xs text-muted-foreground truncate">
 																{contact?.lastMessage ||
@@ -266,6 +278,11 @@ export default function UserSidebar({
 																<span className="font-medium truncate">
 																	{group.name}
 																</span>
+																<UnreadBadge
+																	count={
+																		group.unreadCount
+																	}
+																/>
 															</div>
 															<p className="text-xs text-muted-foreground truncate">
 																{
@@ -54,8 +54,8 @@ export function AddContactDialog({
 					params: { q: searchQuery },
 				},
 			)
-			setSearchResults(results.data)
-			if (results.data.length === 0) {
+			setSearchResults(results.data.users)
+			if (results.data.users.length === 0) {
 				setStatus('error')
 				setStatusMessage('No users found. Try a different search term.')
 			}
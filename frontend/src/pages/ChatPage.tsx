@@ -1,7 +1,12 @@
 import ChatInterface from '@/components/chat/ChatInterface'
 import UserSidebar from '@/components/chat/ChatSidebar'
 import { SidebarProvider } from '@/components/ui/sidebar'
-import { addMessage, updateMessageReadStatus } from '@/store/roomSlice'
+import {
+	addMessage,
+	roomUpdated,
+	setUnreadCounts,
+	updateMessageReadStatus,
+} from '@/store/roomSlice'
 import { AppDispatch, RootState } from '@/store/store'
 import { changeUserStatus } from '@/store/roomSlice'
 import { IMessage } from '@/types/Message.type'
@@ -19,7 +24,8 @@ export default function Home() {
 
 	const socketRef = useRef<typeof Socket | undefined>(undefined)
 	const [isConnected, setIsConnected] = useState(false)
-	const [isTyping, setIsTyping] = useState(false)
+	// userId -> thời điểm hết hạn trạng thái đang gõ (ms)
+	const [typingUsers, setTypingUsers] = useState<Record<string, number>>({})
 
 	useEffect(() => {
 		if (user) {
@@ -27,7 +33,8 @@ export default function Home() {
 
 			// Tạo socket connection với explicit namespace
 			socketRef.current = io('http://localhost:5000/', {
-				query: { user_id: user._id },
+				// Server lấy user từ JWT, không tin user_id do client gửi
+				auth: { token: localStorage.getItem('token') },
 				transports: ['websocket'],
 				reconnection: true,
 			})
@@ -40,6 +47,15 @@ export default function Home() {
 				setIsConnected(true)
 			})
 
+			// Server gom nhiều sự kiện vào một frame `batch`: [[event, data], ...]
+			socketRef.current.on('batch', (events: [string, unknown][]) => {
+				events.forEach(([event, data]) => {
+					socketRef.current
+						?.listeners(event)
+						.forEach((listener) => listener(data))
+				})
+			})
+
 			socketRef.current.on('user_online', (data) => {
 				console.log('Received user_online event:', data)
 				if (data.user_id !== user._id) {
@@ -95,15 +111,41 @@ export default function Home() {
 				'typing_status',
 				(data: {
 					roomId: string
-					userId: string
-					isTyping: boolean
+					typing: { userId: string; isTyping: boolean }[]
+					ttl: number
+				}) => {
+					if (data.roomId !== currentRoomId) return
+					setTypingUsers((prev) => {
+						const next = { ...prev }
+						data.typing.forEach(({ userId, isTyping }) => {
+							if (userId === user._id) return
+							if (isTyping) {
+								next[userId] = Date.now() + data.ttl * 1000
+							} else {
+								delete next[userId]
+							}
+						})
+						return next
+					})
+				},
+			)
+
+			socketRef.current?.on(
+				'room_updated',
+				(data: {
+					roomId: string
+					lastMessage: string
+					lastMessageAt: number
+					lastMessageSenderId: string
 				}) => {
-					if (
-						data.roomId === currentRoomId &&
-						data.userId !== user._id
-					) {
-						setIsTyping(data.isTyping)
-					}
+					dispatch(roomUpdated(data))
+				},
+			)
+
+			socketRef.current?.on(
+				'unread_updated',
+				(data: { userId: string; counts: Record<string, number> }) => {
+					dispatch(setUnreadCounts({ counts: data.counts }))
 				},
 			)
 
@@ -128,6 +170,28 @@ export default function Home() {
 		}
 	}, [currentRoomId, dispatch, user])
 
+	// Đổi room thì bỏ trạng thái đang gõ của room cũ
+	useEffect(() => {
+		setTypingUsers({})
+	}, [currentRoomId])
+
+	// Server gửi kèm ttl, tự bỏ các user đã hết hạn nếu không nhận được isTyping=false
+	useEffect(() => {
+		const timer = setInterval(() => {
+			setTypingUsers((prev) => {
+				const now = Date.now()
+				const expired = Object.keys(prev).filter((id) => prev[id] <= now)
+				if (expired.length === 0) return prev
+				const next = { ...prev }
+				expired.forEach((id) => delete next[id])
+				return next
+			})
+		}, 1000)
+		return () => clearInterval(timer)
+	}, [])
+
+	const isTyping = Object.keys(typingUsers).length > 0
+
 	const handleSendMessageToWebsocket = (data: {
 		roomId: string
 		senderId: string
@@ -76,9 +76,18 @@ export const fetchUserRoomsAndSelectFirst = createAsyncThunk(
 	async (payload: { userId: string }, thunkAPI) => {
 		try {
 			console.log('Fetching user rooms...')
-			const rooms = await axios(`http://127.0.0.1:5000/api/room`, {
+			const data = await axios(`http://127.0.0.1:5000/api/room`, {
 				params: { userId: payload.userId },
 			}).then((response) => response.data)
+			// Backend trả về members dạng id + dict users dùng chung giữa các phòng
+			const rooms: IRoom[] = data.rooms.map(
+				(room: Omit<IRoom, 'members'> & { members: string[] }) => ({
+					...room,
+					members: room.members
+						.map((memberId) => data.users[memberId])
+						.filter(Boolean),
+				}),
+			)
 			console.log('Fetched rooms:', rooms)
 
 			// Nếu có phòng và danh sách không rỗng
@@ -195,6 +204,42 @@ const roomSlice = createSlice({
 			})
 		},
 
+		// Delta hoạt động của room do server đẩy qua socket (room_updated)
+		roomUpdated: (
+			state,
+			action: PayloadAction<{
+				roomId: string
+				lastMessage: string
+				lastMessageAt: number
+				lastMessageSenderId: string
+			}>,
+		) => {
+			const { roomId, lastMessage, lastMessageAt, lastMessageSenderId } =
+				action.payload
+			const room = state.roomList.find((room) => room._id === roomId)
+			// Bỏ qua delta cũ hơn dữ liệu đang có
+			if (!room || (room.lastMessageAt ?? 0) > lastMessageAt) return
+			room.lastMessage = lastMessage
+			room.lastMessageAt = lastMessageAt
+			room.lastMessageSenderId = lastMessageSenderId
+			state.roomList.sort(
+				(a, b) => (b.lastMessageAt ?? 0) - (a.lastMessageAt ?? 0),
+			)
+		},
+
+		// Delta bộ đếm chưa đọc do server đẩy qua socket (unread_updated)
+		setUnreadCounts: (
+			state,
+			action: PayloadAction<{ counts: Record<string, number> }>,
+		) => {
+			const { counts } = action.payload
+			state.roomList.forEach((room) => {
+				if (room._id in counts) {
+					room.unreadCount = counts[room._id]
+				}
+			})
+		},
+
 		updateMessageReadStatus: (
 			state,
 			action: PayloadAction<{
@@ -204,11 +249,18 @@ const roomSlice = createSlice({
 			}>,
 		) => {
 			const { roomId, messageId, userId } = action.payload
-			const message = state.currentRoomMessages.find(
+			// Đã đọc theo watermark: mọi tin nhắn tới messageId đều được tính là đã đọc
+			const index = state.currentRoomMessages.findIndex(
 				(msg) => msg._id === messageId,
 			)
-			if (message && !message.readBy.includes(userId)) {
-				message.readBy.push(userId)
+			if (index === -1) return
+			for (let i = 0; i <= index; i++) {
+				const message = state.currentRoomMessages[i]
+				if (message.roomId !== roomId) continue
+				if (!message.readBy.includes(userId)) {
+					message.readBy.push(userId)
+					message.readCount = message.readBy.length
+				}
 			}
 		},
 	},
@@ -319,6 +371,8 @@ export const {
 	setSelectedRoomIdOnly,
 	addMessage,
 	updateMessageReadStatus,
+	setUnreadCounts,
+	roomUpdated,
 	resetRoomState,
 	changeUserStatus,
 } = roomSlice.actions
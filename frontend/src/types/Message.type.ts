@@ -4,5 +4,6 @@ export interface IMessage {
 	senderId: string
 	content: string
 	readBy: string[]
+	readCount?: number
 	createdAt: number
 }
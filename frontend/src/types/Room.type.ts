@@ -4,6 +4,9 @@ export interface IRoom {
 	_id: string
 	name: string
 	lastMessage: string
+	lastMessageAt?: number
+	lastMessageSenderId?: string
+	unreadCount?: number
 	members: IUser[]
 	type: 'private' | 'group'
 	createdAt: string